@@ -25,7 +25,8 @@ __license__ = """
 
 
 from ._cache import no_cache, inf_cache, lfu_cache, \
-                    lru_cache, mru_cache, rr_cache
+                    lru_cache, mru_cache, rr_cache, gdsf_cache, \
+                    vectorized_cache, nearest_cache, autosize
 from ._inspect import signature, isvalid, validate, \
                       keygen, strip_markup, NULL, _keygen
 from . import rounding
@@ -34,6 +35,8 @@ from . import archives
 from . import keymaps
 from . import tools
 from . import crypto
+from . import simulate
+from . import metrics
 
 
 def license():
@@ -7,9 +7,11 @@
 """
 custom caching dict, which archives results to memory, file, or database
 """
-from __future__ import absolute_import
+from __future__ import absolute_import, with_statement
 import os
+import re
 import sys
+import time
 import shutil
 from random import random
 from pickle import PROTO, STOP
@@ -25,6 +27,11 @@ try:
   __alchemy = True
 except ImportError:
   __alchemy = False
+try:
+  import fcntl
+except ImportError: # not available on windows
+  fcntl = None
+import threading
 import dill
 from dill.source import getimportable
 from pox import mkdir, rmtree, walk
@@ -36,7 +43,150 @@ __all__ = ['cache','dict_archive','null_archive','dir_archive',\
 
 PREFIX = "K_"  # hash needs to be importable
 TEMP = "I_"    # indicates 'temporary' file
+LOCK = ".lock" # indicates 'lock' file
 #DEAD = "D_"    # indicates 'deleted' key
+STALE = 3600   # age (in seconds) when an orphaned 'temporary' file is removed
+SYNC = (None, 'none', 'data', 'full') # levels of flushing writes to disk
+_temporary = re.compile('^(%s)?%s[0-9a-f]{32}$' % (PREFIX, TEMP))
+
+
+def _fsync(path, data=False):
+    """flush a file (or directory) to disk
+
+    If data is True, only flush the file contents (not all the metadata)
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError: # can't open directories on some platforms
+        if os.path.isdir(path): return
+        raise
+    try:
+        if data and hasattr(os, 'fdatasync'): os.fdatasync(fd)
+        else: os.fsync(fd)
+    finally:
+        os.close(fd)
+    return
+
+def _replace(src, dst):
+    "rename src to dst, replacing an existing file dst atomically (if allowed)"
+    replace = getattr(os, 'replace', None) # python 3.3+
+    if replace is not None:
+        return replace(src, dst)
+    if sys.platform[:3] == 'win' and os.path.exists(dst):
+        os.remove(dst) #XXX: not atomic on windows with python 2.x
+    return os.rename(src, dst)
+
+def _sync(sync):
+    "check the given level of flushing writes to disk"
+    if sync not in SYNC:
+        raise ValueError("fsync must be one of %s" % str(SYNC))
+    return None if sync == 'none' else sync
+
+
+class _lockfile(object):
+    """advisory reader/writer lock, and change counter, held on a lock file
+
+    Shared (reader) and exclusive (writer) locks are taken with fcntl.flock,
+    and are reentrant within a process. A shared lock is upgraded when an
+    exclusive lock is requested while held. Within a process, all locks are
+    serialized with a RLock. The lock file holds a counter, which is
+    incremented each time an exclusive lock is released.  If fcntl is not
+    available, only the threads of the current process are locked.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._rlock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+        return
+    def acquire(self, shared=False):
+        "acquire the lock; if shared is False, acquire an exclusive lock"
+        self._rlock.acquire()
+        try:
+            if not self._depth:
+                self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT)
+                self._exclusive = False
+            if not shared and not self._exclusive: # acquire or upgrade
+                if fcntl is not None: fcntl.flock(self._fd, fcntl.LOCK_EX)
+                self._exclusive = True
+            elif not self._depth:
+                if fcntl is not None: fcntl.flock(self._fd, fcntl.LOCK_SH)
+        except:
+            if not self._depth and self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._rlock.release()
+            raise
+        self._depth += 1
+        return
+    def release(self):
+        "release the lock; when an exclusive lock is freed, count a change"
+        try:
+            self._depth -= 1
+            if self._depth: return
+            try:
+                if self._exclusive:
+                    self._write(self._read() + 1)
+            finally:
+                if fcntl is not None: fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+                self._exclusive = False
+        finally:
+            self._rlock.release()
+        return
+    def _read(self):
+        "read the change counter from the (locked) lock file"
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        count = os.read(self._fd, 32).strip()
+        return int(count) if count else 0
+    def _write(self, count):
+        "write the change counter to the (locked) lock file"
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, str(count).encode())
+        os.ftruncate(self._fd, len(str(count)))
+        return
+    def count(self):
+        "get the number of changes recorded in the lock file"
+        self.acquire(shared=True)
+        try:
+            return self._read()
+        finally:
+            self.release()
+    def __call__(self, shared=False):
+        "get a context manager for the lock"
+        return _locked(self, shared)
+    pass
+
+
+class _locked(object):
+    """context manager for a held _lockfile"""
+    def __init__(self, lock=None, shared=False):
+        self.lock = lock
+        self.shared = shared
+    def __enter__(self):
+        if self.lock is not None: self.lock.acquire(self.shared)
+        return self
+    def __exit__(self, *exc):
+        if self.lock is not None: self.lock.release()
+        return False
+    pass
+
+_unlocked = _locked() # does not lock
+_locks = {} # all lock files used in this process
+_mutex = threading.Lock()
+
+def _lock(filename):
+    "get the (unique within a process) _lockfile for the given file"
+    filename = os.path.abspath(filename)
+    _mutex.acquire()
+    try:
+        lock = _locks.get(filename, None)
+        if lock is None: lock = _locks[filename] = _lockfile(filename)
+        return lock
+    finally:
+        _mutex.release()
 
 
 class cache(dict):
@@ -50,7 +200,10 @@ class cache(dict):
         self.__swap__ = null_archive()
         self.__archive__ = kwds.pop('archive', null_archive())
         dict.__init__(self, *args, **kwds)
-       #self.__state__ = {}
+        self.__state__ = {
+            'changes': None, # archive change count when last synchronized
+            'observers': [] # objects notified of each load and dump
+        }
         return
     def __repr__(self):
         archive = self.archive.__class__.__name__
@@ -64,13 +217,20 @@ class cache(dict):
 
     If arguments are given, only load the specified keys
         """
+        observers = self.__state__.get('observers')
         if not args:
-            self.update(self.archive.__asdict__())
+            changes = self.__changes()
+            memo = self.archive.__asdict__()
+            self.update(memo)
+            self.__state__['changes'] = changes
+            if observers:
+                for arg in memo: self.__notify('on_load', arg)
         for arg in args:
             try:
                 self.update({arg:self.archive[arg]})
             except KeyError:
-                pass
+                continue
+            if observers: self.__notify('on_load', arg)
         return
     def dump(self, *args): #FIXME: archive may use key 'encoding' (dir_archive)
         """dump contents to archive
@@ -79,10 +239,43 @@ class cache(dict):
         """
         if not args:
             self.archive.update(self)
-        for arg in args:
-            if arg in self:
-                self.archive.update({arg:self.__getitem__(arg)})
+            count = len(self)
+        else:
+            memo = dict((arg,self.__getitem__(arg)) for arg in args if arg in self)
+            if memo: self.archive.update(memo) # dump in a single batch
+            count = len(memo)
+        self.__state__['changes'] = self.__changes()
+        if count and self.__state__.get('observers'):
+            self.__notify('on_dump', count)
         return
+    def observe(self, observer, on=True):
+        """notify the observer of each load and dump, or stop if not on
+
+    The observer may have the methods on_load(key), called for each key loaded
+    from the archive, and on_dump(count), called with the number of entries
+    dumped to the archive.
+        """
+        observers = self.__state__.setdefault('observers', [])
+        if observer in observers: observers.remove(observer)
+        if on: observers.append(observer)
+        return
+    def __notify(self, event, *args):
+        "call the method for the event (if it exists) on each of the observers"
+        for observer in self.__state__['observers']:
+            method = getattr(observer, event, None)
+            if method is not None: method(*args)
+    def stale(self):
+        """check if the archive has changed since the cache was last synchronized
+
+    The archive is synchronized by load (of all keys), dump, or sync. Changes
+    are only counted by archives with locking enabled, otherwise returns False.
+        """
+        changes = self.__changes()
+        return changes is not None and changes != self.__state__['changes']
+    def __changes(self):
+        "get the count of changes to the archive (None if not counted)"
+        changes = getattr(self.archive, '__changes__', None)
+        return None if changes is None else changes()
     def archived(self, *on):
         """check if the cache is archived, or toggle archiving
 
@@ -245,8 +438,16 @@ class dir_archive(dict):
         serialized: if True, pickle file contents; otherwise save python objects
         compression: compression level (0 to 9) [default: 0 (no compression)]
         permissions: octal representing read/write permissions [default: 0o775]
+        codec: name of the compressor, one of _pickle.codecs() [default: 'zlib']
         memmode: access mode for files, one of {None, 'r+', 'r', 'w+', 'c'}
         memsize: approximate size (in MB) of cache for in-memory compression
+        workers: number of threads used to write entries in update [default: 1]
+        fsync: flush writes to disk, one of {None, 'data', 'full'} [default: None]
+        locked: if True, use a lock file to coordinate access between processes
+
+    With compression, and memmode 'r' or 'c', arrays (stored as whole rows)
+    are read lazily, so are returned as read-only ZArrays (see klepto._pickle)
+    instead of numpy arrays; use numpy.asarray to get a numpy array.
         """
         #XXX: if compression or mode is given, use joblib-style pickling
         #     (ignoring 'serialized'); else if serialized, use dill unless
@@ -263,8 +464,12 @@ class dir_archive(dict):
             'serialized': serialized,
             'compression': compression,
             'permissions': permissions,
+            'codec': kwds.get('codec', None),
             'memmode': kwds.get('memmode', None),
-            'memsize': kwds.get('memsize', 100), # unused?
+            'memsize': kwds.get('memsize', 100),
+            'workers': kwds.get('workers', None),
+            'fsync': _sync(kwds.get('fsync', None)),
+            'locked': kwds.get('locked', False),
             'root': dirname
         }
         # if not serialized, then set fast=False
@@ -280,6 +485,7 @@ class dir_archive(dict):
             self.__state__['root'] = mkdir(dirname, mode=self.__state__['permissions'])
         except OSError: # then directory already exists
             self.__state__['root'] = os.path.abspath(dirname)
+        self._recover()
         return
     def __reduce__(self):
         dirname = self.name
@@ -333,7 +539,17 @@ class dir_archive(dict):
         return
     __setitem__.__doc__ = dict.__setitem__.__doc__
     def clear(self):
-        rmtree(self.__state__['root'], self=False, ignore_errors=True)
+        if not self.__state__['locked']:
+            rmtree(self.__state__['root'], self=False, ignore_errors=True)
+            return
+        root = self.__state__['root']
+        with self.__lock__():
+            for name in os.listdir(root): # keep the lock file
+                name = os.path.join(root, name)
+                if os.path.isdir(name):
+                    rmtree(name, self=True, ignore_errors=True)
+                elif not name.endswith(LOCK):
+                    os.remove(name)
         return
     clear.__doc__ = dict.clear.__doc__
     def copy(self, name=None): #XXX: always None? or allow other settings?
@@ -428,6 +644,10 @@ class dir_archive(dict):
         if hasattr(adict,'__asdict__'): adict = adict.__asdict__()
         memo = {}
         memo.update(adict, **kwds) #XXX: could be better ?
+        workers = self.__state__['workers']
+        if workers and workers > 1 and len(memo) > 1:
+            self._pstore(list(memo.items()), workers)
+            return
         for (key,val) in memo.items():
             self.__setitem__(key,val)
         return
@@ -435,6 +655,35 @@ class dir_archive(dict):
     def __len__(self):
         return len(self._lsdir())
 
+    def _pstore(self, items, workers):
+        """store a list of (key, value) in parallel, with a pool of threads
+
+    Writes are submitted in order, and results are collected in order. All
+    writes are attempted; if any fail, the error is raised after the pool
+    completes. If more than one fails, a RuntimeError is raised, where the
+    'errors' attribute holds a list of the failed (key, error).
+        """
+        from multiprocessing.pool import ThreadPool
+        def store(item):
+            try:
+                self._store(item[0], item[1], input=False)
+            except Exception: #XXX: should only catch the appropriate errors?
+                return item[0], sys.exc_info()[1]
+            return item[0], None
+        pool = ThreadPool(min(workers, len(items)))
+        try:
+            errors = [(k,e) for (k,e) in pool.imap(store, items) if e is not None]
+        finally:
+            pool.close()
+            pool.join()
+        if len(errors) == 1:
+            raise errors[0][1]
+        if errors:
+            error = RuntimeError("failed to store %s of %s keys: %s" % (len(errors), len(items), [k for (k,e) in errors]))
+            error.errors = errors
+            raise error
+        return
+
     def _fname(self, key):
         "generate suitable filename for a given key"
         # special handling for pickles; enable non-strings (however 1=='1')
@@ -459,7 +708,8 @@ class dir_archive(dict):
 
     def _rmdir(self, key):
         "remove results subdirectory corresponding to given key"
-        rmtree(self._getdir(key), self=True, ignore_errors=True)
+        with self.__lock__():
+            rmtree(self._getdir(key), self=True, ignore_errors=True)
         return
     def _lsdir(self):
         "get a list of subdirectories in the root directory"
@@ -491,53 +741,103 @@ class dir_archive(dict):
         return key
     def _lookup(self, key, input=False):
         "get input or output from subdirectory name"
-        _dir = self._getdir(key)
-        if self.__state__['serialized']:
-            _file = self._args if input else self._file
-            _file = os.path.join(_dir, _file)
-            try:
-                if self.__state__['fast']: #XXX: enable override of 'mode' ?
-                    memo = _pickle.load(_file, mmap_mode=self.__state__['memmode'])
-                else:
-                    f = open(_file, 'rb')
-                    memo = dill.load(f)
-                    f.close()
-            except: #XXX: should only catch the appropriate exceptions
-                memo = None
-                raise KeyError(key)
-               #raise OSError("error reading directory for '%s'" % key)
-        else:
-            import tempfile
-            base = os.path.basename(_dir) #XXX: PREFIX+key
-            root = os.path.realpath(self.__state__['root'])
-            name = tempfile.mktemp(prefix="_____", dir="").replace("-","_")
-            _arg = ".__args__" if input else ""
-            string = "from %s%s import memo as %s; sys.modules.pop('%s')" % (base, _arg, name, base)
+        with self.__lock__(shared=True):
+            _dir = self._getdir(key)
+            if self.__state__['serialized']:
+                _file = self._args if input else self._file
+                _file = os.path.join(_dir, _file)
+                try:
+                    if self.__state__['fast']: #XXX: enable override of 'mode' ?
+                        memo = _pickle.load(_file, mmap_mode=self.__state__['memmode'])
+                    else:
+                        f = open(_file, 'rb')
+                        memo = dill.load(f)
+                        f.close()
+                except: #XXX: should only catch the appropriate exceptions
+                    memo = None
+                    raise KeyError(key)
+                   #raise OSError("error reading directory for '%s'" % key)
+            else:
+                import tempfile
+                base = os.path.basename(_dir) #XXX: PREFIX+key
+                root = os.path.realpath(self.__state__['root'])
+                name = tempfile.mktemp(prefix="_____", dir="").replace("-","_")
+                _arg = ".__args__" if input else ""
+                string = "from %s%s import memo as %s; sys.modules.pop('%s')" % (base, _arg, name, base)
+                try:
+                    sys.path.insert(0, root)
+                    exec(string, globals()) #FIXME: unsafe, potential name conflict
+                    memo = globals().get(name)# None) #XXX: error if not found?
+                    globals().pop(name, None)
+                except: #XXX: should only catch the appropriate exceptions
+                    raise KeyError(key)
+                   #raise OSError("error reading directory for '%s'" % key)
+                finally:
+                    sys.path.remove(root)
+            return memo
+    def _recover(self, age=STALE):
+        "remove 'temporary' entries orphaned by interrupted writes"
+        root = self.__state__['root']
+        try:
+            names = os.listdir(root)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            if not _temporary.match(name): continue
+            path = os.path.join(root, name)
+            try: # skip entries that could belong to a write in progress
+                if now - os.path.getmtime(path) < age: continue
+            except OSError: # then the entry is already gone
+                continue
+            rmtree(path, self=True, ignore_errors=True)
+        return
+    def _swap(self, _dir, key):
+        "move a populated temporary directory into place as the given key"
+        root = self.__state__['root']
+        key = self._getdir(key)
+        try: # atomic when there is no existing entry
+            with self.__lock__():
+                os.rename(_dir, key)
+            return
+        except OSError:
+            if not os.path.exists(key): raise
+        # move the existing entry aside, then move the new entry into place
+        old = os.path.join(root, TEMP+hash(random(), 'md5'))
+        with self.__lock__():
+            os.rename(key, old)
             try:
-                sys.path.insert(0, root)
-                exec(string, globals()) #FIXME: unsafe, potential name conflict
-                memo = globals().get(name)# None) #XXX: error if not found?
-                globals().pop(name, None)
-            except: #XXX: should only catch the appropriate exceptions
-                raise KeyError(key)
-               #raise OSError("error reading directory for '%s'" % key)
-            finally:
-                sys.path.remove(root)
-        return memo
+                os.rename(_dir, key)
+            except OSError:
+                os.rename(old, key) # restore the existing entry
+                raise
+        rmtree(old, self=True, ignore_errors=True)
+        return
+    def _flush(self, _dir):
+        "flush the files in a temporary directory to disk, if requested"
+        sync = self.__state__['fsync']
+        if not sync: return
+        for name in os.listdir(_dir):
+            _fsync(os.path.join(_dir, name), data=(sync == 'data'))
+        if sync == 'full': _fsync(_dir)
+        return
     def _store(self, key, value, input=False):
         "store output (and possibly input) in a subdirectory"
         _key = TEMP+hash(random(), 'md5')
         # create an input file when key is not suitable directory name
         if self._fname(key) != key: input=True
         # create a temporary directory, and dump the results
+        _dir = mkdir(_key, root=self.__state__['root'], mode=self.__state__['permissions'])
         try:
-            _file = os.path.join(self._mkdir(_key), self._file)
-            if input: _args = os.path.join(self._getdir(_key), self._args)
+            _file = os.path.join(_dir, self._file)
+            if input: _args = os.path.join(_dir, self._args)
             if self.__state__['serialized']:
                 if self.__state__['fast']:
                     compression = self.__state__['compression']
-                    _pickle.dump(value, _file, compress=compression)
-                    if input: _pickle.dump(key, _args, compress=compression)
+                    codec = self.__state__['codec']
+                    size = self.__state__['memsize']
+                    _pickle.dump(value, _file, compress=compression, cache_size=size, codec=codec)
+                    if input: _pickle.dump(key, _args, compress=compression, cache_size=size, codec=codec)
                 else:
                     f = open(_file, 'wb')
                     dill.dump(value, f)  #XXX: byref=True ?
@@ -559,16 +859,22 @@ class dir_archive(dict):
                         memo = getimportable(key, alias='memo')
                     from .tools import _b
                     open(_args, 'wb').write(_b(memo))
-        except OSError:
-            "failed to populate directory for '%s'" % key
-        # move the results to the proper place
-        try: #XXX: possible permissions issues here
-            self._rmdir(key) #XXX: 'key' must be a suitable dir name
-            os.renames(self._getdir(_key), self._getdir(key))
-#       except TypeError: #XXX: catch key that isn't converted to safe filename
-#           "error in populating directory for '%s'" % key
-        except OSError: #XXX: if rename fails, may need cleanup (_rmdir ?)
-            "error in populating directory for '%s'" % key
+            self._flush(_dir)
+            # move the results to the proper place
+            self._swap(_dir, key) #XXX: 'key' must be a suitable dir name
+        except: # failed to populate directory for key, so clean up
+            rmtree(_dir, self=True, ignore_errors=True)
+            raise
+        if self.__state__['fsync'] == 'full': _fsync(self.__state__['root'])
+
+    def __lock__(self, shared=False):
+        "get a context manager that locks the archive, if locking is enabled"
+        if not self.__state__['locked']: return _unlocked
+        return _lock(os.path.join(self.__state__['root'], LOCK))(shared)
+    def __changes__(self):
+        "get the count of changes to the archive (None if not counted)"
+        if not self.__state__['locked']: return None
+        return _lock(os.path.join(self.__state__['root'], LOCK)).count()
 
     def _get_args(self):
         if self.__state__['serialized']: return 'input.pkl'
@@ -614,12 +920,14 @@ class dir_archive(dict):
 
 class file_archive(dict):
     """dictionary-style interface to a file"""
-    def __init__(self, filename=None, serialized=True): # False
+    def __init__(self, filename=None, serialized=True, **kwds): # False
         """initialize a file with a synchronized dictionary interface
 
     Inputs:
         serialized: if True, pickle file contents; otherwise save python objects
         filename: name of the file backend [default: memo.pkl or memo.py]
+        fsync: flush writes to disk, one of {None, 'data', 'full'} [default: None]
+        locked: if True, use a lock file to coordinate access between processes
         """
         """filename = full filepath"""
         if filename is None:
@@ -629,7 +937,9 @@ class file_archive(dict):
         # set state
         self.__state__ = {
             'filename': filename,
-            'serialized': serialized
+            'serialized': serialized,
+            'fsync': _sync(kwds.get('fsync', None)),
+            'locked': kwds.get('locked', False)
         }
         if not os.path.exists(filename):
             self.__save__({})
@@ -637,63 +947,76 @@ class file_archive(dict):
     def __reduce__(self):
         fname = self.__state__['filename']
         serial = self.__state__['serialized']
-       #state = {'__state__': self.__state__}
-        return (self.__class__, (fname, serial))#, state)
+        state = {'__state__': self.__state__}
+        return (self.__class__, (fname, serial), state)
     def __asdict__(self):
         """build a dictionary containing the archive contents"""
-        filename = self.__state__['filename']
-        if self.__state__['serialized']:
-            try:
-                f = open(filename, 'rb')
-                memo = dill.load(f)
-                f.close()
-            except:
-                memo = {}
-               #raise OSError("error reading file archive %s" % filename)
-        else:
-            import tempfile
-            file = os.path.basename(filename)
-            root = os.path.realpath(filename).rstrip(file)[:-1]
-            curdir = os.path.realpath(os.curdir)
-            if file.endswith(('.py','.pyc','.pyo','.pyd')):
-                file = file.rsplit('.',1)[0]
-            name = tempfile.mktemp(prefix="_____", dir="").replace("-","_")
-            os.chdir(root)
-            string = "from %s import memo as %s; sys.modules.pop('%s')" % (file, name, file)
-            try:
-                exec(string, globals()) #FIXME: unsafe, potential name conflict
-                memo = globals().get(name, {}) #XXX: error if not found ?
-                globals().pop(name, None)
-            except: #XXX: should only catch appropriate exceptions
-                memo = {}
-               #raise OSError("error reading file archive %s" % filename)
-            finally:
-                os.chdir(curdir)
-        return memo
+        with self.__lock__(shared=True):
+            filename = self.__state__['filename']
+            if self.__state__['serialized']:
+                try:
+                    f = open(filename, 'rb')
+                    memo = dill.load(f)
+                    f.close()
+                except:
+                    memo = {}
+                   #raise OSError("error reading file archive %s" % filename)
+            else:
+                import tempfile
+                file = os.path.basename(filename)
+                root = os.path.realpath(filename).rstrip(file)[:-1]
+                curdir = os.path.realpath(os.curdir)
+                if file.endswith(('.py','.pyc','.pyo','.pyd')):
+                    file = file.rsplit('.',1)[0]
+                name = tempfile.mktemp(prefix="_____", dir="").replace("-","_")
+                os.chdir(root)
+                string = "from %s import memo as %s; sys.modules.pop('%s')" % (file, name, file)
+                try:
+                    exec(string, globals()) #FIXME: unsafe, potential name conflict
+                    memo = globals().get(name, {}) #XXX: error if not found ?
+                    globals().pop(name, None)
+                except: #XXX: should only catch appropriate exceptions
+                    memo = {}
+                   #raise OSError("error reading file archive %s" % filename)
+                finally:
+                    os.chdir(curdir)
+            return memo
     def __save__(self, memo=None):
         """create an archive from the given dictionary"""
         if memo == None: return
+        with self.__lock__():
+            self.__write(memo)
+        return
+    def __write(self, memo):
+        "write the given dictionary to a temporary file, then move into place"
         filename = self.__state__['filename']
-        _filename = TEMP+hash(random(), 'md5')
+        sync = self.__state__['fsync']
+        # create the temporary file alongside the file, so rename is atomic
+        root = os.path.dirname(os.path.abspath(filename))
+        _filename = os.path.join(root, TEMP+hash(random(), 'md5'))
         # create a temporary file, and dump the results
         try:
-            if self.__state__['serialized']:
-                f = open(_filename, 'wb')
-                dill.dump(memo, f)  #XXX: byref=True ?
+            f = open(_filename, 'wb')
+            try:
+                if self.__state__['serialized']:
+                    dill.dump(memo, f)  #XXX: byref=True ?
+                else: #XXX: likely_import for each item in dict... ?
+                    from .tools import _b
+                    f.write(_b('memo = %s' % repr(memo)))
+                if sync:
+                    f.flush()
+                    if sync == 'data' and hasattr(os, 'fdatasync'):
+                        os.fdatasync(f.fileno())
+                    else: os.fsync(f.fileno())
+            finally:
                 f.close()
-            else: #XXX: likely_import for each item in dict... ?
-                from .tools import _b
-                open(_filename, 'wb').write(_b('memo = %s' % repr(memo)))
-        except OSError:
-            "failed to populate file for %s" % filename
-        # move the results to the proper place
-        try:
-            os.remove(filename)
-        except: pass
-        try:
-            os.renames(_filename, filename)
-        except OSError:
-            "error in populating %s" % filename
+            # move the results to the proper place
+            _replace(_filename, filename)
+        except: # failed to populate file, so clean up
+            try: os.remove(_filename)
+            except OSError: pass
+            raise
+        if sync == 'full': _fsync(root)
         return
     #FIXME: missing __cmp__, __...__
     def __eq__(self, y):
@@ -707,9 +1030,10 @@ class file_archive(dict):
         return NotImplemented if y is NotImplemented else not y
     __ne__.__doc__ = dict.__ne__.__doc__
     def __delitem__(self, key):
-        memo = self.__asdict__()
-        memo.__delitem__(key)
-        self.__save__(memo)
+        with self.__lock__():
+            memo = self.__asdict__()
+            memo.__delitem__(key)
+            self.__save__(memo)
         return
     __delitem__.__doc__ = dict.__delitem__.__doc__
     def __getitem__(self, key):
@@ -720,9 +1044,10 @@ class file_archive(dict):
         return "file_archive('%s', %s, cached=False)" % (self.name, self.__asdict__())
     __repr__.__doc__ = dict.__repr__.__doc__
     def __setitem__(self, key, value):
-        memo = self.__asdict__()
-        memo[key] = value
-        self.__save__(memo)
+        with self.__lock__():
+            memo = self.__asdict__()
+            memo[key] = value
+            self.__save__(memo)
         return
     __setitem__.__doc__ = dict.__setitem__.__doc__
     def clear(self):
@@ -735,6 +1060,8 @@ class file_archive(dict):
         if name is None: name = filename
         else: shutil.copy2(filename, name) #XXX: overwrite?
         adict = {'serialized':self.__state__['serialized'], 'filename':name}
+        adict['fsync'] = self.__state__['fsync']
+        adict['locked'] = self.__state__['locked']
         adict = file_archive(**adict)
        #adict.update(self.__asdict__())
         return adict
@@ -791,31 +1118,43 @@ class file_archive(dict):
             return ItemsView(self) #XXX: show items not dict
         viewitems.__doc__ = dict.viewitems.__doc__
     def pop(self, key, *value):
-        memo = self.__asdict__()
-        res = memo.pop(key, *value)
-        self.__save__(memo)
+        with self.__lock__():
+            memo = self.__asdict__()
+            res = memo.pop(key, *value)
+            self.__save__(memo)
         return res
     pop.__doc__ = dict.pop.__doc__
     def popitem(self):
-        memo = self.__asdict__()
-        res = memo.popitem()
-        self.__save__(memo)
+        with self.__lock__():
+            memo = self.__asdict__()
+            res = memo.popitem()
+            self.__save__(memo)
         return res
     popitem.__doc__ = dict.popitem.__doc__
     def setdefault(self, key, *value):
-        res = self.__asdict__().get(key, *value)
-        self.__setitem__(key, res)
+        with self.__lock__():
+            res = self.__asdict__().get(key, *value)
+            self.__setitem__(key, res)
         return res
     setdefault.__doc__ = dict.setdefault.__doc__
     def update(self, adict, **kwds):
         if hasattr(adict,'__asdict__'): adict = adict.__asdict__()
-        memo = self.__asdict__()
-        memo.update(adict, **kwds)
-        self.__save__(memo)
+        with self.__lock__():
+            memo = self.__asdict__()
+            memo.update(adict, **kwds)
+            self.__save__(memo)
         return
     update.__doc__ = dict.update.__doc__
     def __len__(self):
         return len(self.__asdict__())
+    def __lock__(self, shared=False):
+        "get a context manager that locks the archive, if locking is enabled"
+        if not self.__state__['locked']: return _unlocked
+        return _lock(self.__state__['filename']+LOCK)(shared)
+    def __changes__(self):
+        "get the count of changes to the archive (None if not counted)"
+        if not self.__state__['locked']: return None
+        return _lock(self.__state__['filename']+LOCK).count()
     # interface
     def load(self, *args):
         """does nothing. required to use an archive as a cache"""
@@ -12,21 +12,579 @@
 a selection of caching decorators
 """
 from __future__ import absolute_import
+import os
+import sys
+import threading
+import warnings
+from timeit import default_timer as timer
 from functools import update_wrapper, partial
 from klepto.archives import cache as archive_dict
+from klepto._archives import dict_archive, null_archive
 from klepto.keymaps import hashmap
-from klepto.tools import CacheInfo
+from klepto.tools import CacheInfo, CostInfo, histogram
 from klepto.rounding import deep_round, simple_round
-from ._inspect import _keygen
+from ._inspect import _keymaker, _keygen
 
 __all__ = ['no_cache','inf_cache','lfu_cache',\
-           'lru_cache','mru_cache','rr_cache']
+           'lru_cache','mru_cache','rr_cache','gdsf_cache',\
+           'vectorized_cache','nearest_cache','autosize']
 
 class Counter(dict):
     'Mapping where default values are zero'
     def __missing__(self, key):
         return 0
 
+def _persistent(cache):
+    "check if the cache is backed by a persistent (i.e. not in-memory) archive"
+    archive = getattr(cache, 'archive', None)
+    return not isinstance(archive, (type(None), dict_archive, null_archive))
+
+def _salted(keymap):
+    "check if the keymap uses python's hash, which is salted in each process"
+    while keymap is not None:
+        if isinstance(keymap, hashmap) and keymap.__type__ is None:
+            return True
+        keymap = getattr(keymap, 'inner', None)
+    return False
+
+# python's hash is salted in each process, unless PYTHONHASHSEED is set
+_SALTED = bool(getattr(sys.flags, 'hash_randomization', 0)) and \
+          os.environ.get('PYTHONHASHSEED', 'random') in ('', 'random')
+
+def _check(keymap, cache):
+    "warn if keys that differ in each process are stored in a persistent cache"
+    if _SALTED and _persistent(cache) and _salted(keymap):
+        msg = "%s produces keys that differ in each process, so keys stored" \
+              " in the archive will not be found by other processes; use" \
+              " hashmap(algorithm='stable')" % keymap
+        warnings.warn(msg, RuntimeWarning)
+
+def _timed(function, *args, **kwds):
+    "get the result of function(*args, **kwds), and the time taken to compute it"
+    start = timer()
+    result = function(*args, **kwds)
+    return result, timer() - start
+
+_functions = {} # functions unpickled by _apply, by payload
+
+def _apply(payload, x):
+    "get function(x), where the function is pickled (by dill) in the payload"
+    function = _functions.get(payload)
+    if function is None:
+        import dill
+        if len(_functions) > 16: _functions.clear()
+        function = _functions[payload] = dill.loads(payload)
+    return function(x)
+
+def _portable(function, pool):
+    """get a function that the pool can call in other processes
+
+    Unless the pool is a pool of threads, the function is pickled by value (with
+    dill), and called through _apply.  This way, a function that was decorated
+    where it was defined (so its name refers to the decorated function) can be
+    sent to a process pool, as can local functions and closures."""
+    from multiprocessing.pool import ThreadPool
+    threads = (ThreadPool,)
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+        threads += (ThreadPoolExecutor,)
+    except ImportError:
+        pass
+    if isinstance(pool, threads):
+        return function
+    import dill
+    return partial(_apply, dill.dumps(function, recurse=True))
+
+def _map(fetch, keyof, cache, batch, function, iterable, pool=None, chunksize=1):
+    """get [fetch(keyof(x), (x,), {}) for x in iterable], where missing results
+    are computed with pool.map(function, misses, chunksize=chunksize) (or in
+    serial if pool is None), and results are fetched in the order of the inputs
+
+    fetch gets the result for a key, and stores it in the cache. Results for
+    missing keys are provided to fetch in the batch dict (cleared upon return).
+    Keys in the archive are not misses, and are loaded by fetch as needed.
+    The function is sent to the pool by value (see _portable)."""
+    items = list(iterable)
+    keys = [keyof(x) for x in items]
+    archived = cache.archived()
+    archive = cache.archive if archived else None
+    misses = {} # {key: input}, for each unique missing key
+    for (key, x) in zip(keys, items):
+        if key in misses or key in cache or (archived and key in archive):
+            continue
+        misses[key] = x
+    if misses:
+        misses, inputs = list(misses.keys()), list(misses.values())
+        if pool is None:
+            results = [function(x) for x in inputs]
+        else:
+            function = _portable(function, pool)
+            results = pool.map(function, inputs, chunksize=chunksize)
+        batch.update(zip(misses, results))
+    try: # store results in the cache, as if calling the function in order
+        return [fetch(key, (x,), {}) for (key, x) in zip(keys, items)]
+    finally:
+        batch.clear()
+
+def _record(trace, fetch, stats, key, args, kwds):
+    """get fetch(key, args, kwds), and record the call in the trace
+
+    If the trace samples the key, trace.record(key, event, time, result) is
+    called, where event is the index (i.e. HIT=0, MISS=1, LOAD=2) of the stats
+    field that was incremented, and time is the time taken by fetch."""
+    if not trace.sampled(key):
+        return fetch(key, args, kwds)
+    before = stats[:3]
+    start = timer()
+    result = fetch(key, args, kwds)
+    time = timer() - start
+    changed = [i for i in range(3) if stats[i] != before[i]]
+    trace.record(key, changed[0] if changed else 1, time, result)
+    return result
+
+_EVENTS = ('on_hit', 'on_miss', 'on_load')
+
+def _observe(observers, fetch, cache, stats, skipped=None):
+    """get a function like fetch, that notifies the observers of each event
+
+    Observers may have any of the methods on_hit(key), on_miss(key),
+    on_load(key), on_evict(count), and on_dump(count), where count is the
+    number of entries purged from the cache (or dumped to the archive, see
+    _dump) by the call.  Entries dumped to the archive are also evicted.
+    If the policy may not store a result (e.g. gdsf_cache, with a threshold),
+    fetch sets skipped[0] to True when it does not store the result.
+
+    The event is found from the change in stats (and in the size of the cache)
+    made by the call, so calls are serialized with a lock, and the changes made
+    by nested calls (e.g. of a recursive function) are not counted twice."""
+    if not observers:
+        return fetch
+    lock = threading.RLock()
+    nested = [] # changes made by nested calls, for each call in progress
+    def observed(key, args, kwds):
+        with lock:
+            if skipped is not None: skipped[0] = False
+            before, size = stats[:], len(cache)
+            nested.append([0] * (len(before) + 1))
+            try:
+                result = fetch(key, args, kwds)
+            finally:
+                inner = nested.pop()
+                change = [i - j for (i, j) in zip(stats, before)]
+                change.append(len(cache) - size)
+                if nested: # the enclosing call made this change
+                    nested[-1][:] = [i + j for (i, j) in zip(nested[-1], change)]
+                skip = skipped is not None and skipped[0]
+                if skip: skipped[0] = False # not skipped by the enclosing call
+            change = [i - j for (i, j) in zip(change, inner)]
+            grown = change.pop() # the change in the size of the cache
+            changed = [i for i in range(3) if change[i]]
+            event = changed[0] if changed else 1
+            _notify(observers, _EVENTS[event], key)
+            # a result is stored, unless a hit or skipped (e.g. by a threshold)
+            stored = event != 0 and not skip
+            evicted = stored - grown
+            if evicted > 0:
+                _notify(observers, 'on_evict', evicted)
+            return result
+    return observed
+
+def _notify(observers, event, *args):
+    "call the method for the event (if it exists) on each of the observers"
+    for observer in observers:
+        method = getattr(observer, event, None)
+        if method is not None: method(*args)
+
+def _dump(observers, cache):
+    "dump the cache to the archive, and notify the observers of the count"
+    cache.dump()
+    if observers:
+        _notify(observers, 'on_dump', len(cache))
+
+_STAGES = ('round', 'keygen', 'keymap', 'lookup', 'load', 'compute', 'dump')
+
+def _instrument(timing, on=True):
+    """start (or stop) recording the time taken in each stage of a call
+
+    timing is [histograms, time, last], where histograms is a dict of {stage:
+    histogram} while recording (otherwise None), time is the time spent in the
+    load, compute, and dump stages of the current call, and last is the dict
+    of histograms of the last recording."""
+    if on:
+        timing[2] = dict((stage, histogram()) for stage in _STAGES)
+    timing[0] = timing[2] if on else None
+
+def _stage(function, name, timing):
+    "get a function that calls function, and records the time in stage name"
+    def staged(*args, **kwds):
+        histograms = timing[0]
+        if histograms is None:
+            return function(*args, **kwds)
+        start = timer()
+        try:
+            return function(*args, **kwds)
+        finally:
+            time = timer() - start
+            histograms[name].record(time)
+            timing[1] += time
+    return staged
+
+def _stagedkey(timing, func, keymap, ignored, rounded_args, args, kwds):
+    "get the key for func(*args, **kwds), recording the time in each stage"
+    histograms = timing[0]
+    start = timer()
+    args, kwds = rounded_args(*args, **kwds)
+    rounded = timer()
+    args, kwds = _keygen(func, ignored, *args, **kwds)
+    generated = timer()
+    key = keymap(*args, **kwds)
+    histograms['keymap'].record(timer() - generated)
+    histograms['keygen'].record(generated - rounded)
+    histograms['round'].record(rounded - start)
+    return key
+
+def _lookup(timing, trace, fetch, stats, key, args, kwds):
+    """get fetch(key, args, kwds), recording the time not spent in the load,
+    compute, or dump stages as the time for the lookup (and if a trace is
+    given, recording the call in the trace)"""
+    histograms, timing[1] = timing[0], 0.
+    start = timer()
+    if trace is None:
+        result = fetch(key, args, kwds)
+    else:
+        result = _record(trace, fetch, stats, key, args, kwds)
+    histograms['lookup'].record(timer() - start - timing[1])
+    return result
+
+class _hooks(object):
+    """the keys, trace, timing, and observers of a cached function
+
+    The policy's fetch(key, args, kwds) gets results with compute, load, and
+    dump (in place of the function, cache.load, and cache.dump), so the time
+    in each stage is recorded when instrumented, and the observers are
+    notified of each dump.  The wrapper for fetch is built with wrap.
+
+    If no keymap is given, the default keymap is used (see _keymap), and is
+    replaced with a stable hash if a persistent archive is set later."""
+    def __init__(self, function, cache, keymap=None, ignore=(), rounded_args=None, tol=None):
+        self.default = keymap is None   # if True, the keymap may be replaced
+        keymap = _keymap(keymap, cache)
+        self.function, self.cache, self.keymap = function, cache, keymap
+        self.ignore, self.rounded_args, self.tol = ignore, rounded_args, tol
+        self.keyof = _keymaker(function, keymap, ignore, rounded_args, tol)
+        self.tracer = [None]            # trace that records the calls
+        self.timing = [None, 0., None]  # histograms of the time in each stage
+        self.observers = []             # objects notified of each event
+        self.compute = _stage(function, 'compute', self.timing)
+        self.load = _stage(cache.load, 'load', self.timing)
+        self.dump = _stage(partial(_dump, self.observers, cache), 'dump', self.timing)
+        return
+
+    def wrap(self, fetch, clear, stats, batch=None, function=None, safe=False, skipped=None):
+        """get the wrapper that gets the result with fetch(key, args, kwds),
+        where clear(keepstats) clears the cache of the policy, and stats is
+        the list of statistics (HIT, MISS, LOAD, ...) of fetch (and skipped
+        is set by fetch when a result is not stored, see _observe)
+
+        The methods archive, key, lookup, record, observe, instrument, stats,
+        and __map__ are attached to the wrapper, and if batch is given, so is
+        map (where misses are computed with function, or the cached function
+        if None).  If safe, an error building the key is a miss, and the
+        function is called."""
+        func, cache, default = self.function, self.cache, self.default
+        ignore, rounded_args, tol = self.ignore, self.rounded_args, self.tol
+        tracer, timing, observers = self.tracer, self.timing, self.observers
+        compute = self.compute
+        keys = [self.keyof, self.keymap] # the key builder, and the keymap
+        fetcher = [fetch]               # fetch, or fetch that notifies observers
+        if function is None: function = func
+
+        if safe:
+            def wrapper(*args, **kwds):
+                try:
+                    if timing[0] is None:
+                        key = keys[0](*args, **kwds)
+                    else: # record the time taken in each stage
+                        key = _stagedkey(timing, func, keys[1], ignore, rounded_args, args, kwds)
+                except: #TypeError
+                    result = compute(*args, **kwds)
+                    stats[1] += 1 # MISS
+                    return result
+                if timing[0] is not None:
+                    return _lookup(timing, tracer[0], fetcher[0], stats, key, args, kwds)
+                if tracer[0] is None:
+                    return fetcher[0](key, args, kwds)
+                return _record(tracer[0], fetcher[0], stats, key, args, kwds)
+        else:
+            def wrapper(*args, **kwds):
+                if timing[0] is not None: # record the time taken in each stage
+                    key = _stagedkey(timing, func, keys[1], ignore, rounded_args, args, kwds)
+                    return _lookup(timing, tracer[0], fetcher[0], stats, key, args, kwds)
+                key = keys[0](*args, **kwds)
+                if tracer[0] is None:
+                    return fetcher[0](key, args, kwds)
+                return _record(tracer[0], fetcher[0], stats, key, args, kwds)
+
+        def archive(obj):
+            """Replace the cache archive"""
+            if not safe:
+                keymap = _stabilize(default, keys[1], obj)
+                if keymap is not keys[1]: # the keys in the cache are stale
+                    keys[:] = [_keymaker(func, keymap, ignore, rounded_args, tol), keymap]
+                    clear(keepstats=True)
+            if isinstance(obj, archive_dict): cache.archive = obj.archive
+            else: cache.archive = obj
+
+        def key(*args, **kwds):
+            """Get the cache key for the given *args,**kwds"""
+            return keys[0](*args, **kwds)
+
+        def lookup(*args, **kwds):
+            """Get the stored value for the given *args,**kwds"""
+            return cache[keys[0](*args, **kwds)]
+
+        def map(iterable, pool=None, chunksize=1):
+            """Get [f(x) for x in iterable], where misses are computed in pool
+
+    Keys are generated for all inputs, and only unique keys not found in the
+    cache or the archive are computed (with pool.map if a pool is given).
+    Results are returned in input order, and stored as if f was called in order.
+            """
+            if tracer[0] is not None:
+                return _map(partial(_record, tracer[0], fetcher[0], stats), keys[0], cache, batch, function, iterable, pool, chunksize)
+            return _map(fetcher[0], keys[0], cache, batch, function, iterable, pool, chunksize)
+
+        def record(trace=None):
+            """Record the calls in the trace, or stop recording if trace is None"""
+            tracer[0] = trace
+
+        def observe(observer, on=True):
+            """Notify the observer of each event, or stop notifying if not on"""
+            if observer in observers: observers.remove(observer)
+            if on: observers.append(observer)
+            fetcher[0] = _observe(observers, fetch, cache, stats, skipped)
+
+        def instrument(on=True):
+            """Record the time taken in each stage of a call, or stop if not on"""
+            _instrument(timing, on)
+
+        def timings():
+            """Get the histograms of the time taken in each stage, by stage"""
+            return timing[2]
+
+        def get_keymap():
+            """Get the keymap"""
+            return keys[1]
+
+        wrapper.archive = archive
+        wrapper.key = key
+        wrapper.lookup = lookup
+        wrapper.record = record
+        wrapper.observe = observe
+        wrapper.instrument = instrument
+        wrapper.stats = timings
+        wrapper.__map__ = get_keymap
+        if batch is not None:
+            wrapper.map = map
+        return wrapper
+
+def _keymap(keymap, cache):
+    "get the keymap for the cache, where a process-stable hash is preferred"
+    if keymap is None:
+        algorithm = 'stable' if _persistent(cache) else None
+        return hashmap(flat=True, algorithm=algorithm)
+    _check(keymap, cache)
+    return keymap
+
+def _stabilize(default, keymap, archive):
+    """get the keymap to use with the archive, where if default is True (i.e.
+    the keymap was not given), a process-stable hash replaces python's hash
+    for a persistent archive, and otherwise a salted keymap is warned about"""
+    if not default:
+        _check(keymap, archive)
+    elif _persistent(archive) and keymap.__type__ is None:
+        return hashmap(flat=True, algorithm='stable')
+    return keymap
+
+class autosize(object):
+    """adaptive maxsize, for use as the maxsize of lru_cache or lfu_cache
+
+    The hit ratio of the cache for each size is estimated from the reuse
+    distances (i.e. the number of distinct keys used between two uses of the
+    same key) of a spatially hashed sample of the keys, as in SHARDS.  Every
+    'interval' calls, the maxsize is set to the smallest size (within the
+    bounds and the memory budget) with a hit ratio within 'slack' of the hit
+    ratio for the largest size allowed.  The estimate is for an LRU cache, and
+    is thus an approximation for other cache algorithms.
+
+    minsize = minimum cache size (default is 1)
+    maxsize = maximum cache size (default is 10000)
+    budget = maximum bytes of the cached results (default is None)
+    sizeof = function that returns the size of a result (default is the bytes
+        of the array data for arrays, and otherwise sys.getsizeof)
+    samples = maximum number of keys sampled (default is 1024)
+    rate = maximum fraction of keys sampled (default is 0.1)
+    interval = number of calls between resizing the cache (default is 1000)
+    slack = allowed reduction in hit ratio from the largest size (default is
+        0.01, i.e. a 1% lower hit ratio)
+
+    View the current size with f.info().maxsize, and the estimated hit ratio
+    curve as a list of (size, hit ratio) with f.curve().
+
+    For example:
+    >>> @lru_cache(maxsize=autosize(10, 100000, budget=2**30))
+    ... def f(x):
+    ...     return x
+    """
+    def __init__(self, minsize=1, maxsize=10000, budget=None, sizeof=None, samples=1024, rate=0.1, interval=1000, slack=0.01):
+        if not 0 < minsize <= maxsize:
+            raise ValueError("requires 0 < minsize <= maxsize")
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.budget = budget
+        self.sizeof = sizeof
+        self.samples = samples
+        self.rate = rate
+        self.interval = interval
+        self.slack = slack
+        return
+    def __repr__(self):
+        return "autosize(minsize=%r, maxsize=%r, budget=%r)" % \
+               (self.minsize, self.maxsize, self.budget)
+    def __reduce__(self):
+        return (self.__class__, (self.minsize, self.maxsize, self.budget, \
+                self.sizeof, self.samples, self.rate, self.interval, self.slack))
+
+
+class _curve(object):
+    """sampled estimate of the hit ratio curve of an LRU cache (see autosize)
+
+    A key is sampled if its (mixed) hash is below a threshold, where the
+    threshold is lowered to keep the number of sampled keys below the limit.
+    Only sampled keys pay the cost of measuring the reuse distance.
+    The reuse distance of a sampled key is the number of sampled keys with a
+    more recent use (found with a Fenwick tree over the time of last use),
+    scaled by the sampling rate.  Distances are kept with 6 significant bits,
+    and the weights of the distances decay by 10% on each resize, so the curve
+    follows changes in the calls."""
+    SPACE = 1 << 24 # sampled hashes are in range(SPACE)
+
+    def __init__(self, config):
+        self.config = config
+        self.size = config.maxsize  # the current cache size
+        self.threshold = int(self.SPACE * config.rate) # sample hashes below it
+        self.last = {}              # mapping of sampled keys to (time, hash)
+        self.tree = [0] * (4 * config.samples + 1) # Fenwick tree over time
+        self.time = 0               # time of the next sampled use
+        self.counts = {}            # mapping of reuse distances to weights
+        self.total = 0.             # weight of all sampled uses
+        self.calls = 0              # calls since the last resize
+        return
+
+    def _add(self, time, value):
+        "add value to the Fenwick tree at time"
+        tree, time = self.tree, time + 1
+        while time < len(tree):
+            tree[time] += value
+            time += time & -time
+
+    def _sum(self, time):
+        "get the number of sampled keys with a last use before time"
+        tree, total = self.tree, 0
+        while time > 0:
+            total += tree[time]
+            time -= time & -time
+        return total
+
+    def _compact(self):
+        "renumber the times of last use, so the tree has room for new times"
+        self.tree = [0] * len(self.tree)
+        order = sorted(self.last.items(), key=lambda i: i[1][0])
+        for (time, (key, (_, code))) in enumerate(order):
+            self.last[key] = (time, code)
+            self._add(time, 1)
+        self.time = len(order)
+
+    def _evict(self):
+        "lower the threshold, removing the sampled keys at or above it"
+        self.threshold = max(code for (_, code) in self.last.values())
+        for (key, (time, code)) in list(self.last.items()):
+            if code >= self.threshold:
+                del self.last[key]
+                self._add(time, -1)
+
+    def access(self, key):
+        """record a use of the key, and return True if the size should change"""
+        self.calls += 1
+        code = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        code >>= 40 # the top 24 bits are well mixed
+        if code < self.threshold:
+            weight = float(self.SPACE) / self.threshold # 1/rate
+            used = self.last.pop(key, None)
+            if used is None: # a cold miss
+                distance = None
+            else:
+                distance = len(self.last) + 1 - self._sum(used[0] + 1)
+                distance = int(distance * weight)
+                if distance >= self.config.maxsize: # a miss for any size
+                    distance = None
+                elif distance >> 6: # keep 6 significant bits
+                    shift = distance.bit_length() - 6
+                    distance = distance >> shift << shift
+                self._add(used[0], -1)
+            self.counts[distance] = self.counts.get(distance, 0.) + weight
+            self.total += weight
+            if self.time + 1 >= len(self.tree):
+                self._compact()
+            self.last[key] = (self.time, code)
+            self._add(self.time, 1)
+            self.time += 1
+            if len(self.last) > self.config.samples:
+                self._evict()
+        return self.calls >= self.config.interval
+
+    def ratio(self, size):
+        "get the estimated hit ratio for a cache of the given size"
+        if not self.total: return 0.
+        hits = sum(v for (k, v) in self.counts.items() \
+                   if k is not None and k < size)
+        return hits / self.total
+
+    def curve(self, sizes=None):
+        "get a list of (size, hit ratio), at sizes between the bounds"
+        if sizes is None:
+            size, sizes = self.config.minsize, []
+            while size < self.config.maxsize:
+                sizes.append(size)
+                size *= 2
+            sizes.append(self.config.maxsize)
+        return [(size, self.ratio(size)) for size in sizes]
+
+    def resize(self, cache):
+        "set the size to the smallest size with a near maximal hit ratio"
+        from itertools import islice
+        config, self.calls = self.config, 0
+        if not self.total: return self.size
+        upper = config.maxsize
+        if config.budget is not None and len(cache):
+            sizeof = config.sizeof or _sizeof
+            values = getattr(cache, 'itervalues', cache.values)()
+            values = [sizeof(v) for v in islice(values, 100)]
+            upper = min(upper, int(config.budget * len(values) / max(sum(values), 1)))
+            upper = max(upper, config.minsize)
+        target = (self.ratio(upper) - config.slack) * self.total
+        size, hits = config.minsize, 0.
+        for distance in sorted(k for k in self.counts if k is not None):
+            if hits >= target: break
+            hits += self.counts[distance]
+            size = distance + 1
+        self.size = min(max(size, config.minsize), upper)
+        # decay the weights, so the curve follows changes in the calls
+        for distance in self.counts:
+            self.counts[distance] *= 0.9
+        self.total *= 0.9
+        return self.size
+
 #XXX: what about caches that expire due to time, calls, etc...
 #XXX: check the impact of not serializing by default, and hashmap by default
 
@@ -53,6 +611,9 @@ class no_cache(object):
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -80,7 +641,6 @@ class no_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -111,52 +671,34 @@ class no_cache(object):
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
-        def wrapper(*args, **kwds):
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             # look in archive
             if cache.archived():
-                cache.load(key)
+                load(key)
             try:
                 result = cache[key]
                 cache.clear()
                 stats[LOAD] += 1
             except KeyError:
                 # if not found, then compute
-                result = user_function(*args, **kwds)
+                result = batch[key] if key in batch else compute(*args, **kwds)
                 cache[key] = result
                 stats[MISS] += 1
 
             # purge cache
             if _len(cache) > maxsize:
                 if cache.archived():
-                    cache.dump()
+                    dump()
                 cache.clear() 
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -165,10 +707,6 @@ class no_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             if not keepstats: stats[:] = [0, 0, 0]
@@ -177,6 +715,8 @@ class no_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -184,13 +724,9 @@ class no_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -232,6 +768,9 @@ class inf_cache(object):
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -258,7 +797,6 @@ class inf_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -289,15 +827,14 @@ class inf_cache(object):
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
-        def wrapper(*args, **kwds):
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -305,34 +842,17 @@ class inf_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = batch[key] if key in batch else compute(*args, **kwds)
                     cache[key] = result
                     stats[MISS] += 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -341,10 +861,6 @@ class inf_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -354,6 +870,8 @@ class inf_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -361,13 +879,9 @@ class inf_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -408,11 +922,16 @@ class lfu_cache(object):
     deep = boolean for rounding depth (default is False, i.e. 'shallow')
     ignore = function argument names and indicies to 'ignore' (default is None)
 
-    If *maxsize* is None, this cache will grow without bound.
+    If *maxsize* is None, this cache will grow without bound.  If *maxsize* is
+    an autosize, the maxsize is adjusted (within the bounds of the autosize)
+    from the estimated hit ratio curve, which is given by f.curve().
 
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -443,7 +962,6 @@ class lfu_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -477,15 +995,18 @@ class lfu_cache(object):
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
-
-        def wrapper(*args, **kwds):
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
-
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
+        sizer = _curve(maxsize) if isinstance(maxsize, autosize) else None
+        limit = [maxsize if sizer is None else sizer.size] # the current maxsize
+
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
+            if sizer is not None and sizer.access(key):
+                limit[0] = sizer.resize(cache)
             try:
                 # get cache entry
                 result = cache[key]
@@ -494,48 +1015,32 @@ class lfu_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     use_count[key] += 1
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = batch[key] if key in batch else compute(*args, **kwds)
                     cache[key] = result
                     use_count[key] += 1
                     stats[MISS] += 1
 
                 # purge cache
-                if _len(cache) > maxsize:
+                if _len(cache) > limit[0]:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
                         use_count.clear()
                     else: # purge least frequent cache entries
-                        for k, _ in nsmallest(max(2, maxsize // 10),
-                                              iter(use_count.items()),
-                                              key=itemgetter(1)):
-                            del cache[k], use_count[k]
+                        while _len(cache) > limit[0]:
+                            for k, _ in nsmallest(max(2, limit[0] // 10),
+                                                  iter(use_count.items()),
+                                                  key=itemgetter(1)):
+                                del cache[k], use_count[k]
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -544,10 +1049,6 @@ class lfu_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -556,7 +1057,13 @@ class lfu_cache(object):
 
         def info():
             """Report cache statistics"""
-            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
+            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], limit[0], len(cache))
+
+        def curve():
+            """Get the estimated hit ratio curve, as a list of (size, hit ratio)"""
+            return None if sizer is None else sizer.curve()
+
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
 
         # interface
         wrapper.__wrapped__ = user_function
@@ -565,13 +1072,10 @@ class lfu_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
+        wrapper.curve = curve
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = use_count #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -613,11 +1117,16 @@ class lru_cache(object):
     deep = boolean for rounding depth (default is False, i.e. 'shallow')
     ignore = function argument names and indicies to 'ignore' (default is None)
 
-    If *maxsize* is None, this cache will grow without bound.
+    If *maxsize* is None, this cache will grow without bound.  If *maxsize* is
+    an autosize, the maxsize is adjusted (within the bounds of the autosize)
+    from the estimated hit ratio curve, which is given by f.curve().
 
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -648,7 +1157,6 @@ class lru_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -687,20 +1195,23 @@ class lru_cache(object):
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
-        maxqueue = maxsize * 10 #XXX: settable? confirm this works as expected
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
+        sizer = _curve(maxsize) if isinstance(maxsize, autosize) else None
+        limit = [maxsize if sizer is None else sizer.size] # the current maxsize
+        maxqueue = getattr(maxsize, 'maxsize', maxsize) * 10 #XXX: settable? confirm this works as expected
 
         # lookup optimizations (ugly but fast)
         queue_append, queue_popleft = queue.append, queue.popleft
         queue_appendleft, queue_pop = queue.appendleft, queue.pop
 
-        def wrapper(*args, **kwds):
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
+            if sizer is not None and sizer.access(key):
+                limit[0] = sizer.resize(cache)
             try:
                 # get cache entry
                 result = cache[key]
@@ -711,7 +1222,7 @@ class lru_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     # record recent use of this key
@@ -720,7 +1231,7 @@ class lru_cache(object):
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = batch[key] if key in batch else compute(*args, **kwds)
                     cache[key] = result
                     # record recent use of this key
                     queue_append(key)
@@ -728,19 +1239,20 @@ class lru_cache(object):
                     stats[MISS] += 1
 
                 # purge cache
-                if _len(cache) > maxsize:
+                if _len(cache) > limit[0]:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
                         queue.clear()
                         refcount.clear()
-                    else: # purge least recently used cache entry
-                        key = queue_popleft()
-                        refcount[key] -= 1
-                        while refcount[key]:
+                    else: # purge least recently used cache entries
+                        while _len(cache) > limit[0]:
                             key = queue_popleft()
                             refcount[key] -= 1
-                        del cache[key], refcount[key]
+                            while refcount[key]:
+                                key = queue_popleft()
+                                refcount[key] -= 1
+                            del cache[key], refcount[key]
 
             # periodically compact the queue by eliminating duplicate keys
             # while preserving order of most recent access
@@ -753,23 +1265,6 @@ class lru_cache(object):
                     refcount[key] = 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -778,10 +1273,6 @@ class lru_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -791,7 +1282,13 @@ class lru_cache(object):
 
         def info():
             """Report cache statistics"""
-            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
+            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], limit[0], len(cache))
+
+        def curve():
+            """Get the estimated hit ratio curve, as a list of (size, hit ratio)"""
+            return None if sizer is None else sizer.curve()
+
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
 
         # interface
         wrapper.__wrapped__ = user_function
@@ -800,13 +1297,10 @@ class lru_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
+        wrapper.curve = curve
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = queue #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -853,6 +1347,9 @@ class mru_cache(object):
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -883,7 +1380,6 @@ class mru_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -907,76 +1403,72 @@ class mru_cache(object):
         return
 
     def __call__(self, user_function):
-        from collections import deque
        #cache = dict()                  # mapping of args to results
-        queue = deque()                 # order that keys have been used
+        root = []                       # root of the circular linked list
+        root[:] = [root, root, None]    # links are [PREV, NEXT, KEY]
+        links = {}                      # mapping of keys to links
+        PREV, NEXT, KEY = 0, 1, 2       # names for the link fields
         stats = [0, 0, 0]               # make statistics updateable non-locally
         HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
         _len = len                      # localize the global len() function
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
         # lookup optimizations (ugly but fast)
-        queue_append, queue_popleft = queue.append, queue.popleft
-        queue_appendleft, queue_pop = queue.appendleft, queue.pop
-
-        def wrapper(*args, **kwds):
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
+        links_get = links.get
 
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
-                queue.remove(key)
                 stats[HIT] += 1
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = batch[key] if key in batch else compute(*args, **kwds)
                     cache[key] = result
                     stats[MISS] += 1
 
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
-                        queue.clear()
-                    else: # purge most recently used cache entry
-                        del cache[queue_pop()]
-
-            # record recent use of this key
-            queue_append(key)
+                        links.clear()
+                        root[:] = [root, root, None]
+                    elif root[PREV] is not root:
+                        # purge most recently used cache entry
+                        last = root[PREV]
+                        root[PREV] = last[PREV]
+                        last[PREV][NEXT] = root
+                        del links[last[KEY]]
+                        cache.pop(last[KEY], None)
+
+            # record recent use of this key (move its link to the end)
+            link = links_get(key)
+            if link is None:
+                link = links[key] = [None, None, key]
+            else:
+                link[PREV][NEXT] = link[NEXT]
+                link[NEXT][PREV] = link[PREV]
+            last = root[PREV]
+            link[PREV], link[NEXT] = last, root
+            last[NEXT] = root[PREV] = link
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -985,20 +1477,19 @@ class mru_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
-            queue.clear()
+            links.clear()
+            root[:] = [root, root, None]
             if not keepstats: stats[:] = [0, 0, 0]
 
         def info():
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -1006,14 +1497,10 @@ class mru_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
-       #wrapper._queue = queue #XXX
+       #wrapper._queue = links #XXX
         return update_wrapper(wrapper, user_function)
 
     def __get__(self, obj, objtype):
@@ -1053,12 +1540,16 @@ class rr_cache(object):
     tol = integer tolerance for rounding (default is None)
     deep = boolean for rounding depth (default is False, i.e. 'shallow')
     ignore = function argument names and indicies to 'ignore' (default is None)
+    seed = seed for the random choice of entries to purge (default is None)
 
     If *maxsize* is None, this cache will grow without bound.
 
     If *keymap* is given, it will replace the hashing algorithm for generating
     cache keys.  Several hashing algorithms are available in 'keymaps'. The
     default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
 
     If the keymap retains type information, then arguments of different types
     will be cached separately.  For example, f(3.0) and f(3) will be treated
@@ -1074,6 +1565,8 @@ class rr_cache(object):
     recalculation (they only trigger cache lookups), and thus are 'ignored'.
     When caching class methods, it may be useful to ignore=('self',).
 
+    If *seed* is given, the cache entries are purged in a reproducible order.
+
     View cache statistics (hit, miss, load, maxsize, size) with f.info().
     Clear the cache and statistics with f.clear().  Replace the cache archive
     with f.archive(obj).  Load from the archive with f.load(), and dump from
@@ -1081,7 +1574,7 @@ class rr_cache(object):
 
     http://en.wikipedia.org/wiki/Cache_algorithms#Random_Replacement
     """
-    def __init__(self, maxsize=100, cache=None, keymap=None, ignore=None, tol=None, deep=False):
+    def __init__(self, maxsize=100, cache=None, keymap=None, ignore=None, tol=None, deep=False, seed=None):
         if maxsize == 0:
             return no_cache(cache=cache, keymap=keymep, ignore=ignore, tol=tol, deep=deep)
         if maxsize is None:
@@ -1089,7 +1582,6 @@ class rr_cache(object):
         if cache is None: cache = archive_dict()
         elif type(cache) is dict: cache = archive_dict(cache)
 
-        if keymap is None: keymap = hashmap(flat=True)
         if ignore is None: ignore = tuple()
 
         if deep: rounded = deep_round
@@ -1109,27 +1601,48 @@ class rr_cache(object):
             'roundargs': rounded_args,
             'tol': tol,
             'deep': deep,
+            'seed': seed,
         }
         return
 
     def __call__(self, user_function):
+        from random import Random
        #cache = dict()                  # mapping of args to results
+        pool = []                       # keys in the cache, in any order
+        index = {}                      # mapping of keys to index in pool
         stats = [0, 0, 0]               # make statistics updateable non-locally
         HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
         _len = len                      # localize the global len() function
        #lock = RLock()                  # linkedlist updates aren't threadsafe
         maxsize = self.__state__['maxsize']
         cache = self.__state__['cache']
-        keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
-
-        def wrapper(*args, **kwds):
-            from random import choice #XXX: biased?
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            key = keymap(*_args, **_kwds)
-
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results computed by map, by key
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
+        randrange = Random(self.__state__['seed']).randrange
+
+        def add(key):
+            "add a new key to the pool"
+            index[key] = _len(pool)
+            pool.append(key)
+
+        def purge():
+            "purge a random cache entry, by swapping it with the last in pool"
+            if _len(pool) != _len(cache): # cache was changed, so rebuild
+                pool[:] = cache.keys()
+                index.clear()
+                index.update((k,i) for (i,k) in enumerate(pool))
+            i = randrange(_len(pool))
+            key, last = pool[i], pool.pop()
+            if i < _len(pool):
+                pool[i] = last
+                index[last] = i
+            del index[key], cache[key]
+
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -1137,57 +1650,809 @@ class rr_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
+                    add(key)
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = batch[key] if key in batch else compute(*args, **kwds)
                     cache[key] = result
+                    add(key)
                     stats[MISS] += 1
 
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
+                        del pool[:]
+                        index.clear()
                     else: # purge random cache entry
-                        del cache[choice(list(cache.keys()))]
+                        purge()
+            return result
+
+        def __get_cache():
+            """Get the cache"""
+            return cache
+
+        def __get_mask():
+            """Get the (ignore) mask"""
+            return ignore
+
+        def clear(keepstats=False):
+            """Clear the cache and statistics"""
+            cache.clear()
+            del pool[:]
+            index.clear()
+            if not keepstats: stats[:] = [0, 0, 0]
+
+        def info():
+            """Report cache statistics"""
+            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
+
+        wrapper = hooks.wrap(fetch, clear, stats, batch)
+
+        # interface
+        wrapper.__wrapped__ = user_function
+        #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
+        wrapper.info = info
+        wrapper.clear = clear
+        wrapper.load = cache.load
+        wrapper.dump = cache.dump
+        wrapper.archived = cache.archived
+        wrapper.__cache__ = __get_cache
+        wrapper.__mask__ = __get_mask
+       #wrapper._queue = None  #XXX
+        return update_wrapper(wrapper, user_function)
+
+    def __get__(self, obj, objtype):
+        """support instance methods"""
+        return partial(self.__call__, obj)
+
+    def __reduce__(self):
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        keymap = self.__state__['keymap']
+        ignore = self.__state__['ignore']
+        tol = self.__state__['tol']
+        deep = self.__state__['deep']
+        seed = self.__state__['seed']
+        return (self.__class__, (maxsize, cache, keymap, ignore, tol, deep, seed))
+
+
+def _sizeof(obj):
+    "get the size of an object in bytes (for arrays, the size of the data)"
+    from sys import getsizeof
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    try:
+        return getsizeof(obj)
+    except TypeError:
+        return 1
+
+
+class gdsf_cache(object):
+    """greedy-dual-size-frequency (GDSF) cache decorator.
+
+    This decorator memoizes a function's return value each time it is called.
+    If called later with the same arguments, the cached value is returned, and
+    not re-evaluated.  To avoid memory issues, a maximum cache size is imposed.
+    For caches with an archive, the full cache dumps to archive upon reaching
+    maxsize. For caches without an archive, the GDSF algorithm manages the
+    cache, where the time taken to compute each result (and the size of the
+    result) is recorded, and the entries that are cheap to recompute, large,
+    and infrequently used are purged first.  Results that take less time to
+    compute than a given 'threshold' are never cached.
+    This decorator takes an integer tolerance 'tol', equal to the number of
+    decimal places to which it will round off floats, and a bool 'deep' for
+    whether the rounding on inputs will be 'shallow' or 'deep'.  Note that
+    rounding is not applied to the calculation of new results, but rather as a
+    simple form of cache interpolation.  For example, with tol=0 and a cached
+    value for f(3.0), f(3.1) will lookup f(3.0) in the cache while f(3.6) will
+    store a new value; however if tol=1, both f(3.1) and f(3.6) will store
+    new values.
+
+    maxsize = maximum cache size
+    cache = storage hashmap (default is {})
+    keymap = cache key encoder (default is keymaps.hashmap(flat=True))
+    tol = integer tolerance for rounding (default is None)
+    deep = boolean for rounding depth (default is False, i.e. 'shallow')
+    ignore = function argument names and indicies to 'ignore' (default is None)
+    threshold = minimum time (in seconds) to compute a result that is cached
+    sizeof = function that returns the size of a result (default is the bytes
+        of the array data for arrays, and otherwise sys.getsizeof)
+    cost = function that returns the cost of a result (default is None, i.e.
+        the time taken to compute the result)
+
+    If *maxsize* is None, this cache will grow without bound.
+
+    If *threshold* is given, results that are computed faster are returned,
+    but not cached.  For example, threshold=1e-4 only caches results that
+    take at least 100 microseconds to compute.
+
+    If *keymap* is given, it will replace the hashing algorithm for generating
+    cache keys.  Several hashing algorithms are available in 'keymaps'. The
+    default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
+
+    If the keymap retains type information, then arguments of different types
+    will be cached separately.  For example, f(3.0) and f(3) will be treated
+    as distinct calls with distinct results.  Cache typing has a memory penalty,
+    and may also be ignored by some 'keymaps'.
+
+    If *ignore* is given, the keymap will ignore the arguments with the names
+    and/or positional indicies provided. For example, if ignore=(0,), then
+    the key generated for f(1,2) will be identical to that of f(3,2) or f(4,2).
+    If ignore=('y',), then the key generated for f(x=3,y=4) will be identical
+    to that of f(x=3,y=0) or f(x=3,y=10). If ignore=('*','**'), all varargs
+    and varkwds will be 'ignored'.  Ignored arguments never trigger a
+    recalculation (they only trigger cache lookups), and thus are 'ignored'.
+    When caching class methods, it may be useful to ignore=('self',).
+
+    Each cache entry has priority L + frequency * cost / size, where L is the
+    priority of the last entry purged (so entries that are not used will age).
+    Entries loaded from the archive have no cost, as their cost is unknown.
+
+    View cache statistics (hit, miss, load, maxsize, size, skip, cost,
+    threshold) with f.info(), where skip is the number of results that were
+    not cached and cost is the total time spent computing results.  Clear the
+    cache and statistics with f.clear().  Replace the cache archive with
+    f.archive(obj).  Load from the archive with f.load(), and dump from the
+    cache to the archive with f.dump().
+
+    See: http://www.hpl.hp.com/techreports/98/HPL-98-173.html
+    """
+    def __init__(self, maxsize=100, cache=None, keymap=None, ignore=None, tol=None, deep=False, threshold=None, sizeof=None, cost=None):
+        if cache is None: cache = archive_dict()
+        elif type(cache) is dict: cache = archive_dict(cache)
+
+        if ignore is None: ignore = tuple()
+
+        if deep: rounded = deep_round
+        else: rounded = simple_round
+       #else: rounded = shallow_round #FIXME: slow
+
+        @rounded(tol)
+        def rounded_args(*args, **kwds):
+            return (args, kwds)
+
+        # set state
+        self.__state__ = {
+            'maxsize': maxsize,
+            'cache': cache,
+            'keymap': keymap,
+            'ignore': ignore,
+            'roundargs': rounded_args,
+            'tol': tol,
+            'deep': deep,
+            'threshold': threshold,
+            'sizeof': sizeof,
+            'cost': cost,
+        }
+        return
+
+    def __call__(self, user_function):
+        from heapq import heappush, heappop, heapify
+        from itertools import count
+       #cache = dict()                  # mapping of args to results
+        heap = []                       # (priority, tick, key), lowest first
+        entries = {}                    # mapping of keys to (tick, use, weight)
+        clock = [0.]                    # priority of the last purged entry
+        tick = count()                  # order that priorities were set
+        stats = [0, 0, 0, 0, 0.]        # make statistics updateable non-locally
+        HIT, MISS, LOAD, SKIP, COST = 0, 1, 2, 3, 4 # names for the stats fields
+        skipped = [False]               # if fetch did not store the result
+        _len = len                      # localize the global len() function
+       #lock = RLock()                  # linkedlist updates aren't threadsafe
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        ignore = self.__state__['ignore']
+        rounded_args = self.__state__['roundargs']
+        threshold = self.__state__['threshold']
+        sizeof = self.__state__['sizeof'] or _sizeof
+        costof = self.__state__['cost']
+        hooks = _hooks(user_function, cache, self.__state__['keymap'], ignore, rounded_args, self.__state__['tol'])
+        batch = {}                      # results (and costs) computed by map
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
+
+        def rank(key, weight=None):
+            "record a use of the key, and update its priority"
+            t, use, _weight = entries.get(key, (None, 0, 0.))
+            if weight is None: weight = _weight
+            t, use = next(tick), use + 1
+            entries[key] = (t, use, weight)
+            heappush(heap, (clock[0] + use * weight, t, key))
+            # entries in heap with an old tick are stale, so remove them
+            if _len(heap) > 2 * _len(entries) + 100:
+                heap[:] = [i for i in heap if i[2] in entries and \
+                                              entries[i[2]][0] == i[1]]
+                heapify(heap)
+
+        def purge():
+            "purge the cache entry with the lowest priority"
+            while heap:
+                priority, t, key = heappop(heap)
+                if key in entries and entries[key][0] == t:
+                    clock[0] = priority
+                    del entries[key]
+                    cache.pop(key, None)
+                    return
+            # entries were not ranked (e.g. in a given cache), so purge any
+            key = next(iter(cache))
+            del cache[key]
+            entries.pop(key, None)
+
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
+            try:
+                # get cache entry
+                result = cache[key]
+                rank(key)
+                stats[HIT] += 1
+            except KeyError:
+                # if not in cache, look in archive
+                if cache.archived():
+                    load(key)
+                try:
+                    result = cache[key]
+                    rank(key, 0.)
+                    stats[LOAD] += 1
+                except KeyError:
+                    # if not found, then compute
+                    result, cost = batch[key] if key in batch else _timed(compute, *args, **kwds)
+                    if costof is not None: cost = costof(result)
+                    stats[MISS] += 1
+                    stats[COST] += cost
+                    if threshold is not None and cost < threshold:
+                        # too cheap to compute, so don't cache the result
+                        stats[SKIP] += 1
+                        skipped[0] = True
+                        return result
+                    cache[key] = result
+                    rank(key, cost / max(sizeof(result), 1))
+
+                # purge cache
+                if maxsize is not None and _len(cache) > maxsize:
+                    if cache.archived():
+                        dump()
+                        cache.clear()
+                        entries.clear()
+                        del heap[:]
+                    else: # purge lowest priority cache entries
+                        while _len(cache) > maxsize:
+                            purge()
             return result
 
+        def __get_cache():
+            """Get the cache"""
+            return cache
+
+        def __get_mask():
+            """Get the (ignore) mask"""
+            return ignore
+
+        def clear(keepstats=False):
+            """Clear the cache and statistics"""
+            cache.clear()
+            entries.clear()
+            del heap[:]
+            clock[0] = 0.
+            if not keepstats: stats[:] = [0, 0, 0, 0, 0.]
+
+        def info():
+            """Report cache statistics"""
+            return CostInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache), stats[SKIP], stats[COST], threshold)
+
+        wrapper = hooks.wrap(fetch, clear, stats, batch, partial(_timed, user_function), skipped=skipped)
+
+        # interface
+        wrapper.__wrapped__ = user_function
+        wrapper.info = info
+        wrapper.clear = clear
+        wrapper.load = cache.load
+        wrapper.dump = cache.dump
+        wrapper.archived = cache.archived
+        wrapper.__cache__ = __get_cache
+        wrapper.__mask__ = __get_mask
+        return update_wrapper(wrapper, user_function)
+
+    def __get__(self, obj, objtype):
+        """support instance methods"""
+        return partial(self.__call__, obj)
+
+    def __reduce__(self):
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        keymap = self.__state__['keymap']
+        ignore = self.__state__['ignore']
+        tol = self.__state__['tol']
+        deep = self.__state__['deep']
+        threshold = self.__state__['threshold']
+        sizeof = self.__state__['sizeof']
+        cost = self.__state__['cost']
+        return (self.__class__, (maxsize, cache, keymap, ignore, tol, deep, threshold, sizeof, cost))
+
+
+class vectorized_cache(object):
+    """element-wise cache decorator, for functions of a numpy array.
+
+    This decorator memoizes the return value for each element (i.e. row) of
+    the array given as the first argument to a function that is 'vectorized'
+    over its input, so that f(x)[i] depends only on x[i].  When called, the
+    keys for all rows are found (with a single hash of each row's bytes), and
+    the function is called once, on the sub-array of rows that have not been
+    cached.  The results are then merged with the cached results, and returned
+    in the order of the input.  Any other arguments are included in the keys.
+    For caches with an archive, the full cache dumps to archive upon reaching
+    maxsize.  For caches without an archive, the oldest entries are purged.
+    This decorator takes an integer tolerance 'tol', equal to the number of
+    decimal places to which it will round off floats in the input array when
+    generating keys; rounding is not applied to the calculation of new results.
+
+    maxsize = maximum cache size (default is None, i.e. unbounded)
+    cache = storage hashmap (default is {})
+    keymap = cache key encoder (default is keymaps.hashmap(flat=True))
+    tol = integer tolerance for rounding (default is None)
+
+    If *keymap* is given, it will replace the hashing algorithm for generating
+    cache keys. The keymap is given (row, dtype, *args, **kwds), where row is
+    the bytes of the row of the input array and dtype includes the row shape.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
+
+    View cache statistics (hit, miss, load, maxsize, size) with f.info(), where
+    statistics are counted for each unique row.  Clear the cache and statistics
+    with f.clear().  Replace the cache archive with f.archive(obj).  Load from
+    the archive with f.load(), and dump from the cache to the archive with
+    f.dump().
+
+    For example:
+    >>> @vectorized_cache()
+    ... def squared(x):
+    ...     return x**2
+    ...
+    >>> squared(np.arange(5))
+    array([ 0,  1,  4,  9, 16])
+    >>> squared(np.arange(3, 8)) # only computes squared(array([5, 6, 7]))
+    array([ 9, 16, 25, 36, 49])
+    """
+    def __init__(self, maxsize=None, cache=None, keymap=None, tol=None):
+        if cache is None: cache = archive_dict()
+        elif type(cache) is dict: cache = archive_dict(cache)
+
+        # set state
+        self.__state__ = {
+            'maxsize': maxsize,
+            'cache': cache,
+            'keymap': keymap,
+            'tol': tol,
+        }
+        return
+
+    def __call__(self, user_function):
+        from collections import deque
+        import numpy as np
+       #cache = dict()                  # mapping of keys to results
+        queue = deque()                 # order that keys have been stored
+        stats = [0, 0, 0]               # make statistics updateable non-locally
+        HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
+        _len = len                      # localize the global len() function
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        keymap = self.__state__['keymap']
+        tol = self.__state__['tol']
+        default = keymap is None        # if True, stabilize in archive()
+        keymap = [_keymap(keymap, cache)] # make keymap updateable non-locally
+
+        def rows(x):
+            "get the unique rows of x, with the indices of the rows in x"
+            x = np.asarray(x)
+            if tol is not None and x.dtype.kind in 'fc':
+                x = x.round(tol)
+            dtype = '%s%s' % (x.dtype.str, x.shape[1:])
+            if x.dtype.hasobject: # hash the objects, not the pointers
+                x = np.array([repr(i).encode() for i in x.tolist()])
+            x = np.ascontiguousarray(x.reshape(_len(x), -1))
+            size = x.dtype.itemsize * x.shape[1]
+            void = x.view(np.dtype((np.void, size)))
+            void, first, inverse = np.unique(void.ravel(), return_index=True,
+                                             return_inverse=True)
+            void = void.tobytes() # the bytes of the unique rows
+            void = [void[i:i+size] for i in range(0, _len(void), size)]
+            return void, dtype, first, inverse.ravel()
+
+        def keys(x, *args, **kwds):
+            "get the keys for the unique rows of x, as (keys, first, inverse)"
+            void, dtype, first, inverse = rows(x)
+            return [keymap[0](row, dtype, *args, **kwds) for row in void], first, inverse
+
+        def wrapper(x, *args, **kwds):
+            x = np.asarray(x)
+            if not x.ndim: # a scalar
+                return wrapper(x.reshape(1), *args, **kwds)[0]
+            if not _len(x):
+                return np.asarray(user_function(x, *args, **kwds))
+            _keys, first, inverse = keys(x, *args, **kwds)
+            # the unique rows are sorted, so order the misses as in x
+            missing = [i for i in np.argsort(first) if _keys[i] not in cache]
+            stats[HIT] += _len(_keys) - _len(missing)
+            # look in archive, in a single batch
+            if missing and cache.archived():
+                cache.load(*(_keys[i] for i in missing))
+                loaded = _len(missing)
+                missing = [i for i in missing if _keys[i] not in cache]
+                stats[LOAD] += loaded - _len(missing)
+            results = [cache.get(k) for k in _keys]
+            if missing:
+                # compute only the missing rows, with a single call
+                new = user_function(x[first[missing]], *args, **kwds)
+                if _len(new) != _len(missing):
+                    msg = "%s returned %s results for %s inputs" % \
+                          (user_function.__name__, _len(new), _len(missing))
+                    raise ValueError(msg)
+                for (i,j) in zip(missing, new):
+                    results[i] = cache[_keys[i]] = j
+                    queue.append(_keys[i])
+                stats[MISS] += _len(missing)
+
+                # purge cache
+                if maxsize is not None and _len(cache) > maxsize:
+                    if cache.archived():
+                        cache.dump()
+                        cache.clear()
+                        queue.clear()
+                    else: # purge the oldest cache entries
+                        while _len(cache) > maxsize and queue:
+                            cache.pop(queue.popleft(), None)
+            # scatter the results to the rows of x
+            return np.array(results)[inverse]
+
         def archive(obj):
             """Replace the cache archive"""
+            stable = _stabilize(default, keymap[0], obj)
+            if stable is not keymap[0]: # the keys in the cache are stale
+                keymap[0] = stable
+                clear(keepstats=True)
+            if isinstance(obj, archive_dict): cache.archive = obj.archive
+            else: cache.archive = obj
+
+        def key(x, *args, **kwds):
+            """Get the cache keys for the rows of x, given *args,**kwds"""
+            _keys, first, inverse = keys(np.atleast_1d(x), *args, **kwds)
+            return [_keys[i] for i in inverse]
+
+        def lookup(x, *args, **kwds):
+            """Get the stored values for the rows of x, given *args,**kwds"""
+            return np.array([cache[k] for k in key(x, *args, **kwds)])
+
+        def __get_cache():
+            """Get the cache"""
+            return cache
+
+        def __get_keymap():
+            """Get the keymap"""
+            return keymap[0]
+
+        def clear(keepstats=False):
+            """Clear the cache and statistics"""
+            cache.clear()
+            queue.clear()
+            if not keepstats: stats[:] = [0, 0, 0]
+
+        def info():
+            """Report cache statistics"""
+            return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
+
+        # interface
+        wrapper.__wrapped__ = user_function
+        wrapper.info = info
+        wrapper.clear = clear
+        wrapper.load = cache.load
+        wrapper.dump = cache.dump
+        wrapper.archive = archive
+        wrapper.archived = cache.archived
+        wrapper.key = key
+        wrapper.lookup = lookup
+        wrapper.__cache__ = __get_cache
+        wrapper.__map__ = __get_keymap
+        return update_wrapper(wrapper, user_function)
+
+    def __get__(self, obj, objtype):
+        """support instance methods"""
+        return partial(self.__call__, obj)
+
+    def __reduce__(self):
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        keymap = self.__state__['keymap']
+        tol = self.__state__['tol']
+        return (self.__class__, (maxsize, cache, keymap, tol))
+
+
+class _axis(object):
+    "placeholder for an argument that is taken as coordinates of a point"
+    def __init__(self, shape):
+        self.shape = shape
+    def __repr__(self):
+        return "<axis %r>" % (self.shape,)
+    def __eq__(self, other):
+        return type(other) is _axis and other.shape == self.shape
+    def __ne__(self, other):
+        return not self == other
+    def __hash__(self):
+        return hash((_axis, self.shape))
+
+
+def _coordinates(args, kwds):
+    """split (*args, **kwds) into a point and the remaining (*args, **kwds)
+
+    Real numbers, numeric numpy arrays, and lists or tuples of real numbers
+    are taken as coordinates of the point (in the order of the args, then
+    the sorted kwds), and are replaced by placeholders with their shape."""
+    import sys
+    from numbers import Real
+    np = sys.modules.get('numpy') # arrays must come from an imported numpy
+    point = []
+    def split(value):
+        if isinstance(value, Real) and not isinstance(value, bool):
+            point.append(value)
+            return _axis(())
+        if np is not None and isinstance(value, np.ndarray):
+            if value.dtype.kind not in 'iuf': return value
+            point.extend(value.ravel().tolist())
+            return _axis(value.shape)
+        if type(value) in (list, tuple) and value and \
+           all(isinstance(i, Real) and not isinstance(i, bool) for i in value):
+            point.extend(value)
+            return _axis((type(value).__name__, len(value)))
+        return value
+    args = tuple(split(value) for value in args)
+    kwds = dict((k, split(kwds[k])) for k in sorted(kwds))
+    return tuple(point), args, kwds
+
+
+class nearest_cache(object):
+    """nearest-neighbor cache decorator.
+
+    This decorator memoizes a function's return value, and returns the stored
+    value for the nearest cached inputs that are within a given distance of
+    the inputs, instead of calling the function.  Numbers, numeric arrays,
+    and lists or tuples of numbers in the inputs are taken as the coordinates
+    of a point, where the euclidean distance between points is compared to
+    'radius'.  All other inputs must match exactly.  Keys are generated from
+    the point and the other inputs, so numeric arrays and lists need not be
+    hashable.  For caches with an
+    archive, the full cache dumps to archive upon reaching maxsize.  For caches
+    without an archive, the oldest cache entries are purged.
+
+    maxsize = maximum cache size (default is None, i.e. unbounded)
+    cache = storage hashmap (default is {})
+    keymap = cache key encoder (default is keymaps.hashmap(flat=True))
+    ignore = function argument names and indicies to 'ignore' (default is None)
+    radius = maximum distance to a stored input (default is 0, i.e. exact)
+    interpolate = if True, return the inverse-distance weighted average of the
+        stored values within radius, otherwise the nearest (default is False)
+
+    If *keymap* is given, it will replace the hashing algorithm for generating
+    cache keys.  Several hashing algorithms are available in 'keymaps'. The
+    default keymap requires arguments to the cached function to be hashable.
+    If the cache has a persistent archive (or is given one with f.archive), the
+    default keymap uses the process-stable hashmap(algorithm='stable'), as
+    python's hash is salted.
+
+    If the keymap retains type information, then arguments of different types
+    will be cached separately.  For example, f(3.0) and f(3) will be treated
+    as distinct calls with distinct results.  Cache typing has a memory penalty,
+    and may also be ignored by some 'keymaps'.
+
+    If *ignore* is given, the keymap will ignore the arguments with the names
+    and/or positional indicies provided. For example, if ignore=(0,), then
+    the key generated for f(1,2) will be identical to that of f(3,2) or f(4,2).
+    If ignore=('y',), then the key generated for f(x=3,y=4) will be identical
+    to that of f(x=3,y=0) or f(x=3,y=10). If ignore=('*','**'), all varargs
+    and varkwds will be 'ignored'.  Ignored arguments never change the key.
+    These are 'keymap'-based ignores, and will also be ignored in distances.
+
+    Stored values are found by grid hashing, where the cells are radius wide,
+    so a lookup checks the neighboring cells (or all stored points, if fewer).
+    Only inputs computed or looked up in the current session have a point, so
+    the archive is only searched for exact matches.  Values within radius are
+    never stored, thus the cache only holds results of the cached function.
+
+    View cache statistics (hit, miss, load, maxsize, size) with f.info(), where
+    a hit includes inputs within radius.  Clear the cache and statistics with
+    f.clear().  Replace the cache archive with f.archive(obj).  Load from the
+    archive with f.load(), and dump from the cache to the archive with f.dump().
+
+    For example:
+    >>> @nearest_cache(radius=0.1)
+    ... def squared(x):
+    ...     return x**2
+    ...
+    >>> squared(2.0)
+    4.0
+    >>> squared(2.05) # returns the value stored for squared(2.0)
+    4.0
+    """
+    def __init__(self, maxsize=None, cache=None, keymap=None, ignore=None, radius=0, interpolate=False):
+        if radius < 0: raise ValueError("radius must be non-negative")
+        if cache is None: cache = archive_dict()
+        elif type(cache) is dict: cache = archive_dict(cache)
+
+        if ignore is None: ignore = tuple()
+
+        # set state
+        self.__state__ = {
+            'maxsize': maxsize,
+            'cache': cache,
+            'keymap': keymap,
+            'ignore': ignore,
+            'radius': radius,
+            'interpolate': interpolate,
+        }
+        return
+
+    def __call__(self, user_function):
+        from collections import deque
+        from itertools import product
+        from math import floor
+        from klepto._inspect import _keygen
+       #cache = dict()                  # mapping of keys to results
+        queue = deque()                 # order that keys have been stored
+        points = {}                     # mapping of labels to {key: point}
+        grid = {}                       # mapping of (label, cell) to {key: point}
+        where = {}                      # mapping of keys to (label, cell)
+        stats = [0, 0, 0]               # make statistics updateable non-locally
+        HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
+        _len = len                      # localize the global len() function
+        maxsize = self.__state__['maxsize']
+        cache = self.__state__['cache']
+        keymap = self.__state__['keymap']
+        ignore = self.__state__['ignore']
+        default = keymap is None        # if True, stabilize in archive()
+        keymap = [_keymap(keymap, cache)] # make keymap updateable non-locally
+        radius = self.__state__['radius']
+        interpolate = self.__state__['interpolate']
+
+        def locate(*args, **kwds):
+            "get the key, label, point, and cell for the inputs"
+            args, kwds = _keygen(user_function, ignore, *args, **kwds)
+            point, args, kwds = _coordinates(args, kwds)
+            label = keymap[0](*args, **kwds) # the inputs that must match
+            key = keymap[0](point, *args, **kwds)
+            if not radius: # only exact matches, so don't index the point
+                return key, label, point, None
+            try:
+                cell = tuple(int(floor(i / radius)) for i in point)
+            except (ValueError, OverflowError): # nan or inf
+                cell = None
+            return key, label, point, cell
+
+        def store(key, label, point, cell):
+            "add the point for the key to the index"
+            if cell is None or key in where: return
+            points.setdefault(label, {})[key] = point
+            grid.setdefault((label, cell), {})[key] = point
+            where[key] = (label, cell)
+
+        def discard(key):
+            "remove the point for the key from the index"
+            label, cell = where.pop(key)
+            del points[label][key], grid[(label, cell)][key]
+            if not points[label]: del points[label]
+            if not grid[(label, cell)]: del grid[(label, cell)]
+
+        def neighbors(label, point, cell):
+            "get a list of (distance, key) for the stored points within radius"
+            if cell is None: return []
+            stored = points.get(label, {})
+            dim = _len(point)
+            # the 3**dim neighboring cells are searched only if fewer than the
+            # stored points, and are generated lazily (so a high dim is cheap)
+            if 3**dim < _len(stored): # search neighboring cells
+                found = []
+                for offset in product((-1, 0, 1), repeat=dim):
+                    near = tuple(i + j for (i, j) in zip(cell, offset))
+                    found.extend(grid.get((label, near), {}).items())
+            else: # search all stored points
+                found = stored.items()
+            found = ((sum((i - j)**2 for (i, j) in zip(p, point))**.5, k) \
+                     for (k, p) in found if _len(p) == dim)
+            return sorted(i for i in found if i[0] <= radius)
+
+        def nearest(label, point, cell):
+            "get the stored value for a point within radius, or raise KeyError"
+            found = neighbors(label, point, cell)
+            if not found:
+                raise KeyError(point)
+            distance, key = found[0]
+            if not interpolate or not distance:
+                return cache[key]
+            total = weight = 0
+            for (distance, key) in found:
+                total = total + cache[key] / distance
+                weight += 1. / distance
+            return total / weight
+
+        def wrapper(*args, **kwds):
+            key, label, point, cell = locate(*args, **kwds)
+            try:
+                # get cache entry
+                result = cache[key]
+                stats[HIT] += 1
+            except KeyError:
+                # if not in cache, look in archive
+                if cache.archived():
+                    cache.load(key)
+                try:
+                    result = cache[key]
+                    stats[LOAD] += 1
+                except KeyError:
+                    # if not found, look within radius
+                    try:
+                        result = nearest(label, point, cell)
+                        stats[HIT] += 1
+                        return result
+                    except KeyError:
+                        # if not found, then compute
+                        result = user_function(*args, **kwds)
+                        cache[key] = result
+                        stats[MISS] += 1
+                queue.append(key)
+            store(key, label, point, cell)
+
+            # purge cache
+            if maxsize is not None and _len(cache) > maxsize:
+                if cache.archived():
+                    cache.dump()
+                    cache.clear()
+                    queue.clear()
+                    for key in tuple(where): discard(key)
+                else: # purge the oldest cache entries
+                    while _len(cache) > maxsize and queue:
+                        key = queue.popleft()
+                        cache.pop(key, None)
+                        if key in where: discard(key)
+            return result
+
+        def archive(obj):
+            """Replace the cache archive"""
+            stable = _stabilize(default, keymap[0], obj)
+            if stable is not keymap[0]: # the keys in the cache are stale
+                keymap[0] = stable
+                clear(keepstats=True)
             if isinstance(obj, archive_dict): cache.archive = obj.archive
             else: cache.archive = obj
 
         def key(*args, **kwds):
             """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
+            return locate(*args, **kwds)[0]
 
         def lookup(*args, **kwds):
             """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
+            key, label, point, cell = locate(*args, **kwds)
+            if key in cache: return cache[key]
+            return nearest(label, point, cell)
 
         def __get_cache():
             """Get the cache"""
             return cache
 
-        def __get_mask():
-            """Get the (ignore) mask"""
-            return ignore
-
         def __get_keymap():
             """Get the keymap"""
-            return keymap
+            return keymap[0]
 
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
+            queue.clear()
+            for key in tuple(where): discard(key)
             if not keepstats: stats[:] = [0, 0, 0]
 
         def info():
@@ -1196,7 +2461,6 @@ class rr_cache(object):
 
         # interface
         wrapper.__wrapped__ = user_function
-        #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
         wrapper.info = info
         wrapper.clear = clear
         wrapper.load = cache.load
@@ -1206,9 +2470,7 @@ class rr_cache(object):
         wrapper.key = key
         wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
-        wrapper.__mask__ = __get_mask
         wrapper.__map__ = __get_keymap
-       #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
     def __get__(self, obj, objtype):
@@ -1220,9 +2482,9 @@ class rr_cache(object):
         cache = self.__state__['cache']
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
-        tol = self.__state__['tol']
-        deep = self.__state__['deep']
-        return (self.__class__, (maxsize, cache, keymap, ignore, tol, deep))
+        radius = self.__state__['radius']
+        interpolate = self.__state__['interpolate']
+        return (self.__class__, (maxsize, cache, keymap, ignore, radius, interpolate))
 
 
 if __name__ == '__main__':
@@ -8,66 +8,8 @@
 #FIXME: klepto's caches ignore names/index, however ignore should be in keymap
 
 import inspect
-def signature(func, variadic=True, markup=True, safe=False):
-    """get the input signature of a function
-
-    func: the function to inspect
-    variadic: if True, also return names of (*args, **kwds) used in func
-    markup: if True, show a "!" before any 'unsettable' parameters
-    safe: if True, return (None,None,None,None) instead of throwing an error
-
-    Returns a tuple of variable names and a dict of keywords with defaults.
-    If variadic=True, additionally return names of func's (*args, **kwds).
-
-    Python functions, methods, lambdas, and partials can be inspected.
-    If safe=False, non-python functions (e.g. builtins) will raise an error.
-
-    For partials, 'fixed' args correspond to positional arguments given in
-    when the partial was defined. Partials have 'unsettalble' parameters,
-    where, these parameters may be given as input but will throw errors.
-    If markup=True, 'unsettable' parameters are denoted by a prepended '!'.
-
-    For example:
-
-    >>> def bar(x,y,z,a=1,b=2,*args):
-    ...   return x+y+z+a+b
-    ... 
-    >>> signature(bar)
-    (('x', 'y', 'z', 'a', 'b'), {'a': 1, 'b': 2}, 'args', '')
-    >>> 
-    >>> # a partial with a 'fixed' x, thus x is 'unsettable' as a keyword
-    >>> p = partial(bar, 0)
-    >>> signature(p)
-    (('y', 'z', 'a', 'b'), {'a': 1, '!x': 0, 'b': 2}, 'args', '')
-    >>> p(0,1)  
-    4
-    >>> p(0,1,2,3,4,5)
-    6
-    >>> 
-    >>> # a partial where y is 'unsettable' as a positional argument
-    >>> p = partial(bar, y=10)
-    >>> signature(p)
-    (('x', '!y', 'z', 'a', 'b'), {'a': 1, 'y': 10, 'b': 2}, 'args', '')
-    >>> p(0,1,2)
-    Traceback (most recent call last):
-      File "<stdin>", line 1, in <module>
-    TypeError: bar() got multiple values for keyword argument 'y'
-    >>> p(0,z=2)
-    15
-    >>> p(0,y=1,z=2)
-    6
-    >>> 
-    >>> # a partial with a 'fixed' x, and positionally 'unsettable' b
-    >>> p = partial(bar, 0,b=10)
-    >>> signature(p)
-    (('y', 'z', 'a', '!b'), {'a': 1, '!x': 0, 'b': 10}, 'args', '')
-    >>> 
-    >>> # apply some options that reduce information content
-    >>> signature(p, markup=False)
-    (('y', 'z', 'a', 'b'), {'a': 1, 'b': 10}, 'args', '')
-    >>> signature(p, markup=False, variadic=False)
-    (('y', 'z', 'a', 'b'), {'a': 1, 'b': 10})
-    """
+def _signature(func, variadic=True, markup=True, safe=False):
+    "get the input signature of a function (see signature)"
     TINY_FAIL = None,None  #XXX: or (),{} ?
     LONG_FAIL = None,None,None,None #XXX: or (),{},'','' ?
     if safe and inspect.isbuiltin(func):
@@ -144,6 +86,116 @@ def signature(func, variadic=True, markup=True, safe=False):
     return explicit, defaults
 
 
+import weakref
+_signatures = weakref.WeakKeyDictionary() # {callable: {options: (stamp, sig)}}
+
+def _stamp(func):
+    """get the memo key, and the parts that determine the signature, of func
+
+    returns (owner, options, stamp), where owner is the object the signature
+    is stored on, options distinguishes bound from unbound methods, and stamp
+    changes when the signature may change (e.g. new __code__ or __defaults__).
+    Returns None if the signature of func should not be memoized."""
+    if inspect.isfunction(func):
+        return func, (), (func.__code__, func.__defaults__)
+    if inspect.ismethod(func):
+        owner = func.__func__
+        if not inspect.isfunction(owner):
+            return None
+        return owner, (bool(func.__self__),), _stamp(owner)[2]
+    try: # a partial
+        p_func, p_args, p_kwds = func.func, func.args, func.keywords
+    except AttributeError:
+        return None
+    stamp = _stamp(p_func)
+    if stamp is None: # e.g. a partial of a builtin
+        return None
+    return func, (), (p_func, p_args, dict(p_kwds or {})) + stamp[2]
+
+def signature(func, variadic=True, markup=True, safe=False):
+    """get the input signature of a function
+
+    func: the function to inspect
+    variadic: if True, also return names of (*args, **kwds) used in func
+    markup: if True, show a "!" before any 'unsettable' parameters
+    safe: if True, return (None,None,None,None) instead of throwing an error
+
+    Returns a tuple of variable names and a dict of keywords with defaults.
+    If variadic=True, additionally return names of func's (*args, **kwds).
+
+    Python functions, methods, lambdas, and partials can be inspected.
+    If safe=False, non-python functions (e.g. builtins) will raise an error.
+
+    For partials, 'fixed' args correspond to positional arguments given in
+    when the partial was defined. Partials have 'unsettalble' parameters,
+    where, these parameters may be given as input but will throw errors.
+    If markup=True, 'unsettable' parameters are denoted by a prepended '!'.
+
+    For example:
+
+    >>> def bar(x,y,z,a=1,b=2,*args):
+    ...   return x+y+z+a+b
+    ... 
+    >>> signature(bar)
+    (('x', 'y', 'z', 'a', 'b'), {'a': 1, 'b': 2}, 'args', '')
+    >>> 
+    >>> # a partial with a 'fixed' x, thus x is 'unsettable' as a keyword
+    >>> p = partial(bar, 0)
+    >>> signature(p)
+    (('y', 'z', 'a', 'b'), {'a': 1, '!x': 0, 'b': 2}, 'args', '')
+    >>> p(0,1)  
+    4
+    >>> p(0,1,2,3,4,5)
+    6
+    >>> 
+    >>> # a partial where y is 'unsettable' as a positional argument
+    >>> p = partial(bar, y=10)
+    >>> signature(p)
+    (('x', '!y', 'z', 'a', 'b'), {'a': 1, 'y': 10, 'b': 2}, 'args', '')
+    >>> p(0,1,2)
+    Traceback (most recent call last):
+      File "<stdin>", line 1, in <module>
+    TypeError: bar() got multiple values for keyword argument 'y'
+    >>> p(0,z=2)
+    15
+    >>> p(0,y=1,z=2)
+    6
+    >>> 
+    >>> # a partial with a 'fixed' x, and positionally 'unsettable' b
+    >>> p = partial(bar, 0,b=10)
+    >>> signature(p)
+    (('y', 'z', 'a', '!b'), {'a': 1, '!x': 0, 'b': 10}, 'args', '')
+    >>> 
+    >>> # apply some options that reduce information content
+    >>> signature(p, markup=False)
+    (('y', 'z', 'a', 'b'), {'a': 1, 'b': 10}, 'args', '')
+    >>> signature(p, markup=False, variadic=False)
+    (('y', 'z', 'a', 'b'), {'a': 1, 'b': 10})
+
+    Signatures of python functions, methods, and partials are memoized (with
+    weak references), and recomputed if a function's code or defaults change.
+    """
+    stamp = _stamp(func)
+    if stamp is None:
+        return _signature(func, variadic, markup, safe)
+    owner, options, stamp = stamp
+    options += (variadic, markup, safe)
+    try:
+        memo = _signatures[owner]
+    except KeyError:
+        memo = _signatures.setdefault(owner, {})
+    except TypeError: # can't be weakly referenced
+        return _signature(func, variadic, markup, safe)
+    try:
+        old, sig = memo[options]
+        if old != stamp: raise KeyError(options) # code or defaults changed
+    except KeyError:
+        sig = _signature(func, variadic, markup, safe)
+        memo[options] = (stamp, sig)
+    # the defaults are returned as a new dict, as callers may modify it
+    return sig[:1] + (None if sig[1] is None else dict(sig[1]),) + sig[2:]
+
+
 import sys
 def isvalid(func, *args, **kwds):
     """check if func(*args,**kwds) is a valid call for function 'func'
@@ -469,4 +521,96 @@ def _keygen(func, ignored, *args, **kwds):
     return user_args, user_kwds
 
 
+def _fastkey(func, keymap):
+    """build a function that returns the key for func(*args, **kwds), by
+    binding the arguments to a function with the same signature as func
+
+    func is the function being called
+    keymap is the keymap used to build the key from the function's inputs
+
+    returns None if func and keymap are not simple enough for a fast key,
+    otherwise returns a function that gives the same key as the keymap does
+    for _keygen(func, (), *args, **kwds), or raises a TypeError.
+
+    func must be a python function without varargs, varkwds, or keyword-only
+    arguments, and keymap must be a flat untyped keymap, hashmap or stringmap,
+    without a sentinel or an inner keymap."""
+    from klepto.keymaps import hashmap, stringmap
+    from klepto.crypto import hash as _hash, string
+    # the keymap must build (*args, sorted(**kwds)), and then hash or string
+    kind = type(keymap)
+    if kind not in (kleptokeymap, hashmap, stringmap) or not keymap.flat or \
+       keymap.typed or keymap._mark or keymap.inner or \
+       keymap._sorted is not sorted:
+        return None
+    if kind is kleptokeymap:
+        finish, extra = None, ()
+    elif kind is stringmap:
+        finish, extra = string, (keymap.__type__,)
+    elif keymap.__type__ is None: # python's hash
+        finish, extra = hash, ()
+    else:
+        finish, extra = _hash, (keymap.__type__, keymap.structural)
+    # the function must have a simple signature
+    if not inspect.isfunction(func) or \
+       getattr(func.__code__, 'co_kwonlyargcount', 0):
+        return None
+    try:
+        names, varargs, varkwds, defaults = inspect.getargspec(func)[:4]
+    except (TypeError, ValueError):
+        return None
+    if varargs or varkwds or not all(isinstance(i, str) for i in names):
+        return None
+    # generate: def key(x, y): return finish(('x', x, 'y', y), *extra)
+    extras = ('__finish__',) + tuple('__extra%s__' % i for i in range(len(extra)))
+    if set(extras).intersection(names):
+        return None
+    key = '(%s)' % ', '.join('%r, %s' % (i,i) for i in sorted(names))
+    if finish is not None:
+        key = '__finish__(%s)' % ', '.join((key,) + extras[1:])
+    code = 'def make(%s):\n  def key(%s):\n    return %s\n  return key\n'
+    code = code % (', '.join(extras), ', '.join(names), key)
+    glob = {}
+    exec(code, glob) # use a closure, so the key can be pickled
+    key = glob['make'](finish, *extra)
+    key.__defaults__ = func.__defaults__
+    return key
+
+
+def _keymaker(func, keymap, ignored=(), rounded_args=None, tol=None):
+    """get a function that returns the key for func(*args, **kwds)
+
+    func is the function being called
+    keymap is the keymap used to build the key from the function's inputs
+    ignored is the list of names and/or indicies to ignore
+    rounded_args is a function that rounds (*args, **kwds) to tolerance tol
+
+    The key is keymap(*_keygen(func, ignored, *rounded_args(*args, **kwds))),
+    however, a fast key builder (see _fastkey) is used when possible (i.e. if
+    there is nothing to ignore or round).  The fast key uses the current
+    __defaults__ of func, and is not used if the __code__ of func changes."""
+    def keyof(*args, **kwds):
+        if rounded_args is not None:
+            args, kwds = rounded_args(*args, **kwds)
+        args, kwds = _keygen(func, ignored, *args, **kwds)
+        return keymap(*args, **kwds)
+    if ignored or tol is not None:
+        return keyof
+    fast = _fastkey(func, keymap)
+    if fast is None:
+        return keyof
+    code = func.__code__
+    def fastkey(*args, **kwds):
+        if func.__code__ is not code: # the signature may have changed
+            return keyof(*args, **kwds)
+        if func.__defaults__ is not fast.__defaults__:
+            fast.__defaults__ = func.__defaults__
+        try:
+            return fast(*args, **kwds)
+        except TypeError: # an invalid call, or an unhashable argument
+            return keyof(*args, **kwds)
+    fastkey.__fast__ = fast
+    return fastkey
+
+
 # EOF
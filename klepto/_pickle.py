@@ -17,6 +17,10 @@ import traceback
 import sys
 import os
 import zlib
+import mmap
+import struct
+import threading
+import collections
 import warnings
 import dill # add some dill magic to pickle
 import pickle
@@ -45,11 +49,180 @@ else:
     Pickler = pickle.Pickler
     asbytes = str
 
+# pickle protocol 5 (python >= 3.8) can write buffers out-of-band
+PickleBuffer = getattr(pickle, 'PickleBuffer', None)
+
 _MEGA = 2 ** 20
 _MAX_LEN = len(hex(2 ** 64))
+_CHUNK = _MEGA
+_MIN_BUFFER = _MEGA // 16 # smaller buffers are pickled in-band
 
 # To detect file types
 _ZFILE_PREFIX = asbytes('ZF')
+# version 1 files store the length in hex ('0x...') after the prefix,
+# while later versions store a null byte followed by the version number
+_ZFILE_VERSION = 2
+_ZFILE_HEADER = struct.Struct('<2sBBB3xQI') # prefix,0,version,codec,len,chunk
+_ZFILE_FRAME = struct.Struct('<I') # compressed size of a block
+_ZFILE_INDEX = struct.Struct('<Q') # file offset of a block, or of the index
+
+
+def _cpu_count():
+    "the number of threads used to (de)compress blocks"
+    try:
+        from multiprocessing import cpu_count
+        return cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+
+def _view(data, start, stop):
+    "a slice of a buffer, without copying the data"
+    if sys.version_info[0] >= 3:
+        return memoryview(data)[start:stop]
+    return buffer(data, start, stop - start)
+
+
+def _pool(threads):
+    "a pool of threads to (de)compress blocks, or None for a single thread"
+    if threads < 2:
+        return None
+    # zlib releases the GIL, so blocks are (de)compressed in parallel
+    from multiprocessing.pool import ThreadPool
+    return ThreadPool(threads)
+
+
+def _close(pool):
+    "shut down a pool of threads created with _pool"
+    if pool is None: return
+    pool.close()
+    pool.join()
+
+
+###############################################################################
+# Codecs for compressing the blocks of a z-file
+
+class Codec(object):
+    """A compressor for the blocks of a z-file.
+
+    The codec id is written in the z-file header, so it must never change
+    once files have been written with the codec. The module that provides
+    the compressor is only imported when the codec is first used, thus
+    codecs that depend on optional packages can always be registered.
+    """
+    def __init__(self, name, id, module, compress, decompress):
+        """initialize a codec
+
+    Inputs:
+        name: name of the codec, as given to dump
+        id: integer (0 to 255) that identifies the codec in a z-file
+        module: name of the module that provides the compressor
+        compress: function of (module, data, level, typesize) that
+            returns the compressed data
+        decompress: function of (module, data) that returns the data
+        """
+        self.name = name
+        self.id = id
+        self.module = module
+        self._compress = compress
+        self._decompress = decompress
+        self.__module = None
+
+    def _import(self):
+        if self.__module is None:
+            self.__module = __import__(self.module, fromlist=['__name__'])
+        return self.__module
+
+    def available(self):
+        "check if the module required by the codec can be imported"
+        try:
+            self._import()
+        except ImportError:
+            return False
+        return True
+
+    def compress(self, data, level=1, typesize=1):
+        """compress the data, where typesize is the size (in bytes) of the
+        items in the data (used by codecs that shuffle bytes)"""
+        return self._compress(self._import(), data, level, typesize)
+
+    def decompress(self, data):
+        "decompress the data"
+        return self._decompress(self._import(), data)
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.name, self.id)
+
+
+_CODECS = {}    # name -> codec
+_CODEC_IDS = {} # id -> codec
+
+def register_codec(codec):
+    """register a Codec, so it can be used to dump and load z-files"""
+    other = _CODEC_IDS.get(codec.id)
+    if other is not None and other.name != codec.name:
+        raise ValueError("codec id %s is used by %r" % (codec.id, other))
+    _CODECS[codec.name] = _CODEC_IDS[codec.id] = codec
+
+
+def codecs():
+    """return a tuple of names of the available codecs"""
+    return tuple(sorted(name for (name, codec) in _CODECS.items() \
+                        if codec.available()))
+
+
+def _blosc(module, data, level, typesize):
+    return module.compress(bytes(data), typesize=typesize, clevel=level,
+                           shuffle=module.SHUFFLE)
+
+register_codec(Codec('zlib', 0, 'zlib',
+               lambda zlib, data, level, typesize: zlib.compress(data, level),
+               lambda zlib, data: zlib.decompress(data)))
+register_codec(Codec('bz2', 1, 'bz2',
+               lambda bz2, data, level, typesize: \
+                   bz2.compress(data, min(max(level, 1), 9)),
+               lambda bz2, data: bz2.decompress(data)))
+register_codec(Codec('lzma', 2, 'lzma',
+               lambda lzma, data, level, typesize: \
+                   lzma.compress(data, preset=min(level, 9)),
+               lambda lzma, data: lzma.decompress(data)))
+register_codec(Codec('lz4', 3, 'lz4.frame',
+               lambda lz4, data, level, typesize: \
+                   lz4.compress(data, compression_level=level),
+               lambda lz4, data: lz4.decompress(data)))
+register_codec(Codec('zstd', 4, 'zstandard',
+               lambda zstd, data, level, typesize: \
+                   zstd.ZstdCompressor(level=level).compress(data),
+               lambda zstd, data: zstd.ZstdDecompressor().decompress(data)))
+register_codec(Codec('blosc', 5, 'blosc', _blosc,
+               lambda blosc, data: blosc.decompress(data)))
+
+
+def _get_codec(name):
+    """get the codec used to write a z-file, falling back to zlib (with a
+    warning) when the codec is not available"""
+    if name is None:
+        name = 'zlib'
+    codec = _CODECS.get(name)
+    if codec is None:
+        raise ValueError("unknown codec %r, use one of %s" % (name, codecs()))
+    if not codec.available():
+        warnings.warn("codec '%s' requires '%s', which is not installed; "
+                      "using 'zlib' instead" % (name, codec.module),
+                      Warning, stacklevel=3)
+        codec = _CODECS['zlib']
+    return codec
+
+
+def _find_codec(id):
+    "get the codec used to read a z-file, given the codec id"
+    codec = _CODEC_IDS.get(id)
+    if codec is None:
+        raise IOError("Unknown codec id %s in z-file" % id)
+    if not codec.available():
+        raise ImportError("z-file was compressed with '%s', which requires "
+                          "'%s'" % (codec.name, codec.module))
+    return codec
 
 
 ###############################################################################
@@ -65,43 +238,243 @@ def _read_magic(file_handle):
     return magic
 
 
-def read_zfile(file_handle):
+def _read_header(file_handle):
+    """Read the header of the z-file, and return a tuple of
+    (version, codec, length, chunksize)
+
+    The file handle is left at the start of the compressed data.
+    """
+    file_handle.seek(0)
+    header = file_handle.read(len(_ZFILE_PREFIX) + _MAX_LEN)
+    assert header[:len(_ZFILE_PREFIX)] == _ZFILE_PREFIX, \
+        "File does not have the right magic"
+    if header[len(_ZFILE_PREFIX):].startswith(asbytes('0x')): # version 1
+        length = int(header[len(_ZFILE_PREFIX):], 16)
+        return 1, 0, length, None
+    header = header[:_ZFILE_HEADER.size]
+    _, _, version, codec, length, chunksize = _ZFILE_HEADER.unpack(header)
+    if version > _ZFILE_VERSION:
+        raise IOError("Unsupported z-file version %s" % version)
+    file_handle.seek(_ZFILE_HEADER.size)
+    return version, codec, length, chunksize
+
+
+def _read_frame(file_handle):
+    "Read the next compressed block from the z-file"
+    size, = _ZFILE_FRAME.unpack(file_handle.read(_ZFILE_FRAME.size))
+    return file_handle.read(size)
+
+
+def read_zfile(file_handle, threads=None):
     """Read the z-file and return the content as a string
 
     Z-files are raw data compressed with zlib used internally
     for persistence. Backward compatibility is not guaranteed. Do not
     use for external purposes.
     """
-    file_handle.seek(0)
-    assert _read_magic(file_handle) == _ZFILE_PREFIX, \
-        "File does not have the right magic"
-    length = file_handle.read(len(_ZFILE_PREFIX) + _MAX_LEN)
-    length = length[len(_ZFILE_PREFIX):]
-    length = int(length, 16)
-    # We use the known length of the data to tell Zlib the size of the
-    # buffer to allocate.
-    data = zlib.decompress(file_handle.read(), 15, length)
+    version, codec, length, chunksize = _read_header(file_handle)
+    if version == 1:
+        # We use the known length of the data to tell Zlib the size of the
+        # buffer to allocate.
+        data = zlib.decompress(file_handle.read(), 15, length)
+    else:
+        decompress = _find_codec(codec).decompress
+        # blocks are decompressed in batches, one block per thread
+        if threads is None: threads = _cpu_count()
+        nblocks = -(-length // chunksize)
+        pool = _pool(min(threads, nblocks))
+        _map = map if pool is None else pool.map
+        data = []
+        try:
+            while nblocks:
+                batch = [_read_frame(file_handle) \
+                         for i in range(min(threads, nblocks))]
+                nblocks -= len(batch)
+                data.extend(_map(decompress, batch))
+        finally:
+            _close(pool)
+        data = asbytes('').join(data)
     assert len(data) == length, (
         "Incorrect data length while decompressing %s."
         "The file could be corrupted." % file_handle)
     return data
 
 
-def write_zfile(file_handle, data, compress=1):
+def write_zfile(file_handle, data, compress=1, chunksize=_CHUNK, threads=None,
+                codec=None, typesize=1):
     """Write the data in the given file as a Z-file.
 
     Z-files are raw data compressed with zlib used internally
     for persistence. Backward compatibility is not guarantied. Do not
     use for external purposes.
+
+    The data is compressed in blocks of chunksize bytes, using the given
+    number of threads (by default, the number of cpus), and the named
+    codec (by default, zlib). For codecs that shuffle bytes, typesize is
+    the size (in bytes) of the items in the data.
+    """
+    zfile = ZFileWriter(file_handle, compress, chunksize, threads,
+                        codec, typesize)
+    zfile.write(data)
+    zfile._finalize() # leave the file handle open
+
+
+class ZFileWriter(object):
+    """A write-only file-like object that writes a (version 2) Z-file.
+
+    Written data is buffered until there are enough full blocks for all
+    threads, which are then compressed in parallel and written to the file
+    as frames of (size, compressed block). Closing the file writes the
+    remaining data, an index of block offsets, and the header. Thus, the
+    buffered data never exceeds chunksize * threads bytes.
+
+    The file handle must be seekable, and is closed by close().
+    """
+    def __init__(self, file_handle, compress=1, chunksize=_CHUNK, threads=None,
+                 codec=None, typesize=1):
+        self.file = file_handle
+        self.compress = compress
+        self.codec = _get_codec(codec)
+        self.typesize = typesize
+        self.chunksize = chunksize
+        self.threads = max(_cpu_count() if threads is None else threads, 1)
+        self.closed = False
+        self._pool = None   # the threads, started when there are blocks
+        self._start = file_handle.tell()
+        self._buffer = []   # data waiting to be compressed
+        self._size = 0      # the size of the buffered data
+        self._length = 0    # the total size of the (uncompressed) data
+        self._offsets = []  # the file offset of each block
+        # reserve space for the header, which is written on close
+        self.file.write(asbytes('\0') * _ZFILE_HEADER.size)
+
+    def write(self, data):
+        size = len(data)
+        if not size: return
+        if not self._buffer and size >= self.chunksize:
+            # write full blocks directly from the data, to avoid a copy
+            full = size - size % self.chunksize
+            self._compress(data, full)
+            if full == size: return
+            data = bytes(_view(data, full, size)) # copy the remainder
+            size -= full
+        self._buffer.append(data)
+        self._size += size
+        if self._size >= self.chunksize * self.threads:
+            self._flush()
+
+    def flush(self):
+        if not self.closed: self.file.flush()
+
+    def _flush(self, final=False):
+        "compress the buffered data (only full blocks, unless final)"
+        data = asbytes('').join(self._buffer)
+        size = len(data)
+        full = size if final else size - size % self.chunksize
+        self._buffer = [data[full:]] if full < size else []
+        self._size = size - full
+        self._compress(data, full)
+
+    def _compress(self, data, size):
+        "compress and write the first size bytes of data, in blocks"
+        chunk = self.chunksize
+        blocks = [_view(data, i, min(i + chunk, size)) \
+                  for i in range(0, size, chunk)]
+        if len(blocks) > 1 and self._pool is None:
+            self._pool = _pool(self.threads)
+        _map = map if self._pool is None else self._pool.map
+        compress = lambda block: \
+            self.codec.compress(block, self.compress, self.typesize)
+        # compress a batch of (at most) one block per thread at a time
+        step = self.threads
+        for i in range(0, len(blocks), step):
+            for block in _map(compress, blocks[i:i+step]):
+                self._offsets.append(self.file.tell())
+                self.file.write(_ZFILE_FRAME.pack(len(block)))
+                self.file.write(block)
+        self._length += size
+
+    def close(self):
+        if self.closed: return
+        try:
+            self._finalize()
+        finally:
+            self.file.close()
+
+    def _finalize(self):
+        "write the remaining data, the block index, and the header"
+        if self.closed: return
+        self.closed = True
+        try:
+            self._flush(final=True)
+        finally:
+            _close(self._pool)
+        # write the block index, and then the offset of the index
+        index = self.file.tell()
+        for offset in self._offsets:
+            self.file.write(_ZFILE_INDEX.pack(offset))
+        self.file.write(_ZFILE_INDEX.pack(index))
+        end = self.file.tell()
+        self.file.seek(self._start)
+        self.file.write(_ZFILE_HEADER.pack(_ZFILE_PREFIX, 0, _ZFILE_VERSION,
+                        self.codec.id, self._length, self.chunksize))
+        self.file.seek(end)
+
+
+class ZFileReader(object):
+    """A read-only file-like object that decompresses a (version 2) Z-file.
+
+    Blocks are decompressed one at a time, as the data is read, so only
+    a single decompressed block is held in memory.
     """
-    file_handle.write(_ZFILE_PREFIX)
-    length = hex(len(data))
-    if sys.version_info[0] < 3 and type(length) is long:
-        # We need to remove the trailing 'L' in the hex representation
-        length = length[:-1]
-    # Store the length of the data
-    file_handle.write(asbytes(length.ljust(_MAX_LEN)))
-    file_handle.write(zlib.compress(asbytes(data), compress))
+    def __init__(self, file_handle):
+        version, codec, length, chunksize = _read_header(file_handle)
+        if version < 2:
+            raise IOError("Streaming requires a z-file of version >= 2")
+        self.file = file_handle
+        self.codec = _find_codec(codec)
+        self.length = length
+        self._blocks = -(-length // chunksize) # blocks left to read
+        self._data = asbytes('') # the current block
+        self._pos = 0            # the position in the current block
+
+    def _next(self):
+        "decompress the next block, returning False at the end of the data"
+        if not self._blocks: return False
+        self._blocks -= 1
+        self._data = self.codec.decompress(_read_frame(self.file))
+        self._pos = 0
+        return True
+
+    def read(self, size=-1):
+        data = []
+        while size:
+            if self._pos >= len(self._data) and not self._next(): break
+            stop = len(self._data) if size < 0 else self._pos + size
+            part = self._data[self._pos:stop]
+            self._pos += len(part)
+            if size > 0: size -= len(part)
+            data.append(part)
+        return asbytes('').join(data)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        data = []
+        while True:
+            if self._pos >= len(self._data) and not self._next(): break
+            stop = self._data.find(asbytes('\n'), self._pos) + 1
+            stop = stop or len(self._data)
+            data.append(self._data[self._pos:stop])
+            self._pos = stop
+            if data[-1].endswith(asbytes('\n')): break
+        return asbytes('').join(data)
+
+    def close(self):
+        self.file.close()
 
 
 ###############################################################################
@@ -128,22 +501,62 @@ class NDArrayWrapper(object):
         else:
             # Numpy does not have mmap_mode before 1.3
             array = unpickler.np.load(filename)
-        # Reconstruct subclasses. This does not work with old
-        # versions of numpy
-        if (hasattr(array, '__array_prepare__')
-                and not self.subclass in (unpickler.np.ndarray,
-                                      unpickler.np.memmap)):
+        return self._subclass(array, unpickler)
+
+    def _subclass(self, array, unpickler):
+        "Reconstruct the array subclass"
+        # Reconstruct subclasses (numpy >= 2 has no __array_prepare__,
+        # so the subclass is checked directly)
+        if not self.subclass in (unpickler.np.ndarray, unpickler.np.memmap):
             # We need to reconstruct another subclass
-            new_array = unpickler.np.core.multiarray._reconstruct(
-                    self.subclass, (0,), 'b')
-            new_array.__array_prepare__(array)
-            array = new_array
+            array = array.view(self.subclass)
         return array
 
     #def __reduce__(self):
     #    return None
 
 
+class BNDArrayWrapper(NDArrayWrapper):
+    """An object to be persisted instead of numpy arrays.
+
+    This object stores the name of the container file, in which the data
+    of many arrays are concatenated, and the offset, dtype, shape and order
+    of the data in the file. Each array in the file is aligned, so that it
+    can be memory-mapped.
+    """
+    def __init__(self, filename, offset, dtype, shape, order, subclass):
+        "Store the useful information for later"
+        self.filename = filename
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+        self.order = order
+        self.subclass = subclass
+
+    def read(self, unpickler):
+        "Reconstruct the array from the container file"
+        np = unpickler.np
+        filename = os.path.join(unpickler._dirname, self.filename)
+        count = int(np.prod(self.shape))
+        if unpickler.mmap_mode is None or not count:
+            blob = open(filename, 'rb')
+            try:
+                blob.seek(self.offset)
+                array = np.fromfile(blob, dtype=self.dtype, count=count)
+            finally:
+                blob.close()
+        else: # map the container file once, and view the data of each array
+            mode = {'w+': 'r+'}.get(unpickler.mmap_mode, unpickler.mmap_mode)
+            blobs = unpickler.__dict__.setdefault('_blobs', {})
+            blob = blobs.get(filename)
+            if blob is None:
+                blob = blobs[filename] = np.memmap(filename, mode=mode)
+            nbytes = count * self.dtype.itemsize
+            array = blob[self.offset:self.offset + nbytes].view(self.dtype)
+        array = array.reshape(self.shape, order=self.order)
+        return self._subclass(array, unpickler)
+
+
 class ZNDArrayWrapper(NDArrayWrapper):
     """An object to be persisted instead of numpy arrays.
 
@@ -170,13 +583,152 @@ class ZNDArrayWrapper(NDArrayWrapper):
         # Here we a simply reproducing the unpickling mechanism for numpy
         # arrays
         filename = os.path.join(unpickler._dirname, self.filename)
+        _, shape, dtype, is_fortran = self.state[:4]
+        if unpickler.mmap_mode in ('r', 'c') and not is_fortran and \
+           self.init_args[0] is unpickler.np.ndarray:
+            try: # read the array lazily
+                return ZArray(filename, dtype, shape, unpickler.mmap_mode)
+            except (IOError, ValueError): # the blocks are not whole rows
+                pass
         array = unpickler.np.core.multiarray._reconstruct(*self.init_args)
-        data = read_zfile(open(filename, 'rb'))
+        zfile = open(filename, 'rb')
+        try:
+            data = read_zfile(zfile)
+        finally:
+            zfile.close()
         state = self.state + (data,)
         array.__setstate__(state)
         return array
 
 
+class ZArray(object):
+    """A read-only array, that lazily reads slices from a compressed z-file.
+
+    A C-ordered array is written to a z-file in blocks of whole rows, thus
+    a slice of rows (along the first axis) only needs the blocks that hold
+    those rows. The block index of the z-file is used to seek to a block,
+    and the most recently used blocks are kept decompressed in memory.
+    Indexing a ZArray returns a numpy array, and a ZArray can be used
+    wherever numpy expects an array (through __array__).
+    """
+    def __init__(self, filename, dtype, shape, mode='r', cache=16):
+        """initialize a lazy array from a z-file
+
+    Inputs:
+        filename: name of the z-file that holds the array data
+        dtype: the numpy dtype of the array
+        shape: the shape of the array
+        mode: if 'c', return writable copies; else read-only arrays
+        cache: maximum number of decompressed blocks kept in memory
+        """
+        import numpy as np
+        self._np = np
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.mode = mode
+        self.cache = max(cache, 1)
+        self._file = open(filename, 'rb')
+        self._lock = threading.Lock()
+        try:
+            version, codec, length, chunksize = _read_header(self._file)
+            if version < 2:
+                raise IOError("Lazy arrays require a z-file of version >= 2")
+            self._codec = _find_codec(codec)
+            rowsize = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+            if not self.shape or not rowsize or chunksize % rowsize:
+                raise ValueError("z-file blocks do not hold whole rows")
+            self._rows = chunksize // rowsize # rows per block
+            # read the block index, using the offset stored at the end
+            self._file.seek(-_ZFILE_INDEX.size, os.SEEK_END)
+            index, = _ZFILE_INDEX.unpack(self._file.read(_ZFILE_INDEX.size))
+            nblocks = -(-length // chunksize)
+            self._file.seek(index)
+            self._offsets = struct.unpack('<%dQ' % nblocks,
+                                  self._file.read(_ZFILE_INDEX.size * nblocks))
+        except: # don't leak the file, if the array can't be read lazily
+            self._file.close()
+            raise
+        self._blocks = {} # block number -> decompressed rows
+        self._queue = collections.deque() # block numbers, most recent last
+
+    ndim = property(lambda self: len(self.shape))
+    size = property(lambda self: int(self._np.prod(self.shape)))
+    nbytes = property(lambda self: self.size * self.dtype.itemsize)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "%s(%r, dtype=%s, shape=%r)" % (self.__class__.__name__,
+                                   self.filename, self.dtype, self.shape)
+
+    def _block(self, i):
+        "get the rows held in block i"
+        with self._lock:
+            block = self._blocks.get(i)
+            if block is not None:
+                self._queue.remove(i)
+                self._queue.append(i)
+                return block
+            self._file.seek(self._offsets[i])
+            data = self._codec.decompress(_read_frame(self._file))
+            block = self._np.frombuffer(data, dtype=self.dtype)
+            block = block.reshape((-1,) + self.shape[1:])
+            if len(self._queue) >= self.cache:
+                del self._blocks[self._queue.popleft()]
+            self._blocks[i] = block
+            self._queue.append(i)
+            return block
+
+    def _slice(self, start, stop):
+        "get the rows from start to stop (with start <= stop)"
+        rows = self._rows
+        blocks = [self._block(i) for i in range(start // rows,
+                                                -(-stop // rows))]
+        offset = (start // rows) * rows
+        if len(blocks) == 1:
+            array = blocks[0][start - offset:stop - offset]
+            if self.mode == 'c': array = array.copy()
+        elif blocks:
+            array = self._np.concatenate(blocks)[start - offset:stop - offset]
+        else:
+            array = self._np.empty((0,) + self.shape[1:], dtype=self.dtype)
+        if self.mode != 'c': array.flags.writeable = False
+        return array
+
+    def __getitem__(self, key):
+        rest = ()
+        if isinstance(key, tuple) and key:
+            key, rest = key[0], key[1:]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            if step < 0: # read the rows, and then reverse them
+                start, stop = stop + 1, start + 1
+            array = self._slice(start, max(start, stop))[::step]
+            rest = (slice(None),) + rest if rest else rest
+        elif isinstance(key, (int, self._np.integer)):
+            index = int(key) + self.shape[0] if key < 0 else int(key)
+            if not 0 <= index < self.shape[0]:
+                raise IndexError("index %s is out of bounds for axis 0 "
+                                 "with size %s" % (key, self.shape[0]))
+            array = self._slice(index, index + 1)[0]
+        else: # fancy indexing reads the whole array
+            return self.__array__()[(key,) + rest if rest else key]
+        return array[rest] if rest else array
+
+    def __array__(self, dtype=None):
+        array = self._slice(0, self.shape[0])
+        if dtype is not None: array = array.astype(dtype)
+        return array
+
+    def close(self):
+        "close the z-file, and drop the decompressed blocks"
+        self._file.close()
+        self._blocks.clear()
+        self._queue.clear()
+
+
 ###############################################################################
 # Pickler classes
 
@@ -185,26 +737,43 @@ class NumpyPickler(Pickler):
 
         The main features of this object are:
 
-         * persistence of numpy arrays in separate .npy files, for which
-           I/O is fast.
+         * persistence of numpy arrays in a separate container file (or
+           in .npy files, for arrays of objects), for which I/O is fast.
 
          * optional compression using Zlib, with a special care on avoid
            temporaries.
+
+         * without compression, and with pickle protocol 5, persistence
+           of other large buffers (e.g. of bytes, bytearrays, and array
+           subclasses) in separate raw .buf files, which are memory-mapped
+           on load.
     """
+    _Pickler = Pickler # the base class
 
-    def __init__(self, filename, compress=0, cache_size=10):
+    def __init__(self, filename, compress=0, cache_size=10, codec=None):
         self._filename = filename
         self._filenames = [filename, ]
         self.cache_size = cache_size
         self.compress = compress
         if not self.compress:
             self.file = open(filename, 'wb')
-        else:
-            self.file = BytesIO()
+        else: # compress the pickle in blocks, as it is written
+            self.codec = _get_codec(codec).name
+            self.file = ZFileWriter(open(filename, 'wb'), compress,
+                                    codec=self.codec)
         # Count the number of npy files that we have created:
         self._npy_counter = 0
-        Pickler.__init__(self, self.file,
-                                protocol=dill.DEFAULT_PROTOCOL)
+        # Count the number of buf files that we have created:
+        self._buf_counter = 0
+        # The container file, where arrays are concatenated:
+        self._blob = None
+        kwds = {}
+        protocol = dill.DEFAULT_PROTOCOL
+        if self._buffers:
+            protocol = max(protocol, 5)
+            kwds['buffer_callback'] = self._write_buffer
+        self._Pickler.__init__(self, self.file,
+                                protocol=protocol, **kwds)
         # delayed import of numpy, to avoid tight coupling
         try:
             import numpy as np
@@ -213,7 +782,26 @@ class NumpyPickler(Pickler):
         self.np = np
 
     def _write_array(self, array, filename):
-        if not self.compress:
+        if not self.compress and not array.dtype.hasobject:
+            # Concatenate arrays in a container file: small arrays are
+            # aligned to 64 bytes, and large arrays to the page size
+            self._npy_counter -= 1 # the .npy filename is not used
+            filename = '%s_arrays.bin' % self._filename
+            if self._blob is None:
+                self._blob = open(filename, 'wb')
+            offset = self._blob.tell()
+            align = 4096 if array.nbytes >= 4096 else 64
+            if offset % align:
+                self._blob.write(asbytes('\0') * (align - offset % align))
+                offset += align - offset % align
+            order = 'F' if array.flags.f_contiguous and \
+                       not array.flags.c_contiguous else 'C'
+            data = array.T if order == 'F' else array
+            self._blob.write(self.np.ascontiguousarray(data).data)
+            container = BNDArrayWrapper(os.path.basename(filename), offset,
+                                        array.dtype, array.shape, order,
+                                        type(array))
+        elif not self.compress:
             self.np.save(filename, array)
             container = NDArrayWrapper(os.path.basename(filename),
                                        type(array))
@@ -223,21 +811,55 @@ class NumpyPickler(Pickler):
             # The meta data is stored in the container, and the core
             # numerics in a z-file
             _, init_args, state = array.__reduce__()
+            # blocks hold whole rows, so slices can be read lazily on load
+            rowsize = array.itemsize * int(self.np.prod(array.shape[1:]))
+            chunksize = max(_CHUNK // rowsize, 1) * rowsize if rowsize \
+                        else _CHUNK
             # the last entry of 'state' is the data itself
             zfile = open(filename, 'wb')
-            write_zfile(zfile, state[-1],
-                                compress=self.compress)
+            write_zfile(zfile, state[-1], compress=self.compress,
+                        chunksize=chunksize, codec=self.codec,
+                        typesize=array.itemsize)
             zfile.close()
             state = state[:-1]
             container = ZNDArrayWrapper(os.path.basename(filename),
                                             init_args, state)
         return container, filename
 
+    _buffers = property(lambda self: PickleBuffer is not None \
+                                     and not self.compress)
+
+    def _write_buffer(self, buffer):
+        """Write a large contiguous PickleBuffer to a raw .buf file.
+
+        Returns False if the buffer is written out-of-band, and True if
+        the buffer should be pickled in-band.
+        """
+        try:
+            data = buffer.raw()
+        except BufferError: # not contiguous
+            return True
+        if data.nbytes < _MIN_BUFFER:
+            return True
+        self._buf_counter += 1
+        filename = '%s_%02i.buf' % (self._filename, self._buf_counter)
+        bfile = open(filename, 'wb')
+        try:
+            bfile.write(data)
+        finally:
+            bfile.close()
+        self._filenames.append(filename)
+        return False
+
     def save(self, obj):
         """ Subclass the save method, to save ndarray subclasses in npy
             files, rather than pickling them. Of course, this is a
             total abuse of the Pickler class.
         """
+        if self._buffers and type(obj) in (bytes, bytearray) and \
+           len(obj) >= _MIN_BUFFER and self.memo.get(id(obj)) is None:
+            # reconstruct from a PickleBuffer, which is written out-of-band
+            return self.save_reduce(type(obj), (PickleBuffer(obj),), obj=obj)
         if self.np is not None and type(obj) in (self.np.ndarray,
                                             self.np.matrix, self.np.memmap):
             size = obj.size * obj.itemsize
@@ -254,7 +876,8 @@ class NumpyPickler(Pickler):
                                             self._npy_counter)
                 # This converts the array in a container
                 obj, filename = self._write_array(obj, filename)
-                self._filenames.append(filename)
+                if filename not in self._filenames:
+                    self._filenames.append(filename)
             except:
                 self._npy_counter -= 1
                 # XXX: We should have a logging mechanism
@@ -265,23 +888,107 @@ class NumpyPickler(Pickler):
 
     def close(self):
         if self.compress:
-            zfile = open(self._filename, 'wb')
-            write_zfile(zfile,
-                        self.file.getvalue(), self.compress)
-            zfile.close()
+            self.file.close()
+        if self._blob is not None:
+            self._blob.close()
+
+
+if sys.version_info[0] >= 3:
+  from types import FunctionType
+
+  class FastNumpyPickler(pickle.Pickler):
+    """A pickler to persist big data efficiently, using the C pickler.
+
+    Like NumpyPickler, numpy arrays and large buffers are persisted in
+    separate files, however here the persistent_id hook replaces them in
+    the pickle. Objects that the C pickler can't handle raise an error,
+    as do functions and classes defined in __main__ (which dill pickles
+    by value), and then NumpyPickler (with dill) should be used instead.
+    """
+    _Pickler = pickle.Pickler # the base class
+    __init__ = NumpyPickler.__init__
+    _write_array = NumpyPickler._write_array
+    _write_buffer = NumpyPickler._write_buffer
+    _buffers = NumpyPickler._buffers
+    close = NumpyPickler.close
+
+    def dump(self, obj):
+        self._persistent = {} # id -> (obj, persistent id)
+        return pickle.Pickler.dump(self, obj)
+
+    def persistent_id(self, obj):
+        """ Replace numpy arrays and large buffers by a persistent id,
+            after writing them to separate files.
+        """
+        kind = type(obj)
+        if kind is FunctionType or isinstance(obj, type):
+            if getattr(obj, '__module__', None) == '__main__':
+                raise pickle.PicklingError("%r is pickled by value" % obj)
+            return None
+        pid = self._persistent.get(id(obj))
+        if pid is not None:
+            return pid[1]
+        if self._buffers and kind in (bytes, bytearray) and \
+           len(obj) >= _MIN_BUFFER:
+            self._write_buffer(PickleBuffer(obj))
+            pid = ('buffer', self._buf_counter, kind is bytes)
+        elif self.np is not None and kind in (self.np.ndarray,
+                                            self.np.matrix, self.np.memmap):
+            size = obj.size * obj.itemsize
+            if self.compress and size < self.cache_size * _MEGA:
+                if kind is not self.np.memmap:
+                    return None
+                # Pickling doesn't work with memmaped arrays
+                pid = ('array', self.np.asarray(obj))
+            else:
+                self._npy_counter += 1
+                try:
+                    filename = '%s_%02i.npy' % (self._filename,
+                                                self._npy_counter)
+                    container, filename = self._write_array(obj, filename)
+                    if filename not in self._filenames:
+                        self._filenames.append(filename)
+                except:
+                    self._npy_counter -= 1
+                    # XXX: We should have a logging mechanism
+                    print('Failed to save %s to .npy file:\n%s' % (
+                            type(obj),
+                            traceback.format_exc()))
+                    return None
+                if type(container) is ZNDArrayWrapper:
+                    pid = ('zndarray', container.filename,
+                           container.init_args, container.state)
+                elif type(container) is BNDArrayWrapper:
+                    pid = ('bndarray', container.filename, container.offset,
+                           container.dtype, container.shape, container.order,
+                           container.subclass)
+                else:
+                    pid = ('ndarray', container.filename, container.subclass)
+        else:
+            return None
+        self._persistent[id(obj)] = (obj, pid)
+        return pid
+else:
+  FastNumpyPickler = None
 
 
 class NumpyUnpickler(Unpickler):
     """A subclass of the Unpickler to unpickle our numpy pickles.
     """
     dispatch = Unpickler.dispatch.copy()
+    _Unpickler = Unpickler # the base class
 
     def __init__(self, filename, file_handle, mmap_mode=None):
         self._filename = os.path.basename(filename)
         self._dirname = os.path.dirname(filename)
         self.mmap_mode = mmap_mode
         self.file_handle = self._open_pickle(file_handle)
-        Unpickler.__init__(self, self.file_handle)
+        if PickleBuffer is None:
+            self._Unpickler.__init__(self, self.file_handle)
+        else:
+            self._buffer_iter = self._read_buffers()
+            self._Unpickler.__init__(self, self.file_handle,
+                                     buffers=self._buffer_iter)
         try:
             import numpy as np
         except ImportError:
@@ -291,6 +998,27 @@ class NumpyUnpickler(Unpickler):
     def _open_pickle(self, file_handle):
         return file_handle
 
+    def _read_buffers(self):
+        """Yield the out-of-band buffers, memory-mapped from .buf files.
+
+        Buffers are mapped copy-on-write, unless the mmap_mode is 'r' (read
+        only) or 'r+' or 'w+' (written through to the file).
+        """
+        access = {'r': mmap.ACCESS_READ, 'r+': mmap.ACCESS_WRITE,
+                  'w+': mmap.ACCESS_WRITE}.get(self.mmap_mode, mmap.ACCESS_COPY)
+        mode = 'r+b' if access == mmap.ACCESS_WRITE else 'rb'
+        counter = 0
+        while True:
+            counter += 1
+            filename = os.path.join(self._dirname,
+                                    '%s_%02i.buf' % (self._filename, counter))
+            bfile = open(filename, mode)
+            try:
+                buffer = mmap.mmap(bfile.fileno(), 0, access=access)
+            finally:
+                bfile.close()
+            yield buffer
+
     def load_build(self):
         """ This method is called to set the state of a newly created
             object.
@@ -319,19 +1047,80 @@ class ZipNumpyUnpickler(NumpyUnpickler):
     """A subclass of our Unpickler to unpickle on the fly from
     compressed storage."""
 
-    def __init__(self, filename, file_handle):
+    def __init__(self, filename, file_handle, mmap_mode=None):
+        # arrays are read lazily (as a ZArray) when mmap_mode is 'r' or 'c'
         NumpyUnpickler.__init__(self, filename,
                                 file_handle,
-                                mmap_mode=None)
+                                mmap_mode=mmap_mode)
 
     def _open_pickle(self, file_handle):
-        return BytesIO(read_zfile(file_handle))
+        if _read_header(file_handle)[0] == 1:
+            return BytesIO(read_zfile(file_handle))
+        # decompress the pickle in blocks, as it is read
+        return ZFileReader(file_handle)
+
+
+class _LegacyPickle(Exception):
+    "raised when a pickle was written by NumpyPickler"
+    pass
+
+
+if sys.version_info[0] >= 3:
+  class FastNumpyUnpickler(pickle.Unpickler):
+    """An Unpickler for the pickles written by FastNumpyPickler, using the
+    C unpickler. Pickles written by NumpyPickler raise _LegacyPickle, and
+    then NumpyUnpickler (or ZipNumpyUnpickler) should be used instead.
+    """
+    _Unpickler = pickle.Unpickler # the base class
+    __init__ = NumpyUnpickler.__init__
+    _read_buffers = NumpyUnpickler._read_buffers
+
+    def _open_pickle(self, file_handle):
+        if _read_magic(file_handle) == _ZFILE_PREFIX:
+            return ZipNumpyUnpickler._open_pickle(self, file_handle)
+        return file_handle
+
+    def find_class(self, module, name):
+        if module == __name__ and name.endswith('NDArrayWrapper'):
+            raise _LegacyPickle(name)
+        return pickle.Unpickler.find_class(self, module, name)
+
+    def persistent_load(self, pid):
+        """ Reconstruct the numpy arrays and large buffers, given the
+            persistent id written by FastNumpyPickler.
+        """
+        kind = pid[0]
+        if kind == 'array':
+            return pid[1]
+        # objects with the same persistent id are loaded only once
+        loaded = self._loaded.get(pid)
+        if loaded is not None:
+            return loaded
+        if kind == 'buffer':
+            loaded = (bytes if pid[2] else bytearray)(next(self._buffer_iter))
+        elif self.np is None:
+            raise ImportError('Trying to unpickle an ndarray, '
+                    "but numpy didn't import correctly")
+        elif kind == 'zndarray':
+            loaded = ZNDArrayWrapper(*pid[1:]).read(self)
+        elif kind == 'bndarray':
+            loaded = BNDArrayWrapper(*pid[1:]).read(self)
+        else:
+            loaded = NDArrayWrapper(*pid[1:]).read(self)
+        self._loaded[pid] = loaded
+        return loaded
+
+    def load(self):
+        self._loaded = {} # persistent id -> loaded object
+        return pickle.Unpickler.load(self)
+else:
+  FastNumpyUnpickler = None
 
 
 ###############################################################################
 # Utility functions
 
-def dump(value, filename, compress=0, cache_size=100):
+def dump(value, filename, compress=0, cache_size=100, codec=None):
     """Fast persistence of an arbitrary Python object into a files, with
     dedicated storage for numpy arrays.
 
@@ -351,12 +1140,19 @@ def dump(value, filename, compress=0, cache_size=100):
         for in-memory compression. Note that this is just an order of
         magnitude estimate and that for big arrays, the code will go
         over this value at dump and at load time.
+    codec: string, optional
+        The name of the compressor used when compress is not 0, one of
+        codecs(). The default is 'zlib'. If the codec is not installed,
+        a warning is issued and 'zlib' is used instead.
 
     Returns
     -------
     filenames: list of strings
         The list of file names in which the data is stored. If
-        compress is false, each array is stored in a different file.
+        compress is false, the arrays are stored in a single container
+        file (except arrays of objects, which are each stored in a .npy
+        file), and each large buffer pickled out-of-band (with protocol 5)
+        is stored in a different file.
 
     See Also
     --------
@@ -364,10 +1160,12 @@ def dump(value, filename, compress=0, cache_size=100):
 
     Notes
     -----
-    Memmapping on load cannot be used for compressed files. Thus
-    using compression can significantly slow down loading. In
-    addition, compressed files take extra extra memory during
-    dump and load.
+    Memmapping on load cannot be used for compressed files, however
+    arrays larger than cache_size can be read lazily (see load). Thus
+    using compression can significantly slow down loading. Compressed
+    files are written in blocks, which are compressed in parallel on
+    dump and decompressed one at a time on load, so the extra memory
+    used is of the order of the block size times the number of cpus.
     """
     if compress is True:
         # By default, if compress is enabled, we want to be using 3 by
@@ -380,15 +1178,36 @@ def dump(value, filename, compress=0, cache_size=100):
               'Second argument should be a filename, %s (type %s) was given'
               % (filename, type(filename))
             )
+    if FastNumpyPickler is not None:
+        try:
+            return _dump(FastNumpyPickler, value, filename, compress=compress,
+                         cache_size=cache_size, codec=codec)
+        except Exception: # use dill, with the pure-python pickler
+            pass
+    return _dump(NumpyPickler, value, filename, compress=compress,
+                 cache_size=cache_size, codec=codec)
+
+
+def _dump(Pickler, value, filename, **kwds):
+    "dump the value to a file, using the given pickler class"
     try:
-        pickler = NumpyPickler(filename, compress=compress,
-                               cache_size=cache_size)
+        pickler = Pickler(filename, **kwds)
         pickler.dump(value)
         pickler.close()
+    except:
+        if 'pickler' in locals(): # remove the companion files
+            for name in pickler._filenames[1:]:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+        raise
     finally:
         if 'pickler' in locals() and hasattr(pickler, 'file'):
             pickler.file.flush()
             pickler.file.close()
+            if pickler._blob is not None:
+                pickler._blob.close()
     return pickler._filenames
 
 
@@ -400,8 +1219,9 @@ def load(filename, mmap_mode=None):
     filename: string
         The name of the file from which to load the object
     mmap_mode: {None, 'r+', 'r', 'w+', 'c'}, optional
-        If not None, the arrays are memory-mapped from the disk. This
-        mode has not effect for compressed files. Note that in this
+        If not None, the arrays are memory-mapped from the disk. For
+        compressed files, only 'r' and 'c' are used, and arrays stored
+        in separate z-files are read lazily as ZArrays. Note that in this
         case the reconstructed object might not longer match exactly
         the originally pickled object.
 
@@ -421,19 +1241,38 @@ def load(filename, mmap_mode=None):
     dump. If the mmap_mode argument is given, it is passed to np.load and
     arrays are loaded as memmaps. As a consequence, the reconstructed
     object might not match the original pickled object. Note that if the
-    file was saved with compression, the arrays cannot be memmaped.
+    file was saved with compression, the arrays cannot be memmaped, however
+    arrays larger than the cache_size given to dump are stored in separate
+    z-files and, with mmap_mode 'r' or 'c', only the blocks of rows that
+    are sliced are decompressed.
     """
     file_handle = open(filename, 'rb')
     # We are careful to open the file handle early and keep it open to
     # avoid race-conditions on renames. That said, if data are stored in
     # companion files, moving the directory will create a race when
     # trying to access the companion files.
-    if _read_magic(file_handle) == _ZFILE_PREFIX:
-        if mmap_mode is not None:
-            warnings.warn('file "%(filename)s" appears to be a zip, '
-                    'ignoring mmap_mode "%(mmap_mode)s" flag passed'
-                    % locals(), Warning, stacklevel=2)
-        unpickler = ZipNumpyUnpickler(filename, file_handle=file_handle)
+    zipped = _read_magic(file_handle) == _ZFILE_PREFIX
+    if zipped and mmap_mode not in (None, 'r', 'c'):
+        warnings.warn('file "%(filename)s" appears to be a zip, '
+                'ignoring mmap_mode "%(mmap_mode)s" flag passed'
+                % locals(), Warning, stacklevel=2)
+        mmap_mode = None
+    if FastNumpyUnpickler is not None:
+        unpickler = FastNumpyUnpickler(filename, file_handle=file_handle,
+                                       mmap_mode=mmap_mode)
+        try:
+            obj = unpickler.load()
+        except _LegacyPickle: # written with NumpyPickler
+            file_handle.seek(0)
+        except:
+            unpickler.file_handle.close()
+            raise
+        else:
+            unpickler.file_handle.close()
+            return obj
+    if zipped:
+        unpickler = ZipNumpyUnpickler(filename, file_handle=file_handle,
+                                      mmap_mode=mmap_mode)
     else:
         unpickler = NumpyUnpickler(filename,
                                    file_handle=file_handle,
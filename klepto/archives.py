@@ -64,8 +64,16 @@ class dir_archive(_dir_archive):
         cached: if True, use an in-memory cache interface to the archive
         serialized: if True, pickle file contents; otherwise save python objects
         compression: compression level (0 to 9) [default: 0 (no compression)]
+        codec: name of the compressor, one of _pickle.codecs() [default: 'zlib']
         memmode: access mode for files, one of {None, 'r+', 'r', 'w+', 'c'}
         memsize: approximate size (in MB) of cache for in-memory compression
+        workers: number of threads used to write entries in update [default: 1]
+        fsync: flush writes to disk, one of {None, 'data', 'full'} [default: None]
+        locked: if True, use a lock file to coordinate access between processes
+
+    With compression, and memmode 'r' or 'c', arrays (stored as whole rows)
+    are read lazily, so are returned as read-only ZArrays (see klepto._pickle)
+    instead of numpy arrays; use numpy.asarray to get a numpy array.
         """
         if dict is None: dict = {}
         archive = _dir_archive(name, **kwds)
@@ -83,6 +91,8 @@ class file_archive(_file_archive):
         dict: initial dictionary to seed the archive
         cached: if True, use an in-memory cache interface to the archive
         serialized: if True, pickle file contents; otherwise save python objects
+        fsync: flush writes to disk, one of {None, 'data', 'full'} [default: None]
+        locked: if True, use a lock file to coordinate access between processes
         """
         if dict is None: dict = {}
         archive = _file_archive(name, **kwds)
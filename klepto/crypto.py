@@ -11,6 +11,14 @@ import hashlib
 import pkgutil
 import encodings as codecs
 __hash = hash
+PYTHON2 = sys.version_info[0] < 3
+
+try: # fast non-cryptographic hashing
+    import xxhash
+    _xxhash = tuple(alg for alg in ('xxh32', 'xxh64', 'xxh3_64', 'xxh3_128', \
+                                    'xxh128') if hasattr(xxhash, alg))
+except ImportError:
+    _xxhash = ()
 
 def algorithms():
     """return a tuple of available hash algorithms"""
@@ -18,18 +26,271 @@ def algorithms():
         algs =  hashlib.algorithms
     except:
         algs = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
-    return (None,) + algs
+    # blake2 is fast (python >= 3.6)
+    algs += tuple(alg for alg in ('blake2b', 'blake2s') \
+                  if alg in getattr(hashlib, 'algorithms_available', ()))
+    return (None, 'stable') + algs + _xxhash
+
+def _hasher(algorithm):
+    "get a new hash object (with 'update' and 'hexdigest') for the algorithm"
+    if algorithm in _xxhash:
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+class _buffer(object):
+    "placeholder for an array (or memoryview), where repr gives the metadata"
+    def __init__(self, obj):
+        self.obj = obj
+    def __repr__(self):
+        obj = self.obj
+        if isinstance(obj, memoryview):
+            return "<memoryview %s %r>" % (obj.format, tuple(obj.shape))
+        return "<%s %s %r>" % (type(obj).__name__, obj.dtype.str, obj.shape)
+    def update(self, hasher):
+        "feed the data of the array (or memoryview) to the hasher"
+        obj = self.obj
+        if isinstance(obj, memoryview):
+            if not obj.c_contiguous: obj = obj.tobytes()
+        elif obj.dtype.hasobject: # hash the objects, not the pointers
+            obj = repr(obj.tolist()).encode()
+        else:
+            if not obj.flags.c_contiguous:
+                obj = obj.copy(order='C')
+            if obj.dtype.kind in 'mMV': # datetimes (or records) have no buffer
+                obj = obj.reshape(-1).view('u1')
+        hasher.update(obj)
+
+
+def _split(object, buffers):
+    """replace any arrays (or memoryviews) in object with placeholders,
+    appending the placeholders to the list of buffers
+
+    Arrays are found in (nested) tuples, lists, and dicts. The object is
+    returned unchanged if it has no arrays."""
+    kind = type(object)
+    if kind in (tuple, list):
+        size = len(buffers)
+        items = [_split(item, buffers) for item in object]
+        return object if size == len(buffers) else kind(items)
+    if kind is dict:
+        size = len(buffers)
+        items = [(_split(k, buffers), _split(v, buffers)) \
+                 for (k, v) in object.items()]
+        return object if size == len(buffers) else dict(items)
+    np = sys.modules.get('numpy') # arrays must come from an imported numpy
+    if (np is not None and isinstance(object, np.ndarray)) or \
+       (kind is memoryview and not PYTHON2):
+        object = _buffer(object)
+        buffers.append(object)
+    return object
+
+
+try:
+    _text = unicode
+    _ints = (int, long)
+except NameError:
+    _text = str
+    _ints = (int,)
+
+def _sized(tag, data):
+    "tag a bytes string, with the length prefixed"
+    return tag + str(len(data)).encode() + b':' + data
+
+def _stream(object, hasher, new, memo, stack):
+    """feed a canonical type-tagged encoding of object to the hasher
+
+    hasher: a hash object, with an 'update' method
+    new: function that returns a new (empty) hash object
+    memo: dict of {id: (encoding, object)} of the containers already encoded
+    stack: list of the ids of the (mutable) containers being encoded
+
+    Containers (and arrays) are fed as a tag and the digest of their items, so
+    a container is fed the same bytes wherever it appears.  The encoding of a
+    shared container is memoized, so it is only walked once.  A container that
+    contains itself is fed as a back-reference to its distance up the stack,
+    so only cycles depend on identity.  Tuples are not memoized, as equal
+    tuples are often distinct objects.  The items of dicts and sets are fed in
+    the order of their digests, so equal containers give the same hash
+    regardless of insertion order.
+
+    Returns the index in the stack of the outermost container referenced (or
+    the length of the stack, if there are no back-references)."""
+    depth = len(stack)
+    kind = type(object)
+    if object is None or kind is bool:
+        hasher.update(repr(object).encode()[:1])
+        return depth
+    if kind in _ints:
+        hasher.update(b'i' + str(object).encode() + b';')
+        return depth
+    if kind in (float, complex):
+        hasher.update(b'f' + repr(object).encode() + b';')
+        return depth
+    if kind is _text:
+        errors = 'strict' if PYTHON2 else 'surrogatepass'
+        hasher.update(_sized(b's', object.encode('utf_8', errors)))
+        return depth
+    if kind is bytes:
+        hasher.update(_sized(b'b', object))
+        return depth
+    np = sys.modules.get('numpy') # arrays must come from an imported numpy
+    array = (np is not None and isinstance(object, np.ndarray)) or \
+            (kind is memoryview and not PYTHON2)
+    if not array and kind not in (tuple, list, dict, set, frozenset):
+        name = '%s.%s' % (kind.__module__, getattr(kind, '__name__', kind))
+        hasher.update(_sized(b'o', name.encode()))
+        hasher.update(_sized(b'r', repr(object).encode()))
+        return depth
+    mutable = kind is not tuple
+    if mutable:
+        if id(object) in memo:
+            hasher.update(memo[id(object)][0])
+            return depth
+        if id(object) in stack: # a cycle
+            index = stack.index(id(object))
+            hasher.update(b'@' + str(depth - index).encode() + b';')
+            return index
+        stack.append(id(object))
+    reach = len(stack) # the outermost container referenced by the items
+    items = new()
+    try:
+        if array:
+            tag = b'a'
+            object = _buffer(object)
+            items.update(_sized(b'a', repr(object).encode()))
+            object.update(items)
+        elif kind in (tuple, list):
+            tag = b'(' if kind is tuple else b'['
+            items.update(str(len(object)).encode() + b':')
+            for item in object:
+                reach = min(reach, _stream(item, items, new, memo, stack))
+        else: # dict, set, or frozenset
+            tag = {dict: b'{', set: b'<', frozenset: b'>'}[kind]
+            items.update(str(len(object)).encode() + b':')
+            digests = []
+            pairs = object.items() if kind is dict else ((i,) for i in object)
+            for pair in pairs:
+                sub = new()
+                for part in pair:
+                    reach = min(reach, _stream(part, sub, new, memo, stack))
+                digests.append(sub.digest())
+            for digest in sorted(digests):
+                items.update(digest)
+    finally:
+        if mutable: stack.pop()
+    encoding = tag + items.digest()
+    # the encoding is the same elsewhere, unless it refers to outer containers
+    if mutable and reach >= depth:
+        memo[id(object if not array else object.obj)] = (encoding, object)
+    hasher.update(encoding)
+    return reach
 
-def hash(object, algorithm=None):
+
+# the types of objects that _number leaves unchanged
+_plain = frozenset((_ints[0], str, bytes, _text, type(None)))
+
+def _number(object):
+    """replace any numbers in object with the int (or float) they are equal to,
+    so (as with python's 'hash') equal numbers, such as 1, 1.0, and True, have
+    the same repr
+
+    Numbers are found in (nested) tuples, lists, and dicts. The object is
+    returned unchanged if it has no numbers to replace."""
+    kind = type(object)
+    if kind in _plain:
+        return object
+    if kind is bool or kind in _ints: # bool, or long
+        return int(object)
+    if isinstance(object, complex):
+        if object.imag: return object
+        object = object.real
+    if isinstance(object, float):
+        return int(object) if object.is_integer() else float(object)
+    if kind in (tuple, list):
+        for item in object:
+            if type(item) not in _plain: break
+        else: # no numbers to replace
+            return object
+        return kind([_number(item) for item in object])
+    if kind is dict:
+        for item in object.items():
+            if type(item[0]) not in _plain or type(item[1]) not in _plain: break
+        else: # no numbers to replace
+            return object
+        return dict((_number(k), _number(v)) for (k, v) in object.items())
+    return object
+
+
+def _stable(object, structural=False):
+    """seed-stable hash of object, as an int
+
+    Unlike python's 'hash' (which is salted for strings in each process), the
+    hash is the same in every process, so it can be used for persistent keys.
+    Unless structural, equal numbers give the same hash (see _number).
+    """
+    if not structural:
+        object = _number(object)
+    if type(object) in _ints:
+        return object
+    hasher = _STABLE()
+    _update(object, hasher, _STABLE if structural else None)
+    return int(hasher.hexdigest(), 16)
+
+try: # a fast 64-bit digest, so keys are small ints
+    from hashlib import blake2b
+    _STABLE = lambda : blake2b(digest_size=8)
+except ImportError:
+    _STABLE = lambda : hashlib.new('md5')
+
+
+def _update(object, hasher, new=None):
+    """feed the object to the hasher
+
+    If new is given, feed a canonical encoding of the object (see _stream),
+    where new is a function that returns a new (empty) hash object."""
+    if new is not None:
+        _stream(object, hasher, new, {}, [])
+        return
+    buffers = []
+    hasher.update(repr(_split(object, buffers)).encode())
+    for buffer in buffers:
+        buffer.update(hasher)
+    return
+
+
+def hash(object, algorithm=None, structural=False):
     if algorithm is None:
         return __hash(object)
-    return hashlib.new(algorithm, repr(object).encode()).hexdigest()
+    if algorithm == 'stable':
+        return _stable(object, structural)
+    hasher = _hasher(algorithm)
+    new = (lambda : _hasher(algorithm)) if structural else None
+    _update(object, hasher, new)
+    return hasher.hexdigest()
 hash.algorithms = algorithms
 hash.__doc__ = \
 """cryptographic hashing
 
     algorithm: one of %s
-    The default is algorithm=None, which uses python's 'hash'.""" % repr(algorithms())
+    structural: if True, hash a canonical encoding of object, not its repr
+    The default is algorithm=None, which uses python's 'hash'.
+
+    Python's 'hash' is salted for strings in each process, so it should not
+    be used for keys that persist. The algorithm='stable' is a fast hash that
+    (like python's 'hash') produces an int, but is the same in each process,
+    and (unless structural) gives equal numbers, such as 1 and 1.0, the same
+    hash.
+
+    Arrays and memoryviews are hashed by their data (and dtype and shape),
+    which is fed directly to the hash algorithm.
+
+    With structural=True, containers are walked and fed to the algorithm
+    item by item, so no large string is built. Equal dicts and sets give
+    the same hash regardless of their order, equal containers give the same
+    hash whether or not they are shared (and shared containers are only
+    walked once), and the types of items are included (so 1, 1.0, and True
+    give different hashes). Other objects are hashed by type and repr.""" % repr(algorithms())
 
 
 def encodings():
@@ -215,6 +215,7 @@ class hashmap(keymap):
         flat: if True, flatten the key to a sequence; if False, use (args, kwds)
         sentinel: marker for separating args and kwds in flattened keys
         algorithm: string name of hashing algorithm [default: use python's hash]
+        structural: if True, hash the structure of the key, instead of its repr
 
         This keymap stores function args and kwds as (args, kwds) if flat=False,
         or a flattened (*args, zip(**kwds)) if flat=True.  If typed, then
@@ -224,18 +225,30 @@ class hashmap(keymap):
         argstypes, and kwdstypes.
 
         Use kelpto.crypto.algorithms() to get the names of available hashing
-        algorithms.
+        algorithms.  If structural, nested containers are walked and streamed
+        to the hashing algorithm, so dicts and sets with different ordering
+        give the same key (see klepto.crypto.hash); this requires an algorithm.
         '''
         self.__type__ = kwds.pop('algorithm', None)
+        self.structural = kwds.pop('structural', False)
+        if self.structural and self.__type__ is None:
+            raise ValueError("structural hashing requires an algorithm")
         keymap.__init__(self, typed=typed, flat=flat, sentinel=sentinel, **kwds)
         self.__stub__ = 'algorithm' #XXX: unnecessary if unified kwd
         return
+    def __repr__(self):
+        msg = keymap.__repr__(self)
+        if self.structural:
+            msg, star = msg.rsplit(')', 1)
+            msg += '%sstructural=True)' % ('' if msg.endswith('(') else ', ')
+            msg += star
+        return msg
     def encode(self, *args, **kwds):
         """use a flattened scheme for generating a key"""
-        return hash(keymap.encode(self, *args, **kwds), algorithm=self.__type__)
+        return hash(keymap.encode(self, *args, **kwds), algorithm=self.__type__, structural=self.structural)
     def encrypt(self, *args, **kwds):
         """use a non-flat scheme for generating a key"""
-        return hash(keymap.encrypt(self, *args, **kwds), algorithm=self.__type__)
+        return hash(keymap.encrypt(self, *args, **kwds), algorithm=self.__type__, structural=self.structural)
 
 class stringmap(keymap):
     """tool for converting a function's input signature to an unique key
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+export the statistics of cached functions, in the OpenMetrics text format
+
+Cached functions are added to a process-wide registry with register, and the
+statistics of all registered functions are rendered with render, or served
+over HTTP with serve (for scraping by Prometheus, or a compatible collector).
+A registered function is observed (see f.observe), so evictions and dumps
+are counted from the time the function is registered.
+
+For example:
+    >>> from klepto import lru_cache, metrics
+    >>> @lru_cache(maxsize=100)
+    ... def f(x):
+    ...     return x
+    ...
+    >>> metrics.register(f)
+    >>> server = metrics.serve(port=9464)
+
+and then 'curl http://127.0.0.1:9464/metrics'.
+"""
+from __future__ import absolute_import
+import threading
+
+__all__ = ['counter', 'register', 'unregister', 'render', 'serve']
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+_registry = {} # mapping of name to (function, counter)
+_lock = threading.Lock()
+
+
+class counter(object):
+    """an observer that counts the events of a cached function
+
+    Observe a cached function f with f.observe(counter), and stop observing
+    with f.observe(counter, False).  Counts are kept for hit, miss, load, and
+    evict (the number of entries purged), and for dump (the number of entries
+    dumped to the archive)."""
+    def __init__(self):
+        self.hit = self.miss = self.load = self.evict = self.dump = 0
+        return
+    def on_hit(self, key):
+        self.hit += 1
+    def on_miss(self, key):
+        self.miss += 1
+    def on_load(self, key):
+        self.load += 1
+    def on_evict(self, count):
+        self.evict += count
+    def on_dump(self, count):
+        self.dump += count
+    def __repr__(self):
+        return "counter(hit=%s, miss=%s, load=%s, evict=%s, dump=%s)" % \
+               (self.hit, self.miss, self.load, self.evict, self.dump)
+
+
+def register(function, name=None):
+    """add a cached function to the registry, with the given name
+
+    The default name is the module and name of the function.  The registry
+    holds a reference to the function, until the function is unregistered."""
+    if name is None:
+        name = '%s.%s' % (function.__module__, function.__name__)
+    unregister(name)
+    events = counter()
+    function.observe(events)
+    with _lock:
+        _registry[name] = (function, events)
+    return
+
+
+def unregister(function):
+    "remove a cached function (or the function with the given name) from the registry"
+    with _lock:
+        if function in _registry: # a name
+            names = [function]
+        else:
+            names = [k for (k, v) in _registry.items() if v[0] is function]
+        removed = [_registry.pop(name) for name in names]
+    for (function, events) in removed:
+        function.observe(events, False)
+    return
+
+
+def _escape(value):
+    "escape a label value"
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _number(value):
+    "format a number"
+    if value == float('inf'): return '+Inf'
+    if isinstance(value, float): return repr(value)
+    return str(value)
+
+def _bytes(function, tries=3):
+    """get the total size of the results in memory (or None, if not in memory)
+
+    The results are copied before they are sized, as the function may change
+    them (in another thread) while rendering.  If they change while copied,
+    the copy is tried again, up to the given number of tries."""
+    from ._cache import _persistent, _sizeof
+    results = function.__cache__()
+    if getattr(results, 'archive', None) is results and _persistent(results):
+        return None # the cache is a persistent archive, not in memory
+    for i in range(tries):
+        try:
+            values = list(results.values())
+        except RuntimeError: # changed size during iteration
+            continue
+        return sum(_sizeof(result) for result in values)
+    return None
+
+# (name, type, help, function that gets the value from (info, counter, f))
+_METRICS = [
+    ('klepto_cache_hits', 'counter', 'Calls that found the result in the cache.',
+     lambda info, events, f: info.hit),
+    ('klepto_cache_misses', 'counter', 'Calls that computed the result.',
+     lambda info, events, f: info.miss),
+    ('klepto_cache_loads', 'counter', 'Calls that loaded the result from the archive.',
+     lambda info, events, f: info.load),
+    ('klepto_cache_skips', 'counter', 'Results not stored, for costing less than the threshold.',
+     lambda info, events, f: getattr(info, 'skip', None)),
+    ('klepto_cache_evictions', 'counter', 'Entries purged from the cache, since registered.',
+     lambda info, events, f: events.evict),
+    ('klepto_cache_dumps', 'counter', 'Entries dumped to the archive, since registered.',
+     lambda info, events, f: events.dump),
+    ('klepto_cache_size', 'gauge', 'Entries in the cache.',
+     lambda info, events, f: info.size),
+    ('klepto_cache_maxsize', 'gauge', 'Maximum entries in the cache.',
+     lambda info, events, f: float('inf') if info.maxsize is None else info.maxsize),
+    ('klepto_cache_bytes', 'gauge', 'Approximate size of the results in the cache.',
+     lambda info, events, f: _bytes(f)),
+]
+
+
+def render():
+    "get the statistics of all registered functions, in OpenMetrics text format"
+    with _lock:
+        registered = sorted(_registry.items())
+    samples = [(name, f.info(), events, f) for (name, (f, events)) in registered]
+    lines = []
+    for (metric, kind, help, value) in _METRICS:
+        values = [(name, value(info, events, f)) \
+                  for (name, info, events, f) in samples]
+        values = [(name, x) for (name, x) in values if x is not None]
+        if not values: continue # e.g. no function has skips
+        lines.append('# TYPE %s %s' % (metric, kind))
+        lines.append('# HELP %s %s' % (metric, help))
+        suffix = '_total' if kind == 'counter' else ''
+        for (name, x) in values:
+            lines.append('%s%s{function="%s"} %s' % \
+                         (metric, suffix, _escape(name), _number(x)))
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port=9464, address='127.0.0.1'):
+    """serve the statistics of all registered functions over HTTP
+
+    port = port to listen on (default is 9464; if 0, use any free port)
+    address = address to listen on (default is '127.0.0.1', i.e. local only)
+
+    Statistics are served at '/metrics', in OpenMetrics text format, by a
+    daemon thread.  Returns the server, where server.server_address gives the
+    (address, port), and server.shutdown() stops serving."""
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+    class handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass # don't log each scrape
+
+    server = HTTPServer((address, port), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# EOF
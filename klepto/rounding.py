@@ -13,10 +13,34 @@ __all__ = ['deep_round', 'shallow_round', 'simple_round']
 from klepto.tools import isiterable
 #FIXME: these seem *slow*... and a bit convoluted.  Maybe rewrite as classes?
 import sys
+from decimal import Decimal, InvalidOperation
 PYTHON3 = (hex(sys.hexversion) >= '0x30000f0')
 if PYTHON3:
   unicode = str
 
+def _round(obj, tol):
+  """round a numpy array (or scalar), a pandas object, or a Decimal as a
+  whole (i.e. without python-level loops over the elements).  Returns
+  NotImplemented for any other type of object.
+
+  Only floating point (and complex) data is rounded, thus arrays of ints
+  or objects are returned unchanged."""
+  if isinstance(obj, Decimal):
+    try:
+      return obj.quantize(Decimal(1).scaleb(-tol))
+    except InvalidOperation: # infinite, or too many digits
+      return obj
+  module = type(obj).__module__.split('.', 1)[0]
+  if module == 'numpy' and hasattr(obj, 'dtype'):
+    if obj.dtype.kind not in 'fc': return obj # don't round int
+    return obj.round(tol)
+  if module == 'pandas' and hasattr(obj, 'round'):
+    try: # DataFrames round only the numeric columns
+      return obj.round(tol)
+    except TypeError: # e.g. a Series of objects
+      return obj
+  return NotImplemented
+
 def deep_round_factory(tol):
   """helper function for deep_round (a factory for deep_round functions)"""
   def deep_round(*args, **kwds):
@@ -27,16 +51,22 @@ def deep_round_factory(tol):
       if isinstance(j, float): _args[i] = round(j, tol) # don't round int
       elif isinstance(j, (str, unicode, type(BaseException()))): continue
       elif isinstance(j, dict): _args[i] = deep_round(**j)[1]
-      elif isiterable(j): #XXX: fails on the above, so don't iterate them
-        jtype = type(j)
-        _args[i] = jtype(deep_round(*j)[0])
+      else: # round arrays (and Decimals) as a whole
+        k = _round(j, tol)
+        if k is not NotImplemented: _args[i] = k
+        elif isiterable(j): #XXX: fails on the above, so don't iterate them
+          jtype = type(j)
+          _args[i] = jtype(deep_round(*j)[0])
     for i,j in kwds.items():
       if isinstance(j, float): _kwds[i] = round(j, tol)
       elif isinstance(j, (str, unicode, type(BaseException()))): continue
       elif isinstance(j, dict): _kwds[i] = deep_round(**j)[1]
-      elif isiterable(j): #XXX: fails on the above, so don't iterate them
-        jtype = type(j)
-        _kwds[i] = jtype(deep_round(*j)[0])
+      else: # round arrays (and Decimals) as a whole
+        k = _round(j, tol)
+        if k is not NotImplemented: _kwds[i] = k
+        elif isiterable(j): #XXX: fails on the above, so don't iterate them
+          jtype = type(j)
+          _kwds[i] = jtype(deep_round(*j)[0])
     return argstype(_args), _kwds
   return deep_round
 
@@ -97,8 +127,14 @@ def simple_round_factory(tol):
     _kwds = kwds.copy()
     for i,j in enumerate(args):
       if isinstance(j, float): _args[i] = round(j, tol) # don't round int
+      elif not isinstance(j, (int, str, unicode)): # an array, or a Decimal
+        k = _round(j, tol)
+        if k is not NotImplemented: _args[i] = k
     for i,j in kwds.items():
       if isinstance(j, float): _kwds[i] = round(j, tol)
+      elif not isinstance(j, (int, str, unicode)):
+        k = _round(j, tol)
+        if k is not NotImplemented: _kwds[i] = k
     return argstype(_args), _kwds
   return simple_round
 
@@ -159,11 +195,15 @@ def shallow_round_factory(tol):
     _args = list(args)
     _kwds = kwds.copy()
     for i,j in enumerate(args):
+      k = _round(j, tol)
+      if k is not NotImplemented: _args[i] = k; continue
       try:
         jtype = type(j)
         _args[i] = jtype(around(j, tol))
       except: pass
     for i,j in kwds.items():
+      k = _round(j, tol)
+      if k is not NotImplemented: _kwds[i] = k; continue
       try:
         jtype = type(j)
         _kwds[i] = jtype(around(j, tol))
@@ -18,7 +18,7 @@ from klepto.archives import cache as archive_dict
 from klepto.keymaps import stringmap
 from klepto.tools import CacheInfo
 from klepto.rounding import deep_round, simple_round
-from ._inspect import _keygen
+from ._cache import _hooks
 
 __all__ = ['no_cache','inf_cache','lfu_cache',\
            'lru_cache','mru_cache','rr_cache']
@@ -116,57 +116,34 @@ class no_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
-        def wrapper(*args, **kwds):
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             # look in archive
             if cache.archived():
-                cache.load(key)
+                load(key)
             try:
                 result = cache[key]
                 cache.clear()
                 stats[LOAD] += 1
             except KeyError:
                 # if not found, then compute
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 cache[key] = result
                 stats[MISS] += 1
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
 
             # purge cache
             if _len(cache) > maxsize:
                 if cache.archived():
-                    cache.dump()
+                    dump()
                 cache.clear() 
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -175,10 +152,6 @@ class no_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             if not keepstats: stats[:] = [0, 0, 0]
@@ -187,6 +160,8 @@ class no_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -194,13 +169,9 @@ class no_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -303,17 +274,11 @@ class inf_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
-        def wrapper(*args, **kwds):
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -321,37 +286,20 @@ class inf_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = compute(*args, **kwds)
                     cache[key] = result
                     stats[MISS] += 1
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -360,10 +308,6 @@ class inf_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -373,6 +317,8 @@ class inf_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -380,13 +326,9 @@ class inf_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -500,17 +442,11 @@ class lfu_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
-        def wrapper(*args, **kwds):
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -519,14 +455,14 @@ class lfu_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     use_count[key] += 1
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = compute(*args, **kwds)
                     cache[key] = result
                     use_count[key] += 1
                     stats[MISS] += 1
@@ -534,7 +470,7 @@ class lfu_cache(object):
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
                         use_count.clear()
                     else: # purge least frequent cache entries
@@ -543,27 +479,10 @@ class lfu_cache(object):
                                               key=itemgetter(1)):
                             del cache[k], use_count[k]
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -572,10 +491,6 @@ class lfu_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -586,6 +501,8 @@ class lfu_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -593,13 +510,9 @@ class lfu_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = use_count #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -719,22 +632,16 @@ class lru_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
         maxqueue = maxsize * 10 #XXX: settable? confirm this works as expected
 
         # lookup optimizations (ugly but fast)
         queue_append, queue_popleft = queue.append, queue.popleft
         queue_appendleft, queue_pop = queue.appendleft, queue.pop
 
-        def wrapper(*args, **kwds):
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
-
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -745,7 +652,7 @@ class lru_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     # record recent use of this key
@@ -754,7 +661,7 @@ class lru_cache(object):
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = compute(*args, **kwds)
                     cache[key] = result
                     # record recent use of this key
                     queue_append(key)
@@ -764,7 +671,7 @@ class lru_cache(object):
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
                         queue.clear()
                         refcount.clear()
@@ -776,7 +683,7 @@ class lru_cache(object):
                             refcount[key] -= 1
                         del cache[key], refcount[key]
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
                 return result
 
@@ -791,23 +698,6 @@ class lru_cache(object):
                     refcount[key] = 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -816,10 +706,6 @@ class lru_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
@@ -831,6 +717,8 @@ class lru_cache(object):
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -838,13 +726,9 @@ class lru_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = queue #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -946,9 +830,11 @@ class mru_cache(object):
         return
 
     def __call__(self, user_function):
-        from collections import deque
        #cache = dict()                  # mapping of args to results
-        queue = deque()                 # order that keys have been used
+        root = []                       # root of the circular linked list
+        root[:] = [root, root, None]    # links are [PREV, NEXT, KEY]
+        links = {}                      # mapping of keys to links
+        PREV, NEXT, KEY = 0, 1, 2       # names for the link fields
         stats = [0, 0, 0]               # make statistics updateable non-locally
         HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
         _len = len                      # localize the global len() function
@@ -958,73 +844,62 @@ class mru_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
 
         # lookup optimizations (ugly but fast)
-        queue_append, queue_popleft = queue.append, queue.popleft
-        queue_appendleft, queue_pop = queue.appendleft, queue.pop
-
-        def wrapper(*args, **kwds):
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
+        links_get = links.get
 
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
-                queue.remove(key)
                 stats[HIT] += 1
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = compute(*args, **kwds)
                     cache[key] = result
                     stats[MISS] += 1
 
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
-                        queue.clear()
-                    else: # purge most recently used cache entry
-                        del cache[queue_pop()]
+                        links.clear()
+                        root[:] = [root, root, None]
+                    elif root[PREV] is not root:
+                        # purge most recently used cache entry
+                        last = root[PREV]
+                        root[PREV] = last[PREV]
+                        last[PREV][NEXT] = root
+                        del links[last[KEY]]
+                        cache.pop(last[KEY], None)
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
                 return result
 
-            # record recent use of this key
-            queue_append(key)
+            # record recent use of this key (move its link to the end)
+            link = links_get(key)
+            if link is None:
+                link = links[key] = [None, None, key]
+            else:
+                link[PREV][NEXT] = link[NEXT]
+                link[NEXT][PREV] = link[PREV]
+            last = root[PREV]
+            link[PREV], link[NEXT] = last, root
+            last[NEXT] = root[PREV] = link
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -1033,20 +908,19 @@ class mru_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
-            queue.clear()
+            links.clear()
+            root[:] = [root, root, None]
             if not keepstats: stats[:] = [0, 0, 0]
 
         def info():
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -1054,14 +928,10 @@ class mru_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
-       #wrapper._queue = queue #XXX
+       #wrapper._queue = links #XXX
         return update_wrapper(wrapper, user_function)
 
     def __get__(self, obj, objtype):
@@ -1099,6 +969,7 @@ class rr_cache(object):
     cache = storage hashmap (default is {})
     keymap = cache key encoder (default is keymaps.stringmap(flat=False))
     ignore = function argument names and indicies to 'ignore' (default is None)
+    seed = seed for the random choice of entries to purge (default is None)
     tol = integer tolerance for rounding (default is None)
     deep = boolean for rounding depth (default is False, i.e. 'shallow')
 
@@ -1123,6 +994,8 @@ class rr_cache(object):
     recalculation (they only trigger cache lookups), and thus are 'ignored'.
     When caching class methods, it may be useful to ignore=('self',).
 
+    If *seed* is given, the cache entries are purged in a reproducible order.
+
     View cache statistics (hit, miss, load, maxsize, size) with f.info().
     Clear the cache and statistics with f.clear().  Replace the cache archive
     with f.archive(obj).  Load from the archive with f.load(), and dump from
@@ -1130,7 +1003,7 @@ class rr_cache(object):
 
     http://en.wikipedia.org/wiki/Cache_algorithms#Random_Replacement
     """
-    def __init__(self, maxsize=100, cache=None, keymap=None, ignore=None, tol=None, deep=False):
+    def __init__(self, maxsize=100, cache=None, keymap=None, ignore=None, tol=None, deep=False, seed=None):
         if maxsize == 0:
             return no_cache(cache=cache, keymap=keymep, ignore=ignore, tol=tol, deep=deep)
         if maxsize is None:
@@ -1158,11 +1031,15 @@ class rr_cache(object):
             'roundargs': rounded_args,
             'tol': tol,
             'deep': deep,
+            'seed': seed,
         }
         return
 
     def __call__(self, user_function):
+        from random import Random
        #cache = dict()                  # mapping of args to results
+        pool = []                       # keys in the cache, in any order
+        index = {}                      # mapping of keys to index in pool
         stats = [0, 0, 0]               # make statistics updateable non-locally
         HIT, MISS, LOAD = 0, 1, 2       # names for the stats fields
         _len = len                      # localize the global len() function
@@ -1172,18 +1049,30 @@ class rr_cache(object):
         keymap = self.__state__['keymap']
         ignore = self.__state__['ignore']
         rounded_args = self.__state__['roundargs']
-
-        def wrapper(*args, **kwds):
-            from random import choice #XXX: biased?
-            try:
-                _args, _kwds = rounded_args(*args, **kwds)
-                _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-                key = keymap(*_args, **_kwds)
-            except: #TypeError
-                result = user_function(*args, **kwds)
-                stats[MISS] += 1
-                return result
-
+        hooks = _hooks(user_function, cache, keymap, ignore, rounded_args, self.__state__['tol'])
+        compute, load, dump = hooks.compute, hooks.load, hooks.dump
+        randrange = Random(self.__state__['seed']).randrange
+
+        def add(key):
+            "add a new key to the pool"
+            index[key] = _len(pool)
+            pool.append(key)
+
+        def purge():
+            "purge a random cache entry, by swapping it with the last in pool"
+            if _len(pool) != _len(cache): # cache was changed, so rebuild
+                pool[:] = cache.keys()
+                index.clear()
+                index.update((k,i) for (i,k) in enumerate(pool))
+            i = randrange(_len(pool))
+            key, last = pool[i], pool.pop()
+            if i < _len(pool):
+                pool[i] = last
+                index[last] = i
+            del index[key], cache[key]
+
+        def fetch(key, args, kwds):
+            "get the result for the key, where the inputs are (*args, **kwds)"
             try:
                 # get cache entry
                 result = cache[key]
@@ -1191,45 +1080,32 @@ class rr_cache(object):
             except KeyError:
                 # if not in cache, look in archive
                 if cache.archived():
-                    cache.load(key)
+                    load(key)
                 try:
                     result = cache[key]
+                    add(key)
                     stats[LOAD] += 1
                 except KeyError:
                     # if not found, then compute
-                    result = user_function(*args, **kwds)
+                    result = compute(*args, **kwds)
                     cache[key] = result
+                    add(key)
                     stats[MISS] += 1
 
                 # purge cache
                 if _len(cache) > maxsize:
                     if cache.archived():
-                        cache.dump()
+                        dump()
                         cache.clear() 
+                        del pool[:]
+                        index.clear()
                     else: # purge random cache entry
-                        del cache[choice(list(cache.keys()))]
+                        purge()
             except: #TypeError: # unhashable key
-                result = user_function(*args, **kwds)
+                result = compute(*args, **kwds)
                 stats[MISS] += 1
             return result
 
-        def archive(obj):
-            """Replace the cache archive"""
-            if isinstance(obj, archive_dict): cache.archive = obj.archive
-            else: cache.archive = obj
-
-        def key(*args, **kwds):
-            """Get the cache key for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return keymap(*_args, **_kwds)
-
-        def lookup(*args, **kwds):
-            """Get the stored value for the given *args,**kwds"""
-            _args, _kwds = rounded_args(*args, **kwds)
-            _args, _kwds = _keygen(user_function, ignore, *_args, **_kwds)
-            return cache[keymap(*_args, **_kwds)]
-
         def __get_cache():
             """Get the cache"""
             return cache
@@ -1238,19 +1114,19 @@ class rr_cache(object):
             """Get the (ignore) mask"""
             return ignore
 
-        def __get_keymap():
-            """Get the keymap"""
-            return keymap
-
         def clear(keepstats=False):
             """Clear the cache and statistics"""
             cache.clear()
+            del pool[:]
+            index.clear()
             if not keepstats: stats[:] = [0, 0, 0]
 
         def info():
             """Report cache statistics"""
             return CacheInfo(stats[HIT], stats[MISS], stats[LOAD], maxsize, len(cache))
 
+        wrapper = hooks.wrap(fetch, clear, stats, safe=True)
+
         # interface
         wrapper.__wrapped__ = user_function
         #XXX: better is handle to key_function=keygen(ignore)(user_function) ?
@@ -1258,13 +1134,9 @@ class rr_cache(object):
         wrapper.clear = clear
         wrapper.load = cache.load
         wrapper.dump = cache.dump
-        wrapper.archive = archive
         wrapper.archived = cache.archived
-        wrapper.key = key
-        wrapper.lookup = lookup
         wrapper.__cache__ = __get_cache
         wrapper.__mask__ = __get_mask
-        wrapper.__map__ = __get_keymap
        #wrapper._queue = None  #XXX
         return update_wrapper(wrapper, user_function)
 
@@ -1279,7 +1151,8 @@ class rr_cache(object):
         ignore = self.__state__['ignore']
         tol = self.__state__['tol']
         deep = self.__state__['deep']
-        return (self.__class__, (maxsize, cache, keymap, ignore, tol, deep))
+        seed = self.__state__['seed']
+        return (self.__class__, (maxsize, cache, keymap, ignore, tol, deep, seed))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+record traces of the calls to cached functions, and replay them offline
+
+A trace is a compact binary record of (key hash, event, time, size) for each
+call, where event is the cache statistic (0=hit, 1=miss, 2=load) and time is
+the time taken by the call.  To limit the overhead, a trace can record only
+a (spatially hashed) sample of the keys, so all calls for a sampled key are
+recorded.  The trace is replayed against a selection of cache policies and
+sizes, where sizes are scaled by the sampling rate (as in SHARDS).
+
+For example:
+    >>> from klepto import lru_cache
+    >>> from klepto.simulate import trace, simulate
+    >>> @lru_cache(maxsize=100)
+    ... def f(x):
+    ...     return x
+    ...
+    >>> t = trace(rate=0.1)
+    >>> f.record(t)
+    >>> ...
+    >>> t.dump('f.trace')
+
+and later, run 'python -m klepto.simulate f.trace', or:
+    >>> results = simulate(load('f.trace'))
+"""
+from __future__ import absolute_import, print_function
+import sys
+import struct
+from operator import itemgetter
+
+__all__ = ['trace', 'load', 'simulate']
+
+RECORD = struct.Struct('<QBfI') # key hash, event, time, size
+HEADER = struct.Struct('<8sd')  # magic, rate
+MAGIC = b'klepto\x00\x01'
+SPACE = 1 << 64 # key hashes are in range(SPACE)
+
+def _mix(key):
+    "get a well-mixed 64-bit hash of the key"
+    return (hash(key) * 0x9E3779B97F4A7C15) & (SPACE - 1)
+
+
+class trace(object):
+    """a compact binary trace of the calls to a cached function
+
+    rate = fraction of keys recorded (default is 1, i.e. all keys)
+    sizeof = function that returns the size of a result (default is the bytes
+        of the array data for arrays, and otherwise sys.getsizeof)
+
+    Record the calls to a cached function f with f.record(trace), and stop
+    recording with f.record().  Write the trace to a file with trace.dump, and
+    read it with load.  Iterating over the trace gives the records, as tuples
+    of (key hash, event, time, size)."""
+    def __init__(self, rate=1, sizeof=None):
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be in (0, 1]")
+        self.rate = rate
+        self.sizeof = sizeof
+        self.data = bytearray()
+        self.__threshold = int(rate * SPACE)
+        return
+    def sampled(self, key):
+        "check if the calls for the key are recorded"
+        return _mix(key) < self.__threshold
+    def record(self, key, event, time, result):
+        "record a call, where event is the index of the cache statistic"
+        if self.sizeof is None:
+            from ._cache import _sizeof as sizeof
+        else:
+            sizeof = self.sizeof
+        size = min(max(sizeof(result), 0), 0xFFFFFFFF)
+        self.data += RECORD.pack(_mix(key), event, time, size)
+    def __len__(self):
+        return len(self.data) // RECORD.size
+    def __iter__(self):
+        data, size = self.data, RECORD.size
+        for i in range(0, len(data), size):
+            yield RECORD.unpack_from(data, i)
+    def __repr__(self):
+        return "<trace of %s calls, rate=%r>" % (len(self), self.rate)
+    def dump(self, file):
+        "write the trace to a file (given a filename or a file object)"
+        if not hasattr(file, 'write'):
+            with open(file, 'wb') as f:
+                return self.dump(f)
+        file.write(HEADER.pack(MAGIC, self.rate))
+        file.write(bytes(self.data))
+        return
+
+
+def load(file):
+    "read a trace from a file (given a filename or a file object)"
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as f:
+            return load(f)
+    magic, rate = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("%r is not a klepto trace" % getattr(file, 'name', file))
+    data = trace(rate)
+    data.data = bytearray(file.read())
+    return data
+
+
+def _policies():
+    "get a list of (name, decorator) for the cache policies in klepto"
+    from . import _cache, safe
+    names = ('lru_cache', 'lfu_cache', 'mru_cache', 'rr_cache', 'gdsf_cache')
+    return [(name, getattr(_cache, name)) for name in names] + \
+           [('safe.' + name, getattr(safe, name)) \
+            for name in names if hasattr(safe, name)]
+
+
+def _sizes(trace):
+    "get the default sizes, as powers of 2 up to the estimated number of keys"
+    keys = len(set(i[0] for i in trace)) / trace.rate
+    size, sizes = 1, [1]
+    while size < keys:
+        size *= 2
+        sizes.append(size)
+    return sizes
+
+
+def simulate(trace, sizes=None, policies=None, verbose=True):
+    """replay the trace against each cache policy at each size
+
+    trace = the recorded trace of calls to a cached function
+    sizes = list of cache sizes (default is powers of 2, up to the number of keys)
+    policies = list of (name, decorator) (default is all policies in klepto)
+    verbose = if True, print a table of the results (default is True)
+
+    Returns a list of (name, size, hit ratio, time saved), where the time saved
+    is the total time of the misses that become hits.  The time of a miss is
+    the time recorded for the key's last miss (or if never missed, the mean
+    time of all misses), and is the cost used by gdsf_cache.  Sizes are scaled
+    by the sampling rate of the trace, so the size of the replayed cache is
+    size * rate.  Caches are replayed without archives."""
+    if sizes is None: sizes = _sizes(trace)
+    if policies is None: policies = _policies()
+    # find the cost (and size) of a miss for each key
+    costs, results, misses = {}, {}, []
+    for (key, event, time, size) in trace:
+        if event == 1:
+            costs[key] = time
+            misses.append(time)
+        results[key] = size
+    default = sum(misses) / len(misses) if misses else 0.
+    table = dict((key, (costs.get(key, default), size)) \
+                 for (key, size) in results.items())
+    calls = [key for (key, _, _, _) in trace]
+    total = sum(table[key][0] for key in calls)
+
+    rows = []
+    for (name, policy) in policies:
+        for size in sizes:
+            spent = [0.]
+            def call(key):
+                spent[0] += table[key][0]
+                return table[key]
+            kwds = {}
+            if name.endswith('rr_cache'): kwds['seed'] = 0
+            if name.endswith('gdsf_cache'):
+                kwds.update(cost=itemgetter(0), sizeof=itemgetter(1))
+            maxsize = max(1, int(round(size * trace.rate)))
+            f = policy(maxsize=maxsize, **kwds)(call)
+            for key in calls:
+                f(key)
+            ratio = float(f.info().hit) / len(calls) if calls else 0.
+            rows.append((name, size, ratio, total - spent[0]))
+    if verbose:
+        print("%-16s %10s %10s %14s" % ('policy','size','hit ratio','time saved'))
+        for row in rows:
+            print("%-16s %10d %10.4f %14.6g" % row)
+    return rows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: python -m klepto.simulate TRACE [SIZE ...]")
+        sys.exit(1)
+    sizes = [int(i) for i in sys.argv[2:]] or None
+    simulate(load(sys.argv[1]), sizes)
+
+
+# EOF
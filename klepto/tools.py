@@ -19,8 +19,10 @@ try:
 except ImportError:
     from ._namedtuple import namedtuple
 CacheInfo = namedtuple("CacheInfo", ['hit','miss','load','maxsize','size'])
+CostInfo = namedtuple("CostInfo", ['hit','miss','load','maxsize','size',
+                                   'skip','cost','threshold'])
 
-__all__ = ['isiterable']
+__all__ = ['isiterable', 'histogram']
 
 def isiterable(x):
     """check if an object is iterable"""
@@ -34,6 +36,76 @@ def isiterable(x):
     except TypeError: return False
    #return hasattr(x, '__len__') or hasattr(x, '__iter__')
 
+class histogram(object):
+    """a log-linear (i.e. HDR-style) histogram of non-negative values
+
+    unit = the resolution of the recorded values (default is 1e-9)
+    precision = number of linear buckets in each power of 2 (default is 32)
+
+    Values are counted in buckets, where values below 2*precision units each
+    have a bucket, and each larger power of 2 is split into 'precision' equal
+    buckets.  Thus, the relative error of any quantile is below 1/precision,
+    while the memory used grows only with the log of the range of the values.
+    With the defaults, times in seconds are recorded to the nanosecond.
+    The precision must be a power of 2, so any other precision is rounded up
+    to the next power of 2 (e.g. 10 is rounded up to 16).
+    """
+    def __init__(self, unit=1e-9, precision=32):
+        if precision < 1:
+            raise ValueError("precision must be a positive integer")
+        precision = 1 << (int(precision) - 1).bit_length() # a power of 2
+        self.unit = unit
+        self.precision = precision
+        self.counts = {}            # mapping of bucket index to count
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+        self.__bits = precision.bit_length()
+        return
+    def record(self, value):
+        "count the value in the histogram"
+        n = max(int(value / self.unit), 0)
+        if n >= 2 * self.precision: # keep the most significant bits
+            shift = n.bit_length() - self.__bits
+            n = shift * self.precision + (n >> shift)
+        self.counts[n] = self.counts.get(n, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+    def _bounds(self, index):
+        "get the (lower, upper) bounds of the values in the bucket"
+        if index < 2 * self.precision:
+            return index * self.unit, (index + 1) * self.unit
+        shift = index // self.precision - 1
+        lower = (index - shift * self.precision) << shift
+        return lower * self.unit, (lower + (1 << shift)) * self.unit
+    def buckets(self):
+        "get a list of (lower, upper, count) for the buckets with counts"
+        return [self._bounds(i) + (self.counts[i],) for i in sorted(self.counts)]
+    def quantile(self, q):
+        "get the value at the quantile q, where 0 <= q <= 1"
+        if not self.count: return None
+        rank, seen = q * self.count, 0
+        for (lower, upper, count) in self.buckets():
+            seen += count
+            if seen >= rank:
+                return min(max((lower + upper) / 2., self.min), self.max)
+        return self.max
+    def mean(self):
+        "get the mean of the values"
+        return self.total / self.count if self.count else None
+    def __len__(self):
+        return self.count
+    def __repr__(self):
+        if not self.count:
+            return "histogram(count=0)"
+        return "histogram(count=%s, mean=%.3g, p50=%.3g, p99=%.3g, max=%.3g)" % \
+               (self.count, self.mean(), self.quantile(.5), self.quantile(.99), \
+                self.max)
+
+
 def _b(message):
     """convert string to correct format for buffer object"""
     import sys
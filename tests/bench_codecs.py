@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+compare the speed and compression ratio of the available codecs,
+when dumping (and loading) arrays and python objects with klepto._pickle
+"""
+
+import os
+import time
+import tempfile
+from pox import rmtree
+from klepto import _pickle
+
+def payloads():
+    "build a dict of {name: object}"
+    import numpy as np
+    x = np.linspace(0, 100, 2**22)
+    return {
+        'floats': np.sin(x),
+        'ints': np.arange(2**22) // 7,
+        'objects': dict((str(i), [i, float(i), 'x'*(i%10)]) for i in range(2**15)),
+    }
+
+def bench(obj, codec, compress=3, repeat=3):
+    "return (dump time, load time, compressed size) of obj for the codec"
+    root = tempfile.mkdtemp()
+    filename = os.path.join(root, 'bench.pkl')
+    try:
+        dump = load = float('inf')
+        for i in range(repeat):
+            start = time.time()
+            files = _pickle.dump(obj, filename, compress=compress, codec=codec)
+            dump = min(dump, time.time() - start)
+            start = time.time()
+            _pickle.load(filename)
+            load = min(load, time.time() - start)
+        size = sum(os.path.getsize(f) for f in files)
+    finally:
+        rmtree(root, ignore_errors=True)
+    return dump, load, size
+
+
+if __name__ == '__main__':
+    print('%-8s %-6s %10s %10s %10s' % ('payload','codec','dump (s)','load (s)','size (MB)'))
+    for (name, obj) in sorted(payloads().items()):
+        for codec in _pickle.codecs():
+            dump, load, size = bench(obj, codec)
+            print('%-8s %-6s %10.3f %10.3f %10.2f' % (name, codec, dump, load, size/float(_pickle._MEGA)))
+
+
+# EOF
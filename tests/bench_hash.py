@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+compare the speed of the available hash algorithms, when hashing arrays
+of increasing size with klepto.keymaps.hashmap
+"""
+
+import time
+from klepto.keymaps import hashmap
+from klepto.crypto import algorithms
+
+def bench(obj, algorithm, repeat=5):
+    "return the best time to hash obj with the algorithm"
+    h = hashmap(algorithm=algorithm)
+    best = float('inf')
+    for i in range(repeat):
+        start = time.time()
+        h(obj)
+        best = min(best, time.time() - start)
+    return best
+
+
+if __name__ == '__main__':
+    import numpy as np
+    sizes = (10**3, 10**5, 10**7)
+    algs = [alg for alg in algorithms() if alg]
+    print('%-10s' % 'algorithm' + ''.join('%12s' % ('%.0e (s)' % n) for n in sizes))
+    for alg in algs:
+        times = [bench(np.random.rand(n), alg) for n in sizes]
+        print('%-10s' % alg + ''.join('%12.5f' % t for t in times))
+
+
+# EOF
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+compare the time (ns per call) to build a cache key with the fast key builder
+and with the full key pipeline, and the time for a cache hit
+"""
+
+import timeit
+from klepto import lru_cache
+from klepto.keymaps import hashmap, stringmap
+from klepto._inspect import _keygen, _keymaker
+
+def add(x, y, z=1):
+    return x+y+z
+
+def full(keymap):
+    "build a key with the full pipeline: _keygen, then the keymap"
+    def key(*args, **kwds):
+        args, kwds = _keygen(add, (), *args, **kwds)
+        return keymap(*args, **kwds)
+    return key
+
+def bench(f, number=10000):
+    "return the best time in ns per call of f(1, 2)"
+    return 1e9 * min(timeit.repeat(lambda : f(1, 2), number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    print('%-28s %10s %10s' % ('keymap', 'full (ns)', 'fast (ns)'))
+    for keymap in (hashmap(), hashmap(algorithm='stable'), stringmap()):
+        print('%-28s %10.0f %10.0f' % (keymap, bench(full(keymap)), bench(_keymaker(add, keymap))))
+    print('%-28s %10s %10.0f' % ('lru_cache hit', '', bench(lru_cache()(add))))
+    print('%-28s %10.0f %10s' % ('lru_cache hit (rounded)', bench(lru_cache(tol=1)(add)), ''))
+
+
+# EOF
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+show the time (ns per hit) for mru_cache is flat across cache sizes
+"""
+
+import timeit
+import random
+from klepto import mru_cache
+
+def bench(maxsize, number=20000):
+    "return the best time in ns per hit, for a full cache of the given size"
+    f = mru_cache(maxsize=maxsize)(lambda x: x)
+    for i in range(maxsize):
+        f(i)
+    keys = [random.randrange(maxsize) for i in range(number)]
+    call = lambda : [f(i) for i in keys]
+    return 1e9 * min(timeit.repeat(call, number=1, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    print('%10s %10s' % ('maxsize', 'hit (ns)'))
+    for maxsize in (10, 1000, 100000):
+        print('%10d %10.0f' % (maxsize, bench(maxsize)))
+
+
+# EOF
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+"""
+compare the round-trip time of klepto._pickle with the C pickler (the
+default, when available) and with the pure-python pickler, for mixed payloads
+"""
+
+import os
+import time
+import tempfile
+from pox import rmtree
+from klepto import _pickle
+
+def payloads():
+    "build a dict of {name: object}"
+    import numpy as np
+    return {
+        'int': 1,
+        'small': {'a': [1, 2.0, 'three'], 'b': (None, True)},
+        'objects': dict((str(i), [i, float(i), 'x'*(i%10)]) for i in range(2**12)),
+        'arrays': [np.arange(i) for i in range(100)],
+        'mixed': {'x': np.arange(2**20), 'y': list(range(2**10)), 'z': 'z'*2**10},
+    }
+
+def bench(obj, Pickler, compress=0, repeat=20):
+    "return the best round-trip time of obj, pickled with the given class"
+    root = tempfile.mkdtemp()
+    filename = os.path.join(root, 'bench.pkl')
+    try:
+        best = float('inf')
+        for i in range(repeat):
+            start = time.time()
+            _pickle._dump(Pickler, obj, filename, compress=compress)
+            _pickle.load(filename)
+            best = min(best, time.time() - start)
+    finally:
+        rmtree(root, ignore_errors=True)
+    return best
+
+
+if __name__ == '__main__':
+    picklers = [('pure', _pickle.NumpyPickler)]
+    if _pickle.FastNumpyPickler is not None:
+        picklers.append(('C', _pickle.FastNumpyPickler))
+    print('%-8s %-8s %12s %12s' % ('payload','compress','pickler','time (ms)'))
+    for (name, obj) in sorted(payloads().items()):
+        for compress in (0, 3):
+            for (kind, Pickler) in picklers:
+                best = bench(obj, Pickler, compress)
+                print('%-8s %-8s %12s %12.3f' % (name, compress, kind, 1000*best))
+
+
+# EOF
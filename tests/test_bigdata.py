@@ -16,9 +16,30 @@ try:
     y = x.copy()
     y[1000] = -1
 
-    assert h(x) == h(y) # equal because repr for large np arrays uses '...'
+    assert h(x) != h(y) # arrays are hashed by their data, not their repr
+    assert h(x) == h(x.copy())
+    assert h(x) != h(x.astype('f8'))
+    assert h(x[::2]) == h(x[::2].copy())
     assert p(x) != p(y)
     assert hp(x) != hp(y)
+
+    # datetimes are hashed by their data, though they have no buffer
+    import os
+    from klepto import lru_cache
+    from klepto.archives import file_archive
+    t = np.array(['2020-01-01', '2021-01-01'], dtype='datetime64[D]')
+    for key in (h, hashmap(algorithm='stable'), hashmap(algorithm='md5', structural=True)):
+        assert key(t) == key(t.copy())
+        assert key(t) != key(t[::-1])
+        assert key(t) != key(t.view('i8'))
+        assert key(t - t[0]) == key(t[::-1][::-1] - t[0]) # timedelta64
+
+    @lru_cache(cache=file_archive('memo_bigdata.pkl', cached=False))
+    def first(t): # the default keymap for a persistent archive is 'stable'
+        return t[0]
+    assert first(t) == first(t.copy()) == t[0]
+    assert first.info().hit == 1
+    os.remove('memo_bigdata.pkl')
 except ImportError:
     print("to test big data, install numpy")
 
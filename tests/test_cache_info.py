@@ -123,5 +123,138 @@ if __name__ == '__main__':
    #                                 rangelimit=20, tries=100, archived=True))
    #    print (msg)
 
+    # a seeded rr_cache purges entries in a reproducible order
+    def _test_seed(seed):
+        import random
+        rng = random.Random(0)
+        @rr_cache(maxsize=10, seed=seed)
+        def f(x):
+            return x
+        for i in range(200):
+            f(rng.randint(0,30))
+        return sorted(f.__cache__()), f.info()
+    assert _test_seed(42) == _test_seed(42)
+    keys, info = _test_seed(42)
+    assert len(keys) == info.size == 10
+
+    # map computes each unique miss once, and returns results in order
+    from multiprocessing.pool import ThreadPool
+    calls = []
+    def _test_map(cache, pool=None):
+        @cache(maxsize=100)
+        def f(x):
+            calls.append(x)
+            return x*x
+        f(3)
+        del calls[:]
+        inputs = [5, 3, 2, 5, 1, 3, 2]
+        assert f.map(inputs, pool=pool, chunksize=2) == [x*x for x in inputs]
+        assert sorted(calls) == [1, 2, 5]
+        del calls[:]
+        assert f.map(inputs) == [x*x for x in inputs]
+        assert calls == []
+        return f.info()
+    for cache in (rr_cache,mru_cache,lru_cache,lfu_cache,inf_cache):
+        x = _test_map(cache)
+        assert (x.hit, x.miss, x.size) == (11, 4, 4)
+    pool = ThreadPool(2)
+    x = _test_map(lru_cache, pool)
+    assert (x.hit, x.miss, x.size) == (11, 4, 4)
+    pool.close(); pool.join()
+    x = _test_map(gdsf_cache)
+    assert (x.hit, x.miss, x.size) == (11, 4, 4)
+
+    # map sends the function to a process pool, even if decorated in place
+    from multiprocessing import Pool
+    @lru_cache(maxsize=100)
+    def cubed(x):
+        return x**3
+    @gdsf_cache(maxsize=100)
+    def halved(x):
+        return x/2.
+    pool = Pool(2)
+    inputs = [5, 3, 2, 5, 1]
+    assert cubed.map(inputs, pool=pool) == [x**3 for x in inputs]
+    assert halved.map(inputs, pool=pool) == [x/2. for x in inputs]
+    pool.close(); pool.join()
+    assert cubed.info()[:3] == halved.info()[:3] == (1, 4, 0)
+
+    # gdsf keeps results that are expensive to compute, and skips cheap ones
+    import time
+    @gdsf_cache(maxsize=3)
+    def f(x, wait=0):
+        time.sleep(wait)
+        return x
+    f(1, wait=.05)
+    for i in range(2, 10): f(i)
+    assert f.lookup(1, wait=.05) == 1
+    x = f.info()
+    assert (x.hit, x.miss, x.size, x.skip) == (0, 9, 3, 0)
+    assert x.cost >= .05
+    @gdsf_cache(maxsize=None, threshold=.01)
+    def f(x, wait=0):
+        time.sleep(wait)
+        return x
+    for i in (1, 2, 1, 2): f(i, wait=.02*(i-1))
+    assert list(f.__cache__().values()) == [2]
+    x = f.info()
+    assert (x.hit, x.miss, x.size, x.skip, x.threshold) == (1, 3, 1, 2, .01)
+
+    # autosize adjusts maxsize to the working set, within the bounds
+    import random
+    def _test_autosize(cache, **kwds):
+        rng = random.Random(0)
+        @cache(maxsize=autosize(10, 5000, **kwds))
+        def f(x):
+            return x
+        assert f.info().maxsize == 5000
+        for i in range(20000): # mostly a working set of 200 keys
+            f(rng.randrange(200) if rng.random() < .9 else rng.random())
+        curve = f.curve()
+        assert [i for (i,_) in curve] == [10,20,40,80,160,320,640,1280,2560,5000]
+        assert [j for (_,j) in curve] == sorted(j for (_,j) in curve)
+        assert .85 < curve[-1][1] < .95
+        return f.info()
+    for cache in (lru_cache, lfu_cache):
+        assert 200 <= _test_autosize(cache).maxsize < 640
+        assert _test_autosize(cache, budget=5000, sizeof=lambda x: 100).maxsize <= 50
+    assert lru_cache(maxsize=10)(abs).curve() is None
+
+    # per-stage timing is off until instrumented, and counts each stage
+    from klepto import safe
+    from klepto.archives import dict_archive
+    for cache in (lru_cache, safe.lru_cache):
+        f = cache(maxsize=2)(abs)
+        f.archive(dict_archive(cached=False))
+        assert f.stats() is None
+        f(1)
+        f.instrument()
+        for i in (1, 2, 2, 3, 1): # each miss tries to load, and a purge dumps
+            f(i)
+        f.instrument(False)
+        f(5)
+        stages = dict((stage, len(h)) for (stage, h) in f.stats().items())
+        assert stages == dict(round=5, keygen=5, keymap=5, lookup=5, \
+                              load=3, compute=2, dump=1)
+        assert f.stats()['compute'].quantile(.5) <= f.stats()['compute'].max
+        f.instrument() # restart with new histograms
+        assert len(f.stats()['round']) == 0
+
+    # a histogram's precision is rounded up to a power of 2
+    from klepto.tools import histogram
+    h = histogram(unit=1, precision=10)
+    assert h.precision == 16
+    for value in range(1000, 2000):
+        h.record(value)
+    for (lower, upper, count) in h.buckets(): # the bounds hold the values
+        assert count == min(upper, 2000) - max(lower, 1000)
+    for q in (.1, .5, .9):
+        assert abs(h.quantile(q) - (1000 + q * 1000)) < (1000 + q * 1000) / 10.
+    try:
+        histogram(precision=0)
+        assert False
+    except ValueError:
+        pass
+
 
 # EOF
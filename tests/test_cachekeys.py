@@ -7,7 +7,7 @@
 
 from klepto import inf_cache as memoized
 from klepto.archives import *
-from klepto.keymaps import picklemap
+from klepto.keymaps import picklemap, hashmap
 
 try:
     import ___________ #XXX: enable test w/o numpy.arrays
@@ -124,4 +124,51 @@ for archive in archives:
     count += 1
 
 
+# keys for a persistent archive are the same in each process
+import os, sys, subprocess, warnings
+code = "from klepto.keymaps import hashmap; print(hashmap(algorithm='stable')('2', x=[1]))"
+keys = set()
+for seed in ('1', '2'):
+    env = dict(os.environ, PYTHONHASHSEED=seed)
+    keys.add(subprocess.check_output([sys.executable, '-c', code], env=env))
+assert len(keys) == 1
+
+# as with python's hash, equal numbers have the same key
+key = hashmap(algorithm='stable')
+assert key(3, 1) == key(3.0, True) == key(3+0j, 1.0)
+assert key(0.5, y=(2,)) == key(0.5+0j, y=(2.0,))
+assert key(3.5, 1) != key(3, 1)
+
+@memoized(cache=dir_archive('memo_stable', cached=False))
+def stable(x):
+    return x
+assert stable.__map__().__type__ == 'stable'
+stable('1'); stable([1,2])
+assert stable.key('1') in stable.__cache__()
+remove('memo_stable')
+
+@memoized(cache=dict_archive())
+def salted(x):
+    return x
+assert salted.__map__().__type__ is None
+
+# the default keymap becomes stable when given a persistent archive
+from klepto._cache import _SALTED
+with warnings.catch_warnings(record=True) as w:
+    warnings.simplefilter('always')
+    salted('1')
+    salted.archive(file_archive('memo.pkl', cached=False))
+    salt = lambda: [i for i in w if issubclass(i.category, RuntimeWarning)]
+    assert not salt()
+    assert salted.__map__().__type__ == 'stable'
+    assert salted.key('1') == stable.key('1')
+    assert salted.info().size == 0 and salted.info().miss == 1
+    salted('1')
+    assert salted.key('1') in salted.__cache__()
+    # a salted keymap that was given is warned about, if python's hash is salted
+    memoized(cache=file_archive('memo.pkl'), keymap=hashmap())(lambda x: x)
+    assert len(salt()) == int(_SALTED)
+remove('memo.pkl')
+
+
 # EOF
@@ -193,5 +193,61 @@ assert _keygen(min, ['x','y'], 0) == ((0,), {})
 assert _keygen(min, [0,1], 0) == ((0,), {})
 assert _keygen(min, ['*'], 0) == ((0,), {})
 
+# fast keys are identical to keys from _keygen
+from klepto._inspect import _keymaker
+from klepto.keymaps import keymap, stringmap
+def add(x, y, z=1):
+    return x+y+z
+calls = [((1,2),{}), ((1,),{'y':2}), ((1,2,3),{}), (('a',),{'z':'b','y':'c'})]
+for kmap in (keymap(), hashmap(), hashmap(algorithm='md5'), stringmap()):
+    fast = _keymaker(add, kmap)
+    assert hasattr(fast, '__fast__')
+    for (args, kwds) in calls:
+        _args, _kwds = _keygen(add, (), *args, **kwds)
+        assert fast(*args, **kwds) == kmap(*_args, **_kwds)
+    # invalid calls, and unhashable args, use the full _keygen
+    assert fast(1,2,3,4) == kmap(4, x=1, y=2, z=3)
+    assert fast(1,w=2) == kmap(w=2, x=1, z=1)
+# not a simple call
+assert not hasattr(_keymaker(add, hashmap(typed=True)), '__fast__')
+assert not hasattr(_keymaker(add, hashmap(), ['x']), '__fast__')
+assert not hasattr(_keymaker(p, hashmap()), '__fast__')
+assert not hasattr(_keymaker(lambda *x: x, hashmap()), '__fast__')
+# fast keys use the current defaults, and the full _keygen if the code changes
+def sub(x, y, z=1):
+    return x-y-z
+fast = _keymaker(sub, keymap())
+assert fast(1, 2) == keymap()(x=1, y=2, z=1)
+sub.__defaults__ = (10,)
+assert fast(1, 2) == keymap()(x=1, y=2, z=10)
+sub.__code__ = (lambda a, b, c=0: a).__code__
+assert fast(1, 2) == keymap()(a=1, b=2, c=10)
+
+
+# signatures are memoized, and recomputed when the function changes
+from klepto._inspect import _signatures
+def bar(x, y, z=1):
+    return x+y+z
+assert signature(bar) == (('x', 'y', 'z'), {'z': 1}, '', '')
+assert bar in _signatures
+sig = signature(bar)
+sig[1]['w'] = 0 # the defaults returned are a copy
+assert signature(bar) == (('x', 'y', 'z'), {'z': 1}, '', '')
+bar.__defaults__ = (2,)
+assert signature(bar) == (('x', 'y', 'z'), {'z': 2}, '', '')
+bar.__code__ = add.__code__
+assert signature(bar) == (('x', 'y', 'z'), {'z': 2}, '', '')
+def baz(a, b=0):
+    return a
+bar.__code__ = baz.__code__
+assert signature(bar) == (('a', 'b'), {'b': 2}, '', '')
+pb = partial(bar, 1)
+assert signature(pb) == (('b',), {'b': 2, '!a': 1}, '', '')
+assert signature(pb) == signature(pb)
+assert pb in _signatures
+del pb, bar
+import gc; gc.collect()
+assert len([f for f in _signatures.keys() if getattr(f, '__name__', '') == 'bar']) == 0
+
 
 # EOF
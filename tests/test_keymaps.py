@@ -46,3 +46,33 @@ assert encode(*args, **kwds) == dumps( (1, 2, 'a', 3, 'b', 4, type(1), type(2),
 encode = picklemap(typed=True, flat=False, serializer='dill')
 assert encode(*args, **kwds) == dumps( (args, kwds, (type(1), type(2)), (type(3), type(4))) )
 
+
+# structural hashing: insertion order of dicts and sets doesn't matter
+encode = hashmap(algorithm='md5', structural=True)
+assert repr(encode) == "hashmap(algorithm='md5', structural=True)"
+d = dict((str(i), [i, float(i)]) for i in range(100))
+r = dict(reversed(list(d.items())))
+assert encode(d) == encode(r) == encode(dict(d))
+assert encode(set(range(50))) == encode(set(range(49, -1, -1)))
+assert encode(d) != encode(dict(d, x=0))
+assert encode(1) != encode(1.0) != encode(True)
+assert encode('1') != encode(1)
+# shared and recursive sub-objects
+x = [1, 2]
+assert encode([x, x]) == encode([x, x])
+y = [1]; y.append(y)
+assert encode(y) == encode(y)
+# equal containers give the same hash, whether or not they are shared
+assert encode([x, x]) == encode([[1, 2], [1, 2]])
+t = (1, 2)
+assert encode([t, t]) == encode([(1, 2), tuple([1, 2])])
+assert encode({'a': x, 'b': [x]}) == encode({'a': [1, 2], 'b': [[1, 2]]})
+z = [1]; z.append(z)
+assert encode([y, y]) == encode([y, z])
+assert encode(y) != encode([1, [1]])
+assert encode(*args, **kwds) == hashmap(algorithm='md5', structural=True)(*args, **kwds)
+try:
+    hashmap(structural=True)
+    assert False
+except ValueError:
+    pass
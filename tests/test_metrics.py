@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+
+from klepto import lru_cache, inf_cache, gdsf_cache, safe, metrics
+from klepto.archives import cache, dict_archive
+
+class events(object):
+    def __init__(self):
+        self.seen = []
+    def on_hit(self, key):
+        self.seen.append(('hit', key))
+    def on_miss(self, key):
+        self.seen.append(('miss', key))
+    def on_load(self, key):
+        self.seen.append(('load', key))
+    def on_evict(self, count):
+        self.seen.append(('evict', count))
+    def on_dump(self, count):
+        self.seen.append(('dump', count))
+
+
+def _test_observe():
+    for policy in (lru_cache, safe.lru_cache):
+        f = policy(maxsize=2, keymap=None)(abs)
+        observer = events()
+        f.observe(observer)
+        for i in (1, 2, 2, 3):
+            f(i)
+        key = f.key
+        assert observer.seen == [('miss', key(1)), ('miss', key(2)), \
+                                 ('hit', key(2)), ('miss', key(3)), ('evict', 1)]
+
+        # archived caches dump the purged entries (while fetching the result)
+        f.archive(dict_archive(cached=False))
+        observer.seen = []
+        f(4)
+        f(2)
+        assert observer.seen == [('dump', 3), ('miss', key(4)), ('evict', 3), \
+                                 ('load', key(2))]
+        f.observe(observer, False)
+        f(5)
+        assert len(observer.seen) == 4
+
+    # observers of an archive-backed cache see each load and dump
+    c = cache(archive=dict_archive(cached=False))
+    observer = events()
+    c.observe(observer)
+    c.update(a=1, b=2)
+    c.dump()
+    c.load('a', 'z')
+    assert observer.seen == [('dump', 2), ('load', 'a')]
+
+
+def _test_nested():
+    # recursive calls are each observed as one event
+    @inf_cache()
+    def fib(n):
+        return n if n < 2 else fib(n-1) + fib(n-2)
+    observer = events()
+    fib.observe(observer)
+    fib(3)
+    key = fib.key
+    assert observer.seen == [('miss', key(1)), ('miss', key(0)), ('miss', key(2)), \
+                             ('hit', key(1)), ('miss', key(3))]
+
+    # calls from several threads are observed as if made in turn
+    import threading, time
+    @lru_cache(maxsize=4)
+    def slow(x):
+        time.sleep(0.001)
+        return x
+    counts = metrics.counter()
+    slow.observe(counts)
+    def run(i):
+        for j in range(20):
+            slow((i + j) % 8)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    info = slow.info()
+    assert (counts.hit, counts.miss, counts.load) == info[:3]
+    assert counts.evict == info.miss - info.size
+
+    # a result that is not stored is not evicted, nor is a nested result
+    @gdsf_cache(maxsize=None, threshold=10, cost=lambda result: result)
+    def grow(x): # only stores results of at least 10
+        return x if x >= 10 else grow(10 * x) / 10
+    observer = events()
+    grow.observe(observer)
+    assert grow(1) == 1 and grow(2) == 2
+    key = grow.key
+    assert observer.seen == [('miss', key(10)), ('miss', key(1)), \
+                             ('miss', key(20)), ('miss', key(2))]
+    assert grow.info().size == 2 and grow.info().skip == 2
+
+
+def _test_render():
+    @lru_cache(maxsize=2)
+    def squared(x):
+        return x**2
+    @gdsf_cache(maxsize=None, threshold=10)
+    def cubed(x):
+        return x**3
+
+    squared(1)
+    metrics.register(squared)
+    metrics.register(cubed, name='cubed "x"')
+    for i in (1, 2, 3, 3):
+        squared(i)
+        cubed(i)
+    text = metrics.render()
+    lines = text.splitlines()
+    assert lines[0] == '# TYPE klepto_cache_hits counter'
+    assert lines[-1] == '# EOF'
+    name = '%s.squared' % __name__
+    assert 'klepto_cache_hits_total{function="%s"} 2' % name in lines
+    assert 'klepto_cache_misses_total{function="%s"} 3' % name in lines
+    assert 'klepto_cache_evictions_total{function="%s"} 1' % name in lines
+    assert 'klepto_cache_maxsize{function="%s"} 2' % name in lines
+    assert 'klepto_cache_maxsize{function="cubed \\"x\\""} +Inf' in lines
+    assert 'klepto_cache_skips_total{function="cubed \\"x\\""} 4' in lines
+    assert not [i for i in lines if i.startswith('klepto_cache_skips') and name in i]
+
+    # serve over HTTP, on any free port
+    try:
+        from urllib.request import urlopen
+    except ImportError:
+        from urllib2 import urlopen
+    server = metrics.serve(port=0)
+    try:
+        url = 'http://%s:%s/metrics' % server.server_address
+        response = urlopen(url)
+        assert response.info()['Content-Type'] == metrics.CONTENT_TYPE
+        assert response.read().decode('utf-8') == metrics.render()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    metrics.unregister(squared)
+    metrics.unregister('cubed "x"')
+    assert metrics.render() == '# EOF\n'
+    squared(9)
+
+
+def _test_bytes():
+    import os, sys
+    from klepto.archives import file_archive
+    # results are sized if in memory, and not if the cache is the archive
+    f = lru_cache(cache=file_archive('memo_metrics.pkl'))(abs)
+    g = lru_cache(cache=file_archive('memo_metrics.pkl', cached=False))(abs)
+    f(-8)
+    g(-8)
+    assert metrics._bytes(f) > 0 and metrics._bytes(g) is None
+    os.remove('memo_metrics.pkl')
+
+    # the results are copied again, if changed (by another thread) while copied
+    class changing(dict):
+        copies = 0
+        def values(self):
+            self.copies += 1
+            if self.copies < 3:
+                raise RuntimeError('dictionary changed size during iteration')
+            return dict.values(self)
+    class function(object):
+        results = changing(a=[])
+        def __cache__(self):
+            return self.results
+    h = function()
+    assert metrics._bytes(h) == sys.getsizeof([])
+    h.results.copies = 0
+    assert metrics._bytes(h, tries=2) is None
+
+
+if __name__ == '__main__':
+    _test_observe()
+    _test_nested()
+    _test_render()
+    _test_bytes()
+
+
+# EOF
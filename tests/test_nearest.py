@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+
+from klepto import nearest_cache
+
+def _test_radius():
+    calls = []
+    @nearest_cache(radius=0.1)
+    def squared(x, name='x'):
+        calls.append(x)
+        return x**2
+
+    assert squared(2.49) == squared(2.51) == 2.49**2
+    assert squared(2.7) == 2.7**2
+    assert squared(2.51, name='y') == 2.51**2 # other inputs must match
+    assert calls == [2.49, 2.7, 2.51]
+    info = squared.info()
+    assert (info.hit, info.miss, info.size) == (1, 3, 3)
+    assert squared.lookup(2.45) == 2.49**2
+    try:
+        squared.lookup(2.0)
+        raise AssertionError('should raise KeyError')
+    except KeyError:
+        pass
+
+    # nearest neighbor, with enough points to search the grid
+    for i in range(100): squared(i * 0.3)
+    assert squared(3.02) == squared(3.0) == 3.0**2
+    assert squared(float('inf')) == float('inf') # inf isn't indexed
+    squared.clear()
+    assert squared.info().size == 0
+    assert squared(2.5) == 2.5**2
+
+
+def _test_exact():
+    @nearest_cache()
+    def added(x, y):
+        return x + y
+
+    assert added(1, 2) == 3
+    assert added(1, 2.1) == 3.1
+    assert added.info().miss == 2
+    assert added.key(1, y=2) == added.key(1, 2)
+
+
+def _test_interpolate():
+    @nearest_cache(radius=2, interpolate=True)
+    def added(x, y):
+        return x + y
+
+    assert added(0, 0) == 0
+    assert added(3, 0) == 3
+    # the inverse distance weighted average of the values within radius
+    assert added(1, 0) == (0/1. + 3/2.) / (1/1. + 1/2.) == 1
+    assert added(2, 0) == (0/2. + 3/1.) / (1/2. + 1/1.) == 2
+    assert added(5, 0) == 3
+    assert added.info().miss == 2
+
+
+def _test_vectors():
+    @nearest_cache(maxsize=2, radius=0.5)
+    def total(x):
+        return sum(x)
+
+    assert total([1, 2]) == total([1.1, 2]) == 3 # lists need not be hashable
+    assert total((5, 5)) == 10
+    assert total([9, 9]) == 18
+    assert total.info().size == 2 # the oldest entries are purged
+    assert total([1.1, 2]) == 3.1
+    try:
+        import numpy as np
+        total.clear()
+        assert total(np.array([1., 2.])) == 3
+        assert total(np.array([1.1, 2.])) == 3
+        assert total(np.array([1.1, 2., 0.])) == 3.1 # shapes must match
+    except ImportError:
+        pass
+
+
+def _test_dimensions():
+    @nearest_cache(radius=0.5)
+    def total(x):
+        return sum(x)
+
+    # the stored points are searched, not the 3**40 neighboring cells
+    point = [float(i) for i in range(40)]
+    assert total(point) == 780
+    point[0] = 0.1
+    assert total(point) == 780
+    point[1] = 1.5
+    assert total(point) == 780.6
+    assert total.info()[:2] == (1, 2)
+
+
+if __name__ == '__main__':
+    _test_radius()
+    _test_exact()
+    _test_interpolate()
+    _test_vectors()
+    _test_dimensions()
+
+
+# EOF
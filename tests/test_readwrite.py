@@ -138,5 +138,203 @@ check_basic(archive)
 check_numpy(archive)
 rmtree('memo')
 
+# check parallel writes in update
+archive = dir_archive(cached=False,workers=4)
+check_basic(archive)
+check_numpy(archive)
+archive.update(dict((str(i),i) for i in range(20)))
+assert len(archive) == 25
+assert all(archive[str(i)] == i for i in range(20))
+rmtree('memo')
+
+archive = dir_archive(cached=True,workers=4)
+archive.update(dict((str(i),i) for i in range(20)))
+archive.dump('1','2','3')
+assert len(archive.archive) == 3
+archive.dump()
+assert len(archive.archive) == 20
+rmtree('memo')
+
+# check atomic replacement, with writes flushed to disk
+import os
+from klepto.archives import file_archive
+archive = dir_archive(cached=False,fsync='full')
+archive['a'] = 1
+archive['a'] = 2
+assert archive['a'] == 2
+assert len(archive) == 1
+assert os.listdir(archive.archive.__state__['root']) == ['K_a']
+
+# check that orphaned temporary entries are removed
+orphan = os.path.join(archive.__state__['root'], 'I_'+'0'*32)
+os.mkdir(orphan)
+dir_archive(cached=False)
+assert os.path.exists(orphan) # may belong to a write in progress
+os.utime(orphan, (0, 0))
+dir_archive(cached=False)
+assert not os.path.exists(orphan)
+rmtree('memo')
+
+archive = file_archive('foo.pkl',cached=False,fsync='data')
+archive['a'] = 1
+archive['a'] = 2
+assert archive['a'] == 2
+assert [f for f in os.listdir('.') if f.startswith('I_')] == []
+os.remove('foo.pkl')
+
+# check locking, and that changes made elsewhere are detected
+for (archive, name, lock) in ((file_archive, 'foo.pkl', 'foo.pkl.lock'),
+                              (dir_archive, 'foo', os.path.join('foo','.lock'))):
+    cache = archive(name, cached=True, locked=True)
+    other = archive(name, cached=False, locked=True)
+    cache['a'] = 1
+    cache.dump()
+    assert not cache.stale()
+    other['b'] = 2
+    assert cache.stale()
+    cache.load()
+    assert not cache.stale()
+    assert cache['b'] == 2
+    other.clear()
+    assert cache.stale()
+    assert len(other) == 0
+    assert os.path.exists(lock)
+os.remove('foo.pkl')
+os.remove('foo.pkl.lock')
+rmtree('foo')
+
+
+# check the chunked zfile format, and that version 1 zfiles can be read
+import zlib
+from klepto import _pickle
+data = _pickle.asbytes('0123456789abcdef\n') * 1000
+f = open('foo.z', 'wb')
+_pickle.write_zfile(f, data, compress=3, chunksize=1000, threads=4)
+f.close()
+assert _pickle.read_zfile(open('foo.z', 'rb')) == data
+f = _pickle.ZFileReader(open('foo.z', 'rb'))
+assert f.readline() == data[:17]
+assert f.read(2000) == data[17:2017]
+assert f.read() == data[2017:]
+f.close()
+f = open('foo.z', 'wb')
+f.write(_pickle._ZFILE_PREFIX)
+f.write(_pickle.asbytes(hex(len(data)).ljust(_pickle._MAX_LEN)))
+f.write(zlib.compress(data))
+f.close()
+assert _pickle.read_zfile(open('foo.z', 'rb')) == data
+os.remove('foo.z')
+x = dict((str(i), list(range(i))) for i in range(500))
+_pickle.dump(x, 'foo.z', compress=3)
+assert _pickle.load('foo.z') == x
+os.remove('foo.z')
+
+# check each of the available codecs
+for codec in _pickle.codecs():
+    _pickle.dump(x, 'foo.z', compress=3, codec=codec)
+    assert _pickle.load('foo.z') == x
+    os.remove('foo.z')
+archive = dir_archive('foo', cached=False, compression=3, codec='bz2')
+archive['a'] = x
+assert archive.copy()['a'] == x
+rmtree('foo')
+
+# check that big compressed arrays are read lazily, with memmode='r'
+try:
+    import numpy as np
+    y = np.arange(300000.).reshape(-1,3)
+    archive = dir_archive('foo', cached=False, compression=3, memmode='r', memsize=1)
+    archive['a'] = y
+    z = archive['a']
+    assert isinstance(z, _pickle.ZArray)
+    assert z.shape == y.shape and z.dtype == y.dtype
+    assert (z[5] == y[5]).all() and (z[-1] == y[-1]).all()
+    assert (z[10:90000:7, 1] == y[10:90000:7, 1]).all()
+    assert (z[::-3] == y[::-3]).all()
+    assert len(z._blocks) == len(z._offsets) > 1
+    assert (np.asarray(z) == y).all()
+    z.close()
+    # the file is closed, if the array can't be read lazily
+    opened = []
+    def _open(*args):
+        opened.append(open(*args))
+        return opened[-1]
+    _pickle.open = _open
+    try:
+        _pickle.ZArray(z.filename, y.dtype, ())
+        assert False
+    except ValueError: # the blocks are not whole rows
+        assert len(opened) == 1 and opened[0].closed
+    finally:
+        del _pickle.open
+    rmtree('foo')
+except ImportError:
+    pass
+
+# check that objects the C pickler can't handle are pickled with dill,
+# and that pickles written by the pure-python pickler can still be read
+f = lambda x: x+1
+_pickle.dump({'f': f, 'x': x}, 'foo.pkl')
+y = _pickle.load('foo.pkl')
+assert y['f'](1) == 2 and y['x'] == x
+os.remove('foo.pkl')
+try:
+    import numpy as np
+    y = {'a': np.arange(10), 'b': [1, 2, 3]}
+    y['c'] = y['a']
+    for compress in (0, 3):
+        files = _pickle._dump(_pickle.NumpyPickler, y, 'foo.pkl', compress=compress, cache_size=0)
+        z = _pickle.load('foo.pkl')
+        assert (z['a'] == y['a']).all() and (z['c'] == y['a']).all() and z['b'] == y['b']
+        for f in files: os.remove(f)
+        files = _pickle.dump(y, 'foo.pkl', compress=compress, cache_size=0)
+        z = _pickle.load('foo.pkl')
+        assert (z['a'] == y['a']).all() and (z['c'] == y['a']).all() and z['b'] == y['b']
+        if _pickle.FastNumpyPickler is not None: # the C pickler keeps identity
+            assert z['c'] is z['a']
+        for f in files: os.remove(f)
+except ImportError:
+    pass
+
+# check that array subclasses are restored
+try:
+    import numpy as np
+    y = np.matrix(np.arange(10000.).reshape(100,100))
+    for compress in (0, 3):
+        for mode in (None, 'r', 'c'):
+            files = _pickle.dump(y, 'foo.pkl', compress=compress, cache_size=0)
+            z = _pickle.load('foo.pkl', mmap_mode=mode)
+            assert type(z) is np.matrix and (z == y).all()
+            for f in files: os.remove(f)
+except ImportError:
+    pass
+
+# check that arrays are stored (aligned) in a single container file
+try:
+    import numpy as np
+    y = [np.arange(i) for i in range(100)] + [np.ones((100,100), order='F')]
+    files = _pickle.dump(y, 'foo.pkl')
+    assert files == ['foo.pkl', 'foo.pkl_arrays.bin']
+    for mode in (None, 'r', 'c'):
+        z = _pickle.load('foo.pkl', mmap_mode=mode)
+        assert all((i == j).all() and i.dtype == j.dtype for (i,j) in zip(y,z))
+        assert z[-1].flags.f_contiguous
+    assert z[-1].ctypes.data % 4096 == 0 and z[1].ctypes.data % 64 == 0
+    for f in files: os.remove(f)
+except ImportError:
+    pass
+
+# check that large buffers are written out-of-band, with pickle protocol 5
+if _pickle.PickleBuffer is not None:
+    x = bytearray(range(256)) * 1024
+    y = {'a': bytes(x), 'b': x, 'c': _pickle.asbytes('small')}
+    y['d'] = y['a']
+    files = _pickle.dump(y, 'foo.pkl')
+    assert files == ['foo.pkl', 'foo.pkl_01.buf', 'foo.pkl_02.buf']
+    for mode in (None, 'r', 'c'):
+        z = _pickle.load('foo.pkl', mmap_mode=mode)
+        assert z == y and type(z['b']) is bytearray and z['a'] is z['d']
+    for f in files: os.remove(f)
+
 
 # EOF
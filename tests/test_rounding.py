@@ -52,6 +52,30 @@ assert result == [2.5, 5.5, 'x', 'y']
 result = add([2.54, 5.47],['x',[8.99, 'y']])
 assert result == [2.5, 5.5, 'x', [8.9900000000000002, 'y']]
 
+# arrays and Decimals are rounded as a whole, by all rounding decorators
+from decimal import Decimal
+for rounded in (deep_round, simple_round, shallow_round):
+  @rounded(tol=1)
+  def identity(*args, **kwds):
+    return args, kwds
+  assert identity(Decimal('2.54'), x=Decimal('5.47')) == ((Decimal('2.5'),), {'x': Decimal('5.5')})
+
+try:
+  import numpy as np
+  x = np.array([[2.54, 5.47], [8.99, 1.01]])
+  for rounded in (deep_round, simple_round, shallow_round):
+    @rounded(tol=1)
+    def identity(*args, **kwds):
+      return args, kwds
+    (a, i), kwds = identity(x, np.arange(4), y=x)
+    assert type(a) is np.ndarray and (a == np.array([[2.5, 5.5], [9.0, 1.0]])).all()
+    assert (i == np.arange(4)).all() and (kwds['y'] == a).all()
+  from klepto.rounding import deep_round_factory
+  a, kwds = deep_round_factory(1)([x, 'x'], y={'z': x})
+  assert (a[0][0] == np.round(x, 1)).all() and (kwds['y']['z'] == np.round(x, 1)).all()
+except ImportError:
+  pass
+
 
 # rounding integrated with key generation
 from klepto import keygen, NULL
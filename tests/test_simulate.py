@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+
+import io
+from random import Random
+from klepto import lru_cache, gdsf_cache
+from klepto.safe import lru_cache as safe_lru_cache
+from klepto.simulate import trace, load, simulate
+
+def _record(cache, rate=1, **kwds):
+    rng = Random(0)
+    recorded = trace(rate)
+    @cache(**kwds)
+    def f(x):
+        return x
+    f.record(recorded)
+    for i in range(2000):
+        f(rng.randrange(50) if rng.random() < .8 else rng.randrange(10**5))
+    f.record() # stop recording
+    f(-1)
+    return f, recorded
+
+
+def _test_record():
+    f, recorded = _record(lru_cache, maxsize=20)
+    info = f.info()
+    assert len(recorded) == info.hit + info.miss - 1 == 2000
+    events = [event for (_, event, _, _) in recorded]
+    assert events.count(0) == info.hit and events.count(1) == info.miss - 1
+    assert all(size > 0 for (_, _, _, size) in recorded)
+
+    # the trace can be written and read
+    data = io.BytesIO()
+    recorded.dump(data)
+    data.seek(0)
+    copy = load(data)
+    assert list(copy) == list(recorded) and copy.rate == recorded.rate
+
+    # a sampled trace only records the calls for a fraction of the keys
+    f, sampled = _record(safe_lru_cache, rate=.25, maxsize=20)
+    assert 200 < len(sampled) < 1000
+    keys = set(key for (key, _, _, _) in sampled)
+    assert len(keys) < len(set(key for (key, _, _, _) in recorded))
+
+
+def _test_simulate():
+    f, recorded = _record(lru_cache, maxsize=20)
+    policies = [('lru_cache', lru_cache), ('gdsf_cache', gdsf_cache)]
+    rows = simulate(recorded, [10, 20, 40], policies, verbose=False)
+    assert [row[:2] for row in rows] == [(i, j) for i in ('lru_cache', \
+            'gdsf_cache') for j in (10, 20, 40)]
+    # replaying the full trace reproduces the recorded hit ratio
+    assert rows[1][2] == f.info().hit / 2000.
+    ratios = [row[2] for row in rows[:3]]
+    assert ratios == sorted(ratios)
+    assert all(row[3] >= 0 for row in rows)
+
+
+if __name__ == '__main__':
+    _test_record()
+    _test_simulate()
+
+
+# EOF
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Author: Mike McKerns (mmckerns @caltech and @uqfoundation)
+# Copyright (c) 2013-2015 California Institute of Technology.
+# License: 3-clause BSD.  The full license text is available at:
+#  - http://trac.mystic.cacr.caltech.edu/project/pathos/browser/klepto/LICENSE
+
+from klepto import vectorized_cache
+from klepto.archives import dict_archive
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _test_rows():
+    calls = []
+    @vectorized_cache()
+    def squared(x, p=2):
+        calls.append(len(x))
+        return x**p
+
+    x = np.arange(5)
+    assert (squared(x) == x**2).all()
+    x = np.arange(3, 8)
+    assert (squared(x) == x**2).all()
+    assert calls == [5, 3] # only the new rows are computed
+    info = squared.info()
+    assert (info.hit, info.miss, info.size) == (2, 8, 8)
+
+    # duplicate rows are computed once, and other arguments are in the key
+    x = np.array([9, 9, 2, 9])
+    assert (squared(x, p=3) == x**3).all()
+    assert calls[-1] == 2
+    assert squared.key(x)[0] == squared.key(x)[1]
+    assert squared.key(x)[0] != squared.key(x, p=3)[0]
+    assert (squared.lookup(x, p=3) == x**3).all()
+
+    # rows of a 2-D array, scalars, and empty arrays
+    x = np.arange(6).reshape(3, 2)
+    assert (squared(x) == x**2).all()
+    assert squared(np.float64(3.0)) == 9.0
+    assert len(squared(np.array([], dtype=int))) == 0
+
+    # the dtype is part of the key
+    assert squared.key(np.arange(2))[0] != squared.key(np.arange(2.))[0]
+    squared.clear()
+    assert squared.info().size == 0
+
+
+def _test_purge():
+    @vectorized_cache(maxsize=3, tol=1)
+    def scaled(x):
+        return x*10
+
+    x = np.array([1.01, 1.04, 2.0, 3.0, 4.0])
+    assert (scaled(x) == [10.1, 10.1, 20., 30., 40.]).all()
+    assert scaled.info().size == 3 # the oldest rows are purged
+    assert sorted(scaled.__cache__().values()) == [20., 30., 40.]
+
+
+def _test_archive():
+    calls = []
+    @vectorized_cache()
+    def doubled(x):
+        calls.append(len(x))
+        return 2*x
+    doubled.archive(dict_archive(cached=False))
+
+    x = np.arange(4)
+    assert (doubled(x) == 2*x).all()
+    doubled.dump()
+    doubled.clear()
+    assert (doubled(x) == 2*x).all()
+    assert calls == [4] # loaded from the archive, in a single batch
+    assert doubled.info()[:3] == (0, 0, 4) # (hit, miss, load)
+
+
+if __name__ == '__main__':
+    if np is None:
+        print("to test vectorized caches, install numpy")
+    else:
+        _test_rows()
+        _test_purge()
+        _test_archive()
+
+
+# EOF